@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Compare the per-arm Python loops the bandits used to choose an arm with
+against the array kernels in maybee_backend.bandits.kernels, at 10, 1k and 100k arms.
+No database is involved, the arm stats are generated in memory:
+
+    poetry run python benchmarks/bench_bandit_kernels.py
+"""
+import math
+import os
+import random
+import time
+
+import numpy as np
+
+from maybee_backend.bandits.kernels import greedy_index, softmax_index, ucb1_index, uniform_index
+
+n_choices = int(os.getenv("BENCH_N_CHOICES", 200))
+arm_counts = [10, 1_000, 100_000]
+tau = 0.1
+
+
+def loop_epsilon_greedy(n_observations, avg_rewards):
+    arms = list(range(len(avg_rewards)))
+    if random.uniform(0, 1) >= 0.05:
+        return sorted(arms, key=lambda i: avg_rewards[i], reverse=True)[0]
+    return sorted(arms, key=lambda i: random.uniform(0, 1), reverse=True)[0]
+
+
+def loop_softmax(n_observations, avg_rewards):
+    exp_values = [math.exp(avg_reward / tau) for avg_reward in avg_rewards]
+    z = sum(exp_values)
+    probs = [exp_value / z for exp_value in exp_values]
+    return np.random.choice(range(len(probs)), p=probs)
+
+
+def loop_ucb1(n_observations, avg_rewards):
+    total_observations = sum(n_observations)
+    ucb_values = [
+        avg_reward + math.sqrt((2 * math.log(total_observations)) / float(n))
+        for avg_reward, n in zip(avg_rewards, n_observations)
+    ]
+    return ucb_values.index(max(ucb_values))
+
+
+def kernel_epsilon_greedy(n_observations, avg_rewards):
+    if random.uniform(0, 1) >= 0.05:
+        return greedy_index(avg_rewards)
+    return uniform_index(len(avg_rewards))
+
+
+def kernel_softmax(n_observations, avg_rewards):
+    return softmax_index(avg_rewards, tau=tau)
+
+
+def kernel_ucb1(n_observations, avg_rewards):
+    return ucb1_index(n_observations, avg_rewards)
+
+
+def time_choices(choose_arm, n_observations, avg_rewards) -> float:
+    start = time.perf_counter()
+    for _ in range(n_choices):
+        choose_arm(n_observations, avg_rewards)
+    return (time.perf_counter() - start) / n_choices
+
+
+def main():
+    rng = np.random.default_rng(1)
+    bandits = [
+        ("epsilon greedy", loop_epsilon_greedy, kernel_epsilon_greedy),
+        ("softmax", loop_softmax, kernel_softmax),
+        ("ucb1", loop_ucb1, kernel_ucb1),
+    ]
+    for n_arms in arm_counts:
+        n_observations = rng.integers(1, 1000, size=n_arms)
+        avg_rewards = rng.random(n_arms)
+        for name, loop, kernel in bandits:
+            loop_seconds = time_choices(loop, n_observations, avg_rewards)
+            kernel_seconds = time_choices(kernel, n_observations, avg_rewards)
+            print(
+                f"{n_arms:>7} arms, {name:<15} loop={loop_seconds * 1e6:>10.1f}us "
+                f"kernel={kernel_seconds * 1e6:>8.1f}us ({loop_seconds / kernel_seconds:.1f}x)"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Helpers to benchmark the app in process, with an admin user and an environment to work in.
+Import this module before anything from maybee_backend, so the configuration is in place.
+"""
+import os
+import tempfile
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Tuple
+
+os.environ.setdefault("DB_URI", f"sqlite:///{tempfile.mkdtemp()}/bench.db")
+os.environ.setdefault("SECRET_KEY", "bench_secret_key")
+os.environ.setdefault("ADMIN_USERNAME", "bench_admin")
+os.environ.setdefault("ADMIN_PASSWORD", "bench_admin")
+os.environ.setdefault("LOGGING_LEVEL", "WARNING")
+
+import httpx  # noqa: E402
+
+from maybee_backend.main import app  # noqa: E402
+
+db_name = os.environ["DB_URI"].split("@")[-1]
+
+
+@asynccontextmanager
+async def app_client() -> AsyncIterator[Tuple[httpx.AsyncClient, dict]]:
+    """
+    Start the app, and yield a client for it with the headers of a logged in admin user.
+    """
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://bench", timeout=None
+        ) as client:
+            response = await client.post(
+                "/users/token",
+                data={
+                    "username": os.environ["ADMIN_USERNAME"],
+                    "password": os.environ["ADMIN_PASSWORD"],
+                },
+            )
+            response.raise_for_status()
+            headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+            yield client, headers
+
+
+async def create_environment(
+    client: httpx.AsyncClient, headers: dict, n_arms: int, bandit_type: str = "softmax"
+) -> Tuple[int, list]:
+    """
+    Create an environment with n_arms arms, return its id and the ids of its arms.
+    """
+    response = await client.post(
+        "/environments", params={"bandit_type": bandit_type}, headers=headers
+    )
+    response.raise_for_status()
+    environment_id = response.json()["environment_id"]
+    arm_ids = []
+    for i in range(n_arms):
+        response = await client.post(
+            f"/environments/{environment_id}/arms",
+            params={"arm_description": f"bench arm {i}"},
+            headers=headers,
+        )
+        response.raise_for_status()
+        arm_ids.append(response.json()["arm_id"])
+    return environment_id, arm_ids
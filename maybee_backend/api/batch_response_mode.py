@@ -0,0 +1,9 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+from enum import Enum
+
+
+class BatchResponseMode(str, Enum):
+    FULL = "full"
+    ID_RANGES = "id_ranges"
+    COUNT = "count"
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Columnar export of the actions and observations of an environment.
+
+The rows are read from a server-side cursor, export_chunk_size at a time, in the order of (event_datetime, id),
+and every chunk is written out as it's read: as csv rows, as a record batch of an Arrow IPC stream,
+or as a row group of a Parquet file. Arrow and Parquet require pyarrow.
+"""
+import csv
+import datetime
+import io
+from typing import Dict, Iterator, List, Sequence, Tuple
+import numpy as np
+from sqlmodel import Session, select
+
+from maybee_backend.api.export_format import ExportFormat
+from maybee_backend.models.core_models import Action, Observation
+
+export_chunk_size = 10_000
+
+# the exported columns of a table, with their kind: int, float or datetime
+# the bandit_state of actions is left out, it's the bulk of an action and not columnar
+action_columns: List[Tuple[str, str]] = [
+    ("action_id", "int"),
+    ("environment_id", "int"),
+    ("arm_id", "int"),
+    ("event_datetime", "datetime"),
+    ("propensity", "float"),
+]
+observation_columns: List[Tuple[str, str]] = [
+    ("observation_id", "int"),
+    ("environment_id", "int"),
+    ("arm_id", "int"),
+    ("action_id", "int"),
+    ("event_datetime", "datetime"),
+    ("reward", "float"),
+]
+
+media_types = {
+    ExportFormat.CSV: "text/csv",
+    ExportFormat.ARROW: "application/vnd.apache.arrow.stream",
+    ExportFormat.PARQUET: "application/vnd.apache.parquet",
+}
+
+
+def import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError as e:
+        raise ImportError("Exporting to arrow or parquet requires pyarrow, install it or export to csv") from e
+    return pyarrow
+
+
+def get_export_sql(model, columns: Sequence[Tuple[str, str]], environment_id: int):
+    id_column = getattr(model, columns[0][0])
+    return (
+        select(*(getattr(model, name) for name, _ in columns))
+        .where(model.environment_id == environment_id)
+        .order_by(model.event_datetime, id_column)
+    )
+
+
+def get_action_export_sql(environment_id: int):
+    return get_export_sql(Action, action_columns, environment_id)
+
+
+def get_observation_export_sql(environment_id: int):
+    return get_export_sql(Observation, observation_columns, environment_id)
+
+
+def stream_chunks(session: Session, sql, chunk_size: int = export_chunk_size) -> Iterator[List[Tuple]]:
+    """
+    Yield the rows of a select, chunk_size at a time, from a server-side cursor.
+    The session is closed once the rows are exhausted, or when the consumer goes away.
+    """
+    with session:
+        result = session.exec(sql.execution_options(yield_per=chunk_size))
+        for rows in result.partitions():
+            yield rows
+
+
+class ChunkSink(io.RawIOBase):
+    """
+    File for pyarrow's writers to write to, that's emptied every time what's written so far is taken.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._chunks: List[bytes] = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def take(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def get_arrow_schema(pyarrow, columns: Sequence[Tuple[str, str]]):
+    types = {"int": pyarrow.int64(), "float": pyarrow.float64(), "datetime": pyarrow.timestamp("us")}
+    return pyarrow.schema([(name, types[kind]) for name, kind in columns])
+
+
+def write_csv(chunks: Iterator[List[Tuple]], columns: Sequence[Tuple[str, str]]) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([name for name, _ in columns])
+    for rows in chunks:
+        writer.writerows(
+            ["" if value is None else value.isoformat() if isinstance(value, datetime.datetime) else value
+             for value in row]
+            for row in rows
+        )
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue().encode()
+
+
+def write_arrow(chunks: Iterator[List[Tuple]], columns: Sequence[Tuple[str, str]], file_format: ExportFormat) -> Iterator[bytes]:
+    """
+    Write the chunks as the record batches of an Arrow IPC stream, or as the row groups of a Parquet file.
+    """
+    pyarrow = import_pyarrow()
+    schema = get_arrow_schema(pyarrow, columns)
+    sink = ChunkSink()
+    if file_format == ExportFormat.PARQUET:
+        writer = pyarrow.parquet.ParquetWriter(sink, schema)
+    else:
+        writer = pyarrow.ipc.new_stream(sink, schema)
+    with writer:
+        for rows in chunks:
+            values = list(zip(*rows))
+            writer.write_batch(pyarrow.record_batch(
+                [pyarrow.array(column, type=field.type) for column, field in zip(values, schema)], schema=schema
+            ))
+            yield sink.take()
+    yield sink.take()
+
+
+def write_export(chunks: Iterator[List[Tuple]], columns: Sequence[Tuple[str, str]], file_format: ExportFormat) -> Iterator[bytes]:
+    if file_format == ExportFormat.CSV:
+        return write_csv(chunks, columns)
+    return write_arrow(chunks, columns, file_format)
+
+
+def read_csv_columns(text: str, columns: Sequence[Tuple[str, str]]) -> Dict[str, np.ndarray]:
+    """
+    Parse an exported csv into a numpy array per column.
+    Int columns with missing values become float columns with nan, as pyarrow's to_numpy does.
+    """
+    kinds = dict(columns)
+    reader = csv.reader(io.StringIO(text))
+    names = next(reader)
+    values = list(zip(*reader)) or [()] * len(names)
+    arrays = {}
+    for name, column in zip(names, values):
+        kind = kinds[name]
+        if kind == "datetime":
+            arrays[name] = np.array([value or "NaT" for value in column], dtype="datetime64[us]")
+        elif kind == "int" and "" not in column:
+            arrays[name] = np.array(column, dtype=np.int64)
+        else:
+            arrays[name] = np.array([value or "nan" for value in column], dtype=np.float64)
+    return arrays
@@ -0,0 +1,9 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+from enum import Enum
+
+
+class ExportFormat(str, Enum):
+    CSV = "csv"
+    ARROW = "arrow"
+    PARQUET = "parquet"
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Keyset pagination of events on (event_datetime, id).
+
+A page continues after the last row of the previous page, that row's key is handed out as an opaque cursor.
+Unlike offsets, every page is a range scan on the (environment_id, event_datetime, id) index,
+however deep into the history it starts, and rows that are added meanwhile don't shift the pages.
+"""
+import base64
+import datetime
+import json
+from typing import Iterator, List, Optional, Tuple
+from sqlalchemy import tuple_
+from sqlmodel import Session
+
+from maybee_backend.api.sorting_mode import SortingMode
+
+default_page_size = 1_000
+max_page_size = 10_000
+# rows fetched from the server-side cursor at a time when streaming
+stream_chunk_size = 1_000
+next_cursor_header = "X-Next-Cursor"
+
+
+def encode_cursor(event_datetime: datetime.datetime, id: int) -> str:
+    key = json.dumps([event_datetime.isoformat(), id])
+    return base64.urlsafe_b64encode(key.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime.datetime, int]:
+    """
+    Raises ValueError for a cursor that wasn't made by encode_cursor.
+    """
+    try:
+        event_datetime, id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.datetime.fromisoformat(event_datetime), int(id)
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Invalid cursor {cursor!r}") from e
+
+
+def get_keyset_sql(sql, datetime_column, id_column, sorting_mode: SortingMode, cursor: Optional[str] = None):
+    """
+    Order a select of events by (event_datetime, id), and continue it after the cursor.
+    """
+    key = tuple_(datetime_column, id_column)
+    if sorting_mode == SortingMode.LATEST:
+        sql = sql.order_by(datetime_column.desc(), id_column.desc())
+        if cursor is not None:
+            sql = sql.where(key < tuple_(*decode_cursor(cursor)))
+        return sql
+    sql = sql.order_by(datetime_column.asc(), id_column.asc())
+    if cursor is not None:
+        sql = sql.where(key > tuple_(*decode_cursor(cursor)))
+    return sql
+
+
+def get_page(session: Session, sql, id_column_name: str, limit: int) -> Tuple[List, Optional[str]]:
+    """
+    The first limit rows of a keyset select, and the cursor of the next page, or None on the last page.
+    """
+    rows = session.exec(sql.limit(limit + 1)).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(rows[-1].event_datetime, getattr(rows[-1], id_column_name))
+
+
+def stream_ndjson(session: Session, sql) -> Iterator[str]:
+    """
+    Yield the rows of a select as newline delimited json, a chunk of rows at a time,
+    from a server-side cursor, so memory use doesn't grow with the number of rows.
+    The session is closed once the rows are exhausted, or when the client goes away.
+    """
+    with session:
+        result = session.exec(sql.execution_options(yield_per=stream_chunk_size))
+        for rows in result.partitions():
+            yield "".join(row.model_dump_json() + "\n" for row in rows)
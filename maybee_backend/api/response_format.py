@@ -0,0 +1,8 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+from enum import Enum
+
+
+class ResponseFormat(str, Enum):
+    JSON = "json"
+    NDJSON = "ndjson"
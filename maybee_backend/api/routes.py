@@ -1,10 +1,16 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
-from fastapi import APIRouter, Body, Depends, HTTPException, status
-from fastapi.security import OAuth2PasswordRequestForm, OAuth2PasswordBearer
-from fastapi.responses import JSONResponse
+import hashlib
+import hmac
+import secrets
+import time
+from fastapi import APIRouter, Body, Depends, HTTPException, Query, Request, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.security import APIKeyHeader, OAuth2PasswordRequestForm, OAuth2PasswordBearer
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from sqlmodel import Session, select, and_
-from typing import Optional, List
+from sqlmodel.ext.asyncio.session import AsyncSession
+from typing import Optional, List, Tuple
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from datetime import datetime, timedelta
@@ -14,17 +20,77 @@ from maybee_backend.models.core_models import (
     Environment,
     EnvironmentBanditConfig,
     Action,
+    ActionBatchResponse,
+    ActionReport,
     Arm,
     Observation,
     ObservationCreate,
+    ObservationBatchResponse,
     AvgRewardsPerArm,
-    update_average_rewards_per_arm
+    AvgRewardsPerArmResponse,
+    PolicyCandidate,
+    PolicyEvaluation,
+    PolicySnapshot,
+    update_average_rewards_per_arm,
+    update_windowed_rewards_per_arm,
+    bandit_types_with_reward_windows,
 )
-from maybee_backend.database import get_session
+from maybee_backend.database import get_session, get_async_session
 from maybee_backend.bandits.get_bandit import environment_bandit_config_to_bandit_mapping
 from maybee_backend.bandits.epsilon_greedy import EpsilonGreedyBandit
 from maybee_backend.api.sorting_mode import SortingMode
+from maybee_backend.api.batch_response_mode import BatchResponseMode
+from maybee_backend.api.response_format import ResponseFormat
+from maybee_backend.api.export_format import ExportFormat
+from maybee_backend.api.export import (
+    action_columns,
+    observation_columns,
+    media_types,
+    get_action_export_sql,
+    get_observation_export_sql,
+    import_pyarrow,
+    stream_chunks,
+    write_export,
+)
+from maybee_backend.api.pagination import (
+    default_page_size,
+    max_page_size,
+    next_cursor_header,
+    get_keyset_sql,
+    get_page,
+    stream_ndjson,
+)
+from maybee_backend.models.bulk_insert import bulk_insert_async, get_id_ranges
+from maybee_backend.models.get_average_rewards_per_arm import get_arm_stats
+from maybee_backend.models.policy_snapshot import get_policy_snapshot, get_policy_version
+from maybee_backend.evaluation.offline_evaluation import evaluate_policies
+from maybee_backend.ingestion import observation_buffer, write_observations
+from maybee_backend.metrics import (
+    choose_arm_duration,
+    content_type as metrics_content_type,
+    registry as metrics_registry,
+)
+from maybee_backend.models.arm_stats import (
+    ArmStats,
+    arm_stats_cache,
+    update_cached_arm_stats,
+    update_cached_reward_windows,
+    invalidate_cached_arm_stats,
+)
+from maybee_backend.models.user_cache import (
+    CurrentUser,
+    authenticated_user_cache,
+    environment_access_cache,
+    cache_environment_ids,
+    cache_user,
+    get_cached_environment_ids,
+    get_cached_user,
+)
 from maybee_backend.models.user_models import (
+    ApiKey,
+    ApiKeyCreationResponse,
+    ApiKeyResponse,
+    ApiKeyScope,
     User,
     Token,
     TokenData,
@@ -41,7 +107,15 @@ security_algorithm = "HS256"
 access_token_expiration_time_mins = 30
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 token_url = "/users/token"
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl=f"{token_url}")
+# either credential may be sent, so missing ones are handled by get_current_user
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl=f"{token_url}", auto_error=False)
+api_key_scheme = APIKeyHeader(name="X-API-Key", auto_error=False)
+api_key_marker = "mb"
+# the methods that api keys with the read scope can be used for
+read_only_methods = {"GET", "HEAD", "OPTIONS"}
+
+# upper bound on the number of decisions in one batch of actions
+max_actions_per_batch = 10_000
 
 router = APIRouter()
 
@@ -62,15 +136,29 @@ def raise_no_access_to_environment_exception(environment_id: int) -> None:
     )
 
 
-def get_environment_if_exists(session: Session, environment_id: int) -> None:
+def raise_environment_does_not_exist_exception(environment_id: int) -> None:
+    raise HTTPException(
+        status_code=status.HTTP_404_NOT_FOUND,
+        detail=f"Environment with id ({environment_id}) does not exist.",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+
+def get_environment_if_exists(session: Session, environment_id: int) -> Environment:
     sql = select(Environment).where(Environment.environment_id == environment_id)
     environment = session.exec(sql).first()
     if not environment:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"Environment with id ({environment_id}) does not exist.",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
+        raise_environment_does_not_exist_exception(environment_id=environment_id)
+    return environment
+
+
+async def get_environment_if_exists_async(
+    session: AsyncSession, environment_id: int
+) -> Environment:
+    sql = select(Environment).where(Environment.environment_id == environment_id)
+    environment = (await session.exec(sql)).first()
+    if not environment:
+        raise_environment_does_not_exist_exception(environment_id=environment_id)
     return environment
 
 
@@ -82,17 +170,41 @@ def verify_password(plain_password: str, password_hash: str) -> bool:
     return pwd_context.verify(plain_password, password_hash)
 
 
-def get_user(session: Session, username: str) -> Optional[User]:
-    return session.exec(select(User).where(User.username == username)).first()
+async def get_user(session: AsyncSession, username: str) -> Optional[User]:
+    return (await session.exec(select(User).where(User.username == username))).first()
 
 
-def authenticate_user(session: Session, username: str, password: str) -> Optional[User]:
-    user = get_user(session, username)
-    if not user or not verify_password(password, user.password_hash):
+async def authenticate_user(session: AsyncSession, username: str, password: str) -> Optional[User]:
+    user = await get_user(session, username)
+    # bcrypt is slow by design, it's run in a thread so it doesn't block the event loop
+    if not user or not await run_in_threadpool(verify_password, password, user.password_hash):
         return None
     return user
 
 
+def create_api_key() -> Tuple[str, str]:
+    """
+    Return a new api key and its prefix. The key is mb_<prefix>_<secret>.
+    """
+    prefix = secrets.token_hex(8)
+    return f"{api_key_marker}_{prefix}_{secrets.token_urlsafe(32)}", prefix
+
+
+def get_api_key_prefix(api_key: str) -> Optional[str]:
+    marker, _, rest = api_key.partition("_")
+    prefix, _, secret = rest.partition("_")
+    if marker != api_key_marker or not prefix or not secret:
+        return None
+    return prefix
+
+
+def get_api_key_digest(api_key: str, config: Config) -> str:
+    """
+    The keys are random, so a single keyed hash is enough to store them, unlike passwords.
+    """
+    return hmac.new(config.secret_key.encode(), api_key.encode(), hashlib.sha256).hexdigest()
+
+
 def create_access_token(
     data: dict,
     expires_delta: Optional[timedelta] = None,
@@ -107,31 +219,102 @@ def create_access_token(
     return encoded_jwt
 
 
-def raise_error_if_user_doesnt_have_link_to_environment(
-    user_id, environment_id, session: Session
-):
-    sql = select(UserEnvironmentLink).where(
-        and_(
-            UserEnvironmentLink.user_id == user_id,
-            UserEnvironmentLink.environment_id == environment_id,
+def get_environment_access_sql(user_id: int, environment_id: int):
+    """
+    The ids of all environments the user has a link to, with the requested environment joined onto its link,
+    so the access check, the fetch and the ids to cache share one query.
+    """
+    return (
+        select(UserEnvironmentLink.environment_id, Environment)
+        .outerjoin(
+            Environment,
+            and_(
+                Environment.environment_id == UserEnvironmentLink.environment_id,
+                Environment.environment_id == environment_id,
+            ),
         )
+        .where(UserEnvironmentLink.user_id == user_id)
     )
-    user_environment_link = session.exec(sql).first()
-    # raise an exception when user doesn't have access
-    if not user_environment_link:
+
+
+def get_environment_from_access_rows(user_id: int, environment_id: int, rows) -> Environment:
+    cache_environment_ids(user_id, [linked_environment_id for linked_environment_id, _ in rows])
+    for linked_environment_id, environment in rows:
+        if linked_environment_id == environment_id:
+            if environment is None:
+                raise_environment_does_not_exist_exception(environment_id=environment_id)
+            return environment
+    raise_no_access_to_environment_exception(environment_id=environment_id)
+
+
+def get_environment_if_accessible(
+    session: Session, environment_id: int, current_user: CurrentUser
+) -> Environment:
+    """
+    Return the environment if the user is an admin or has a link to it.
+    A non-admin's environment ids are cached, so after the first request
+    they are either refused without a query or only the environment is fetched.
+    """
+    if current_user.is_admin:
+        return get_environment_if_exists(session=session, environment_id=environment_id)
+    environment_ids = get_cached_environment_ids(current_user.user_id)
+    if environment_ids is None:
+        sql = get_environment_access_sql(user_id=current_user.user_id, environment_id=environment_id)
+        rows = session.exec(sql).all()
+        return get_environment_from_access_rows(current_user.user_id, environment_id, rows)
+    if environment_id not in environment_ids:
         raise_no_access_to_environment_exception(environment_id=environment_id)
+    return get_environment_if_exists(session=session, environment_id=environment_id)
 
 
-async def get_current_user(
-    session: Session = Depends(get_session),
-    token: str = Depends(oauth2_scheme),
-    config: Config = Depends(get_config),
-) -> User:
-    credentials_exception = HTTPException(
+async def get_environment_if_accessible_async(
+    session: AsyncSession, environment_id: int, current_user: CurrentUser
+) -> Environment:
+    if current_user.is_admin:
+        return await get_environment_if_exists_async(session=session, environment_id=environment_id)
+    environment_ids = get_cached_environment_ids(current_user.user_id)
+    if environment_ids is None:
+        sql = get_environment_access_sql(user_id=current_user.user_id, environment_id=environment_id)
+        rows = (await session.exec(sql)).all()
+        return get_environment_from_access_rows(current_user.user_id, environment_id, rows)
+    if environment_id not in environment_ids:
+        raise_no_access_to_environment_exception(environment_id=environment_id)
+    return await get_environment_if_exists_async(session=session, environment_id=environment_id)
+
+
+def get_credentials_exception() -> HTTPException:
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+
+async def get_api_key_user(session: AsyncSession, api_key: str, config: Config) -> CurrentUser:
+    prefix = get_api_key_prefix(api_key)
+    if prefix is None:
+        raise get_credentials_exception()
+    sql = select(ApiKey, User).join(User, User.user_id == ApiKey.user_id).where(ApiKey.prefix == prefix)
+    row = (await session.exec(sql)).first()
+    if row is None:
+        raise get_credentials_exception()
+    stored_api_key, user = row
+    if not hmac.compare_digest(stored_api_key.digest, get_api_key_digest(api_key, config)):
+        raise get_credentials_exception()
+    if stored_api_key.expires_at is not None and stored_api_key.expires_at <= datetime.now():
+        raise get_credentials_exception()
+
+    current_user = CurrentUser.from_user(user, can_write=stored_api_key.scope == ApiKeyScope.WRITE)
+    claims = {
+        "api_key_id": stored_api_key.api_key_id,
+        "exp": stored_api_key.expires_at.timestamp() if stored_api_key.expires_at else None,
+    }
+    cache_user(api_key, claims, current_user)
+    return current_user
+
+
+async def get_token_user(session: AsyncSession, token: str, config: Config) -> CurrentUser:
+    credentials_exception = get_credentials_exception()
     try:
         payload = jwt.decode(token, config.secret_key, algorithms=[security_algorithm])
         username: str = payload.get("sub")
@@ -141,10 +324,46 @@ async def get_current_user(
     except JWTError:
         raise credentials_exception
 
-    user = get_user(session, username=token_data.username)
+    sql = select(User).where(User.username == token_data.username)
+    user = (await session.exec(sql)).first()
     if user is None:
         raise credentials_exception
-    return user
+    current_user = CurrentUser.from_user(user)
+    cache_user(token, payload, current_user)
+    return current_user
+
+
+async def get_current_user(
+    request: Request,
+    session: AsyncSession = Depends(get_async_session),
+    token: Optional[str] = Depends(oauth2_scheme),
+    api_key: Optional[str] = Depends(api_key_scheme),
+    config: Config = Depends(get_config),
+) -> CurrentUser:
+    """
+    The user of the api key in the X-API-Key header, or else of the bearer token.
+    Verified keys and tokens are cached per worker until they expire,
+    or for user_cache_ttl_seconds, so most requests don't verify them or look up the user.
+    """
+    credential = api_key or token
+    if credential is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Not authenticated",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    current_user = get_cached_user(credential)
+    if current_user is None:
+        if api_key is not None:
+            current_user = await get_api_key_user(session, api_key, config)
+        else:
+            current_user = await get_token_user(session, token, config)
+    if not current_user.can_write and request.method not in read_only_methods:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="This api key can only be used to read",
+        )
+    return current_user
 
 
 @router.get("/health", tags=[])
@@ -155,18 +374,52 @@ async def get_health():
     return JSONResponse(content={"status": "ok"})
 
 
+@router.get("/caches", tags=[])
+async def get_cache_stats(current_user: CurrentUser = Depends(get_current_user)):
+    """
+    Return the size and hit rate of the caches of the worker that serves the request, to size them.
+    """
+    if not current_user.is_admin:
+        raise_user_is_not_an_admin_exception()
+    return {
+        "arm_stats": arm_stats_cache.stats(),
+        "authenticated_users": authenticated_user_cache.stats(),
+        "environment_access": environment_access_cache.stats(),
+    }
+
+
+@router.get("/metrics", tags=[])
+async def get_metrics(config: Config = Depends(get_config)):
+    """
+    Return the request, database, bandit and cache metrics of the worker that serves the request,
+    in the Prometheus text format.
+    """
+    if not config.metrics_enabled:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Metrics are disabled")
+    return Response(content=metrics_registry.render(), media_type=metrics_content_type)
+
+
+@router.get("/ingestion", tags=[])
+async def get_ingestion_stats(current_user: CurrentUser = Depends(get_current_user)):
+    """
+    Return the queue depth and flush latency of the observation buffer of the worker that serves the request.
+    """
+    if not current_user.is_admin:
+        raise_user_is_not_an_admin_exception()
+    return observation_buffer.stats()
+
+
 @router.post(
     "/users/register",
     response_model=UserCreationResponse,
     tags=[],
 )
-def register_user(
+async def register_user(
     username: str = Body(examples=["example_username"]),
     password: str = Body(examples=["example_password"]),
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_async_session),
 ):
-    sql = select(User).where(User.username == username)
-    existing_user = session.exec(sql).first()
+    existing_user = await get_user(session, username)
 
     if existing_user:
         raise HTTPException(
@@ -174,14 +427,14 @@ def register_user(
             detail="A user with this username already exists.",
         )
 
-    password_hash = get_password_hash(password)
+    password_hash = await run_in_threadpool(get_password_hash, password)
     user = User(
         username=username,
         password_hash=password_hash,
     )
     session.add(user)
-    session.commit()
-    session.refresh(user)
+    await session.commit()
+    await session.refresh(user)
     user_creation_response = UserCreationResponse(
         user_id=user.user_id, username=user.username
     )
@@ -189,12 +442,12 @@ def register_user(
 
 
 @router.post(token_url, response_model=Token, tags=[])
-def login_for_access_token(
+async def login_for_access_token(
     config: Config = Depends(get_config),
     form_data: OAuth2PasswordRequestForm = Depends(),
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_async_session),
 ):
-    user = authenticate_user(session, form_data.username, form_data.password)
+    user = await authenticate_user(session, form_data.username, form_data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -205,14 +458,83 @@ def login_for_access_token(
     return {"access_token": access_token, "token_type": "bearer"}
 
 
+@router.post("/users/api_keys", response_model=ApiKeyCreationResponse, tags=[])
+def create_user_api_key(
+    scope: ApiKeyScope = Body(ApiKeyScope.WRITE),
+    description: Optional[str] = Body(None),
+    expires_in_days: Optional[int] = Body(None, ge=1),
+    user_id: Optional[int] = Body(None),
+    current_user: CurrentUser = Depends(get_current_user),
+    session: Session = Depends(get_session),
+    config: Config = Depends(get_config),
+):
+    """
+    Create an api key for the current user, or for another user when the current user is an admin.
+    The key is only returned here, store it right away.
+    """
+    if user_id is None:
+        user_id = current_user.user_id
+    if user_id != current_user.user_id:
+        if not current_user.is_admin:
+            raise_user_is_not_an_admin_exception()
+        if session.get(User, user_id) is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"User with id ({user_id}) does not exist.")
+
+    api_key, prefix = create_api_key()
+    stored_api_key = ApiKey(
+        user_id=user_id,
+        prefix=prefix,
+        digest=get_api_key_digest(api_key, config),
+        scope=scope,
+        description=description,
+        expires_at=datetime.now() + timedelta(days=expires_in_days) if expires_in_days else None,
+    )
+    session.add(stored_api_key)
+    session.commit()
+    session.refresh(stored_api_key)
+    return ApiKeyCreationResponse(**stored_api_key.model_dump(), api_key=api_key)
+
+
+@router.get("/users/api_keys", response_model=List[ApiKeyResponse], tags=[])
+def get_user_api_keys(
+    current_user: CurrentUser = Depends(get_current_user),
+    session: Session = Depends(get_session),
+):
+    """
+    Return the api keys of the current user, or of all users for admins.
+    """
+    sql = select(ApiKey).order_by(ApiKey.api_key_id)
+    if not current_user.is_admin:
+        sql = sql.where(ApiKey.user_id == current_user.user_id)
+    return session.exec(sql).all()
+
+
+@router.delete("/users/api_keys/{api_key_id}", tags=[])
+def delete_user_api_key(
+    api_key_id: int,
+    current_user: CurrentUser = Depends(get_current_user),
+    session: Session = Depends(get_session),
+):
+    """
+    Revoke an api key, it stops working right away on the worker that serves the request,
+    and within user_cache_ttl_seconds on the others.
+    """
+    stored_api_key = session.get(ApiKey, api_key_id)
+    if stored_api_key is None or (stored_api_key.user_id != current_user.user_id and not current_user.is_admin):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Api key with id ({api_key_id}) does not exist.")
+    session.delete(stored_api_key)
+    session.commit()
+    return {"api_key_id": api_key_id, "deleted": True}
+
+
 @router.post("/environments", response_model=Environment, tags=[])
-async def create_environment(
+def create_environment(
     environment_description=None,
     is_simulation_environment: Optional[bool] = False,
     bandit_type: Optional[
         EnvironmentBanditConfig
     ] = EnvironmentBanditConfig.EPSILON_GREEDY,
-    current_user: User = Depends(get_current_user),
+    current_user: CurrentUser = Depends(get_current_user),
     session: Session = Depends(get_session),
 ):
     """
@@ -243,8 +565,8 @@ async def create_environment(
 
 
 @router.get("/environments", tags=[])
-async def get_environments(
-    current_user: User = Depends(get_current_user),
+def get_environments(
+    current_user: CurrentUser = Depends(get_current_user),
     session: Session = Depends(get_session),
 ):
     """
@@ -261,11 +583,11 @@ async def get_environments(
 
 
 @router.put("/environments/{environment_id}", tags=[])
-async def update_environment(
+def update_environment(
     environment_id: int,
     environment_description: Optional[str] = Body(None),
     bandit_type: Optional[EnvironmentBanditConfig] = Body(None),
-    current_user: User = Depends(get_current_user),
+    current_user: CurrentUser = Depends(get_current_user),
     session: Session = Depends(get_session),
 ):
     """
@@ -288,9 +610,9 @@ async def update_environment(
 
 
 @router.delete("/environments/{environment_id}", tags=[])
-async def delete_environment(
+def delete_environment(
     environment_id: int,
-    current_user: User = Depends(get_current_user),
+    current_user: CurrentUser = Depends(get_current_user),
     session: Session = Depends(get_session),
 ):
     """
@@ -301,6 +623,7 @@ async def delete_environment(
         environment = get_environment_if_exists(session=session, environment_id=environment_id)
         session.delete(environment)
         session.commit()
+        invalidate_cached_arm_stats(environment_id)
 
     if current_user.is_admin:
         return _delete_environment()
@@ -308,9 +631,9 @@ async def delete_environment(
 
 
 @router.get("/environments/{environment_id}/arms", tags=[])
-async def get_arms(
+def get_arms(
     environment_id: int,
-    current_user: User = Depends(get_current_user),
+    current_user: CurrentUser = Depends(get_current_user),
     session: Session = Depends(get_session),
 ):
     """
@@ -335,10 +658,10 @@ async def get_arms(
 
 
 @router.get("/environments/{environment_id}/arms/{arm_id}", tags=[])
-async def get_arm(
+def get_arm(
     environment_id: int,
     arm_id: int,
-    current_user: User = Depends(get_current_user),
+    current_user: CurrentUser = Depends(get_current_user),
     session: Session = Depends(get_session),
 ):
     """
@@ -363,11 +686,11 @@ async def get_arm(
 
 
 @router.post("/environments/{environment_id}/arms", tags=[])
-async def create_arm(
+def create_arm(
     environment_id: int,
     arm_description: Optional[str] = None,
     population_p_success: Optional[float] = None,
-    current_user: User = Depends(get_current_user),
+    current_user: CurrentUser = Depends(get_current_user),
     session: Session = Depends(get_session),
 ):
     """
@@ -378,7 +701,7 @@ async def create_arm(
         """
         Create the arm in the db
         """
-        _ = get_environment_if_exists(session=session, environment_id=environment_id)
+        _ = get_environment_if_accessible(session=session, environment_id=environment_id, current_user=current_user)
         arm = Arm(
             environment_id=environment_id,
             arm_description=arm_description,
@@ -386,31 +709,27 @@ async def create_arm(
         )
 
         session.add(arm)
-        session.commit()
-        session.refresh(arm)
+        session.flush()
 
         avg_rewards_per_arm = AvgRewardsPerArm(environment_id=environment_id,
                                                arm_id=arm.arm_id,
                                                n_observations=0,
-                                               avg_reward=None)
+                                               avg_reward=None,
+                                               sum_squared_reward=0.0)
         session.add(avg_rewards_per_arm)
         session.commit()
+        invalidate_cached_arm_stats(environment_id)
+        session.refresh(arm)
         return arm
 
-    if current_user.is_admin:
-        return _create_arm()
-    else:
-        raise_error_if_user_doesnt_have_link_to_environment(
-            user_id=current_user.user_id, environment_id=environment_id, session=session
-        )
-        return _create_arm()
+    return _create_arm()
 
 
 @router.delete("/environments/{environment_id}/arms/{arm_id}", tags=[])
-async def delete_arm(
+def delete_arm(
     environment_id: int,
     arm_id: int,
-    current_user: User = Depends(get_current_user),
+    current_user: CurrentUser = Depends(get_current_user),
     session: Session = Depends(get_session),
 ):
     """
@@ -421,58 +740,69 @@ async def delete_arm(
         """
         Delete the arm in the db
         """
-        _ = get_environment_if_exists(session=session, environment_id=environment_id)
-        sql = select(Arm).where(Arm.arm_id == arm_id)
+        _ = get_environment_if_accessible(session=session, environment_id=environment_id, current_user=current_user)
+        sql = select(Arm).where(Arm.environment_id == environment_id).where(Arm.arm_id == arm_id)
         arm = session.exec(sql).first()
         session.delete(arm)
         session.commit()
+        invalidate_cached_arm_stats(environment_id)
         return arm
 
-    if current_user.is_admin:
-        _delete_arm()
-
-    sql = select(Arm).where(Arm.arm_id == arm_id)
-    arm = session.exec(sql).first()
-    raise_error_if_user_doesnt_have_link_to_environment(
-        user_id=current_user.user_id, environment_id=arm.environment_id, session=session
-    )
     _delete_arm()
 
 
+def get_events_response(
+    session: Session,
+    response: Response,
+    sql,
+    datetime_column,
+    id_column,
+    sorting_mode: SortingMode,
+    limit: int,
+    cursor: Optional[str],
+    format: ResponseFormat,
+):
+    """
+    A page of the events selected by sql, or a stream of all of them when format is ndjson.
+    """
+    try:
+        sql = get_keyset_sql(sql, datetime_column, id_column, sorting_mode, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
+    if format == ResponseFormat.NDJSON:
+        # the request's session is closed before the response is streamed, the stream gets its own
+        stream_session = Session(session.get_bind())
+        return StreamingResponse(stream_ndjson(stream_session, sql), media_type="application/x-ndjson")
+    rows, next_cursor = get_page(session, sql, id_column.key, limit)
+    if next_cursor is not None:
+        response.headers[next_cursor_header] = next_cursor
+    return rows
+
+
 @router.get(
     "/environments/{environment_id}/observations",
     tags=[],
 )
-async def get_observations(
+def get_observations(
     environment_id: int,
-    sorting_mode: Optional[SortingMode] = None,
-    limit: Optional[int] = None,
-    current_user: User = Depends(get_current_user),
+    response: Response,
+    sorting_mode: SortingMode = SortingMode.EARLIEST,
+    limit: int = Query(default_page_size, ge=1, le=max_page_size),
+    cursor: Optional[str] = None,
+    format: ResponseFormat = ResponseFormat.JSON,
+    current_user: CurrentUser = Depends(get_current_user),
     session: Session = Depends(get_session),
 ):
     """
-    For a given environment, get the observations
+    For a given environment, get a page of observations, ordered by event_datetime.
+    The cursor of the next page is returned in the X-Next-Cursor header, it's absent on the last page.
+    With format=ndjson, all observations after the cursor are streamed as newline delimited json instead.
     """
-
-    def _get_observations():
-        _ = get_environment_if_exists(session=session, environment_id=environment_id)
-        sql = select(Observation).where(Observation.environment_id == environment_id)
-        if sorting_mode == SortingMode.EARLIEST:
-            sql = sql.order_by(Observation.event_datetime.asc())
-        elif sorting_mode == SortingMode.LATEST:
-            sql = sql.order_by(Observation.event_datetime.desc())
-        if limit:
-            sql = sql.limit(limit)
-        results = session.exec(sql).all()
-        return results
-
-    if current_user.is_admin:
-        _get_observations()
-
-    raise_error_if_user_doesnt_have_link_to_environment(
-        user_id=current_user.user_id, environment_id=environment_id, session=session
+    _ = get_environment_if_accessible(session=session, environment_id=environment_id, current_user=current_user)
+    sql = select(Observation).where(Observation.environment_id == environment_id)
+    return get_events_response(
+        session, response, sql, Observation.event_datetime, Observation.observation_id, sorting_mode, limit, cursor, format
     )
-    return _get_observations()
 
 
 @router.get(
@@ -481,51 +811,161 @@ async def get_observations(
 )
 async def get_average_rewards_per_arm(
     environment_id: int,
-    current_user: User = Depends(get_current_user),
-    session: Session = Depends(get_session),
+    current_user: CurrentUser = Depends(get_current_user),
+    session: AsyncSession = Depends(get_async_session),
 ):
     """
-    For a given environment, get the average rewards for each arm
+    For a given environment, get the average rewards for each arm.
+    For thompson sampling environments, the posterior parameters of each arm are included.
     """
-    
-    def _get_average_rewards_per_arm():
-        _ = get_environment_if_exists(session=session, environment_id=environment_id)
+
+    async def _get_average_rewards_per_arm():
+        environment = await get_environment_if_accessible_async(
+            session=session, environment_id=environment_id, current_user=current_user
+        )
         sql = select(AvgRewardsPerArm).where(AvgRewardsPerArm.environment_id == environment_id)
-        return session.exec(sql).all()
-    
-    if current_user.is_admin:
-        return _get_average_rewards_per_arm()
-    raise_error_if_user_doesnt_have_link_to_environment(
-        user_id=current_user.user_id, environment_id=environment_id, session=session
-    )
-    return _get_average_rewards_per_arm()
+        avg_rewards_per_arms = (await session.exec(sql)).all()
+
+        bandit_class = environment_bandit_config_to_bandit_mapping.get(environment.bandit_type)
+        if not hasattr(bandit_class, "get_posterior_parameters"):
+            return avg_rewards_per_arms
+        posteriors = bandit_class.get_posterior_parameters(ArmStats.from_rows(avg_rewards_per_arms))
+        return [
+            AvgRewardsPerArmResponse(**avg_rewards_per_arm.model_dump(), posterior=posterior)
+            for avg_rewards_per_arm, posterior in zip(avg_rewards_per_arms, posteriors)
+        ]
+
+    return await _get_average_rewards_per_arm()
 
 
 @router.get(
     "/environments/{environment_id}/actions",
     tags=[],
 )
-async def get_actions(
+def get_actions(
     environment_id: int,
-    current_user: User = Depends(get_current_user),
+    response: Response,
+    sorting_mode: SortingMode = SortingMode.EARLIEST,
+    limit: int = Query(default_page_size, ge=1, le=max_page_size),
+    cursor: Optional[str] = None,
+    format: ResponseFormat = ResponseFormat.JSON,
+    current_user: CurrentUser = Depends(get_current_user),
     session: Session = Depends(get_session),
 ):
     """
-    Get a list of actions in the given environment
+    Get a page of actions in the given environment, ordered by event_datetime.
+    The cursor of the next page is returned in the X-Next-Cursor header, it's absent on the last page.
+    With format=ndjson, all actions after the cursor are streamed as newline delimited json instead.
     """
+    _ = get_environment_if_accessible(session=session, environment_id=environment_id, current_user=current_user)
+    sql = select(Action).where(Action.environment_id == environment_id)
+    return get_events_response(
+        session, response, sql, Action.event_datetime, Action.action_id, sorting_mode, limit, cursor, format
+    )
 
-    def _get_actions():
-        _ = get_environment_if_exists(session=session, environment_id=environment_id)
-        sql = select(Action).where(Action.environment_id == environment_id)
-        results = session.exec(sql).all()
-        return results
 
-    if current_user.is_admin:
-        return _get_actions()
-    raise_error_if_user_doesnt_have_link_to_environment(
-        user_id=current_user.user_id, environment_id=environment_id, session=session
+def get_export_response(
+    session: Session, sql, columns, file_format: ExportFormat, filename: str
+) -> StreamingResponse:
+    """
+    Stream the rows selected by sql as a file of the given format.
+    """
+    if file_format != ExportFormat.CSV:
+        try:
+            import_pyarrow()
+        except ImportError as e:
+            raise HTTPException(status_code=status.HTTP_501_NOT_IMPLEMENTED, detail=str(e))
+    # the request's session is closed before the response is streamed, the stream gets its own
+    chunks = stream_chunks(Session(session.get_bind()), sql)
+    return StreamingResponse(
+        write_export(chunks, columns, file_format),
+        media_type=media_types[file_format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{file_format.value}"'},
+    )
+
+
+@router.get(
+    "/environments/{environment_id}/actions/export",
+    tags=[],
+)
+def export_actions(
+    environment_id: int,
+    format: ExportFormat = ExportFormat.CSV,
+    current_user: CurrentUser = Depends(get_current_user),
+    session: Session = Depends(get_session),
+):
+    """
+    Export all actions of the given environment, ordered by event_datetime, without their bandit_state,
+    as csv, as an Arrow IPC stream, or as a Parquet file.
+    """
+    _ = get_environment_if_accessible(session=session, environment_id=environment_id, current_user=current_user)
+    return get_export_response(
+        session, get_action_export_sql(environment_id), action_columns, format, f"environment_{environment_id}_actions"
+    )
+
+
+@router.get(
+    "/environments/{environment_id}/observations/export",
+    tags=[],
+)
+def export_observations(
+    environment_id: int,
+    format: ExportFormat = ExportFormat.CSV,
+    current_user: CurrentUser = Depends(get_current_user),
+    session: Session = Depends(get_session),
+):
+    """
+    Export all observations of the given environment, ordered by event_datetime,
+    as csv, as an Arrow IPC stream, or as a Parquet file.
+    """
+    _ = get_environment_if_accessible(session=session, environment_id=environment_id, current_user=current_user)
+    return get_export_response(
+        session,
+        get_observation_export_sql(environment_id),
+        observation_columns,
+        format,
+        f"environment_{environment_id}_observations",
     )
-    return _get_actions()
+
+
+@router.post(
+    "/environments/{environment_id}/evaluations",
+    response_model=List[PolicyEvaluation],
+    tags=[],
+)
+def evaluate_candidate_policies(
+    environment_id: int,
+    candidates: List[PolicyCandidate] = Body(min_length=1),
+    missing_reward: Optional[float] = None,
+    current_user: CurrentUser = Depends(get_current_user),
+    session: Session = Depends(get_session),
+):
+    """
+    Estimate how candidate bandits would have done on the logged actions and observations of an environment,
+    before switching its bandit_type.
+    Actions without observations are skipped, unless a missing_reward is given for them.
+    """
+
+    def _evaluate_candidate_policies():
+        _ = get_environment_if_accessible(session=session, environment_id=environment_id, current_user=current_user)
+        try:
+            return evaluate_policies(
+                session=session,
+                environment_id=environment_id,
+                candidates=candidates,
+                missing_reward=missing_reward,
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
+
+    return _evaluate_candidate_policies()
+
+
+def get_bandit_type_label(environment: Environment) -> str:
+    """
+    The bandit type that chooses the arms of an environment, as a metrics label.
+    """
+    return EnvironmentBanditConfig(environment.bandit_type or EnvironmentBanditConfig.EPSILON_GREEDY).value
 
 
 @router.post(
@@ -534,38 +974,243 @@ async def get_actions(
 )
 async def act(
     environment_id: int,
-    current_user: User = Depends(get_current_user),
-    session: Session = Depends(get_session),
+    current_user: CurrentUser = Depends(get_current_user),
+    session: AsyncSession = Depends(get_async_session),
 ):
     """
     Choose an arm for a given environment.
     Produces an action.
     """
 
-    def _act():
-        environment = get_environment_if_exists(session=session, environment_id=environment_id)
-        
-        bandit_class = environment_bandit_config_to_bandit_mapping.get(environment.bandit_type, 
-                                                                       EpsilonGreedyBandit)
+    async def _act():
+        environment = await get_environment_if_accessible_async(
+            session=session, environment_id=environment_id, current_user=current_user
+        )
 
-        bandit = bandit_class(environment_id=environment_id, session=session)
-        bandit_state, arm_id = bandit.choose_arm()
+        bandit_class = environment_bandit_config_to_bandit_mapping.get(environment.bandit_type,
+                                                                       EpsilonGreedyBandit)
+        bandit_type = get_bandit_type_label(environment)
+
+        # the bandits are written against a sync session, run_sync hands them one
+        # that is backed by the async connection, so the event loop isn't blocked
+        # the arm is chosen from the same snapshot of the arm stats as its propensity
+        def _choose_arm(sync_session: Session):
+            bandit = bandit_class(environment_id=environment_id, session=sync_session)
+            arm_stats = get_arm_stats(session=sync_session, environment_id=environment_id)
+            start = time.perf_counter()
+            bandit_states, arm_ids, propensities = bandit.choose_arms_with_propensities(arm_stats, n=1)
+            choose_arm_duration.observe(time.perf_counter() - start, bandit_type)
+            return bandit_states[0], arm_ids[0], propensities[0]
+
+        bandit_state, arm_id, propensity = await session.run_sync(_choose_arm)
         action = Action(
             environment_id=environment_id,
             arm_id=arm_id,
             bandit_state=bandit_state.value,
+            propensity=propensity,
         )
         session.add(action)
-        session.commit()
-        session.refresh(action)
+        await session.commit()
         return action
 
-    if current_user.is_admin:
-        return _act()
-    raise_error_if_user_doesnt_have_link_to_environment(
-        user_id=current_user.user_id, environment_id=environment_id, session=session
+    return await _act()
+
+
+@router.post(
+    "/environments/{environment_id}/actions/batch",
+    response_model=ActionBatchResponse,
+    tags=[],
+)
+async def act_in_batch(
+    environment_id: int,
+    n: int = Query(ge=1, le=max_actions_per_batch),
+    current_user: CurrentUser = Depends(get_current_user),
+    session: AsyncSession = Depends(get_async_session),
+):
+    """
+    Choose n arms for a given environment at once.
+    The choices are drawn from one snapshot of the arm stats,
+    and the actions are inserted in bulk.
+    """
+
+    async def _act_in_batch():
+        environment = await get_environment_if_accessible_async(
+            session=session, environment_id=environment_id, current_user=current_user
+        )
+
+        bandit_class = environment_bandit_config_to_bandit_mapping.get(environment.bandit_type,
+                                                                       EpsilonGreedyBandit)
+        bandit_type = get_bandit_type_label(environment)
+
+        def _choose_arms(sync_session: Session):
+            bandit = bandit_class(environment_id=environment_id, session=sync_session)
+            arm_stats = get_arm_stats(session=sync_session, environment_id=environment_id)
+            start = time.perf_counter()
+            result = bandit.choose_arms_with_propensities(arm_stats, n=n)
+            choose_arm_duration.observe(time.perf_counter() - start, bandit_type)
+            return result
+
+        bandit_states, arm_ids, propensities = await session.run_sync(_choose_arms)
+        event_datetime = datetime.now()
+        bandit_states = [bandit_state.value for bandit_state in bandit_states]
+        rows = [
+            dict(environment_id=environment_id,
+                 arm_id=arm_id,
+                 event_datetime=event_datetime,
+                 bandit_state=bandit_state,
+                 propensity=propensity)
+            for arm_id, bandit_state, propensity in zip(arm_ids, bandit_states, propensities)
+        ]
+        action_ids = await bulk_insert_async(session=session, model=Action, rows=rows)
+        await session.commit()
+        return ActionBatchResponse(n_actions=n,
+                                   action_ids=action_ids,
+                                   arm_ids=arm_ids,
+                                   bandit_states=bandit_states)
+
+    return await _act_in_batch()
+
+
+@router.get(
+    "/environments/{environment_id}/policy",
+    response_model=PolicySnapshot,
+    tags=[],
+)
+async def get_environment_policy_snapshot(
+    environment_id: int,
+    request: Request,
+    response: Response,
+    current_user: CurrentUser = Depends(get_current_user),
+    session: AsyncSession = Depends(get_async_session),
+):
+    """
+    Get a snapshot of the policy of a given environment, for clients to choose arms from themselves.
+    The version of the snapshot is returned as its ETag, send it in If-None-Match
+    to get 304 Not Modified instead while the arm stats haven't changed.
+    """
+
+    async def _get_environment_policy_snapshot():
+        environment = await get_environment_if_accessible_async(
+            session=session, environment_id=environment_id, current_user=current_user
+        )
+        bandit_type = environment.bandit_type or EnvironmentBanditConfig.EPSILON_GREEDY
+        arm_stats = await session.run_sync(get_arm_stats, environment_id=environment_id)
+        version = get_policy_version(bandit_type, arm_stats)
+        etag = f'"{version}"'
+        if etag in request.headers.get("If-None-Match", "").replace("W/", "").split(", "):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+        response.headers["ETag"] = etag
+        return get_policy_snapshot(environment_id, bandit_type, arm_stats)
+
+    return await _get_environment_policy_snapshot()
+
+
+@router.post(
+    "/environments/{environment_id}/actions/reports",
+    response_model=ActionBatchResponse,
+    tags=[],
+)
+async def report_actions(
+    environment_id: int,
+    actions: List[ActionReport] = Body(min_length=1, max_length=max_actions_per_batch),
+    current_user: CurrentUser = Depends(get_current_user),
+    session: AsyncSession = Depends(get_async_session),
+):
+    """
+    Record actions that a client chose from a policy snapshot, with the version of that snapshot.
+    The rewards that are reported with them are recorded as their observations,
+    in the same transaction, and update the avg rewards table.
+    """
+
+    async def _report_actions():
+        environment = await get_environment_if_accessible_async(
+            session=session, environment_id=environment_id, current_user=current_user
+        )
+        arm_ids = {action.arm_id for action in actions}
+        sql = select(Arm.arm_id).where(Arm.environment_id == environment_id).where(Arm.arm_id.in_(arm_ids))
+        unknown_arm_ids = arm_ids - set((await session.exec(sql)).all())
+        if unknown_arm_ids:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail=f"Arms {sorted(unknown_arm_ids)} don't belong to environment {environment_id}",
+            )
+
+        rows = [
+            dict(environment_id=environment_id,
+                 arm_id=action.arm_id,
+                 event_datetime=action.event_datetime,
+                 bandit_state=action.bandit_state,
+                 propensity=action.propensity,
+                 policy_version=action.policy_version)
+            for action in actions
+        ]
+        action_ids = await bulk_insert_async(session=session, model=Action, rows=rows)
+        observations = [
+            ObservationCreate(environment_id=environment_id,
+                              arm_id=action.arm_id,
+                              action_id=action_id,
+                              event_datetime=action.event_datetime,
+                              reward=action.reward)
+            for action_id, action in zip(action_ids, actions)
+            if action.reward is not None
+        ]
+        if observations:
+            await write_observations(session=session,
+                                     environment=environment,
+                                     observations=observations,
+                                     return_ids=False)
+        else:
+            await session.commit()
+        return ActionBatchResponse(n_actions=len(actions),
+                                   action_ids=action_ids,
+                                   arm_ids=[action.arm_id for action in actions],
+                                   bandit_states=[action.bandit_state for action in actions])
+
+    return await _report_actions()
+
+
+async def raise_if_arms_not_in_environment(
+    session: AsyncSession, environment_id: int, arm_ids: List[Optional[int]]
+) -> None:
+    """
+    Refuse observations of arms that aren't in the environment's arm stats, which are usually cached,
+    before they're written or queued: a queued observation that fails to be written is lost
+    after the client was told it's accepted. Observations without an arm are let through.
+    The cached stats are reloaded before refusing, as the arm may have been created through another worker.
+    """
+    arm_ids = {arm_id for arm_id in arm_ids if arm_id is not None}
+    arm_stats = await session.run_sync(get_arm_stats, environment_id=environment_id)
+    unknown_arm_ids = arm_ids - arm_stats.positions.keys()
+    if unknown_arm_ids:
+        invalidate_cached_arm_stats(environment_id)
+        arm_stats = await session.run_sync(get_arm_stats, environment_id=environment_id)
+        unknown_arm_ids = arm_ids - arm_stats.positions.keys()
+    if unknown_arm_ids:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"Arms {sorted(unknown_arm_ids)} don't belong to environment {environment_id}",
+        )
+
+
+def get_buffered_observations_response(observations: List[ObservationCreate]) -> JSONResponse:
+    """
+    Queue observations in the write-behind buffer, and acknowledge them before they're written.
+    """
+    if not observation_buffer.is_open:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Buffered ingestion is not enabled on this server, post without buffered=true",
+        )
+    if not observation_buffer.submit(observations):
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="The observation buffer is full, retry later or post without buffered=true",
+            headers={"Retry-After": str(max(1, round(observation_buffer.flush_interval_seconds)))},
+        )
+    return JSONResponse(
+        status_code=status.HTTP_202_ACCEPTED,
+        content=ObservationBatchResponse(n_observations=len(observations)).model_dump(),
     )
-    return _act()
 
 
 @router.post(
@@ -574,28 +1219,51 @@ async def act(
 )
 async def create_observation(
     environment_id: int,
-    action_id: str,
-    arm_id: str,
+    action_id: int,
+    arm_id: int,
     reward: float,
-    current_user: User = Depends(get_current_user),
-    session: Session = Depends(get_session),
+    buffered: bool = False,
+    current_user: CurrentUser = Depends(get_current_user),
+    session: AsyncSession = Depends(get_async_session),
 ):
     """
     Create an observation of the outcome of a given action and update the avg rewards table.
+    With buffered=true, the observation is queued and written in the background, and 202 is returned right away.
     """
 
-    def _create_observation():
-        _ = get_environment_if_exists(session=session, environment_id=environment_id)
+    async def _create_observation():
+        environment = await get_environment_if_accessible_async(
+            session=session, environment_id=environment_id, current_user=current_user
+        )
+        await raise_if_arms_not_in_environment(session, environment_id, [arm_id])
         observation = Observation(
             environment_id=environment_id, action_id=action_id, reward=reward, arm_id=arm_id
         )
-        update_average_rewards_per_arm(session=session, environment_id=environment_id, arm_id=arm_id, n_new_observations=1, avg_reward_of_new_observations=reward)
+        if buffered:
+            return get_buffered_observations_response([ObservationCreate.model_validate(observation)])
+        avg_rewards_per_arm = await session.run_sync(
+            update_average_rewards_per_arm,
+            environment_id=environment_id,
+            arm_id=arm_id,
+            n_new_observations=1,
+            avg_reward_of_new_observations=reward,
+            commit=False,
+        )
+        windowed_rewards_per_arms = []
+        if environment.bandit_type in bandit_types_with_reward_windows:
+            windowed_rewards_per_arms = await session.run_sync(
+                update_windowed_rewards_per_arm,
+                environment_id=environment_id,
+                observations=[observation],
+                commit=False,
+            )
         session.add(observation)
-        session.commit()
-        session.refresh(observation)
+        await session.commit()
+        update_cached_arm_stats(environment_id, [avg_rewards_per_arm])
+        update_cached_reward_windows(environment_id, windowed_rewards_per_arms)
         return observation
-    
-    return _create_observation()
+
+    return await _create_observation()
 
 
 
@@ -606,17 +1274,27 @@ async def create_observation(
 async def create_observations(
     environment_id: int,
     observations: List[ObservationCreate],
-    current_user: User = Depends(get_current_user),
-    session: Session = Depends(get_session),
+    response_mode: BatchResponseMode = BatchResponseMode.FULL,
+    buffered: bool = False,
+    current_user: CurrentUser = Depends(get_current_user),
+    session: AsyncSession = Depends(get_async_session),
 ):
     """
-    Create an observation of the outcome of a given action and update the avg rewards table.
+    Create observations of the outcomes of the given actions and update the avg rewards table,
+    with a single aggregate update per arm.
+
+    The observations are inserted in bulk. Large batches can be posted with
+    response_mode=id_ranges or response_mode=count to skip echoing every row;
+    with response_mode=count, postgres streams the rows in with COPY.
+    With buffered=true, the observations are queued and written in the background,
+    202 is returned right away, or 429 when the queue is full.
     """
 
-    def _create_observations():
-        _ = get_environment_if_exists(session=session, environment_id=environment_id)
+    async def _create_observations():
+        environment = await get_environment_if_accessible_async(
+            session=session, environment_id=environment_id, current_user=current_user
+        )
 
-        db_observations = []
         for entry in observations:
             # default the environment_id to the param from the url
             if not entry.environment_id:
@@ -630,16 +1308,21 @@ async def create_observations(
                     headers={"WWW-Authenticate": "Bearer"},
                 )
 
-            observation = Observation(environment_id=environment_id, 
-                                      arm_id=entry.arm_id, 
-                                      action_id=entry.action_id, 
-                                      event_datetime=entry.event_datetime, 
-                                      reward=entry.reward)
-            session.add(observation)
-            db_observations.append(observation)
-        session.commit()
-        for observation in db_observations:
-            session.refresh(observation)
-        return db_observations
-        
-    return _create_observations()
\ No newline at end of file
+        await raise_if_arms_not_in_environment(session, environment_id, [entry.arm_id for entry in observations])
+        if buffered:
+            return get_buffered_observations_response(observations)
+        observation_ids = await write_observations(session=session,
+                                                   environment=environment,
+                                                   observations=observations,
+                                                   return_ids=response_mode != BatchResponseMode.COUNT)
+
+        if response_mode == BatchResponseMode.FULL:
+            return [Observation(observation_id=observation_id, **entry.model_dump())
+                    for observation_id, entry in zip(observation_ids, observations)]
+        if response_mode == BatchResponseMode.ID_RANGES:
+            return ObservationBatchResponse(
+                n_observations=len(observations), observation_id_ranges=get_id_ranges(observation_ids)
+            )
+        return ObservationBatchResponse(n_observations=len(observations))
+
+    return await _create_observations()
\ No newline at end of file
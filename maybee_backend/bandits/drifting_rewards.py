@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import datetime
+from typing import Callable, List, Tuple
+import numpy as np
+from maybee_backend.bandits.kernels import softmax_indexes, softmax_probabilities, ucb1_indexes, ucb1_probabilities
+from maybee_backend.models.arm_stats import ArmStats
+from maybee_backend.models.core_models import Bandit, BanditState
+
+
+class DriftingRewardsBandit(Bandit):
+    """
+    Superclass for bandits that choose from recent rewards only, so they keep up with drifting reward rates.
+    Subclasses pick the recent stats (discounted or in a sliding window) and how to choose from them.
+    The clock tells the time that the stats are brought to.
+    """
+
+    name = "drifting rewards"
+
+    def __init__(self, clock: Callable[[], datetime.datetime] = datetime.datetime.now, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.clock = clock
+
+    def get_recent_stats(self, arm_stats: ArmStats) -> Tuple[np.ndarray, np.ndarray]:
+        raise NotImplementedError
+
+    def choose_from_recent_stats(
+        self, n_observations: np.ndarray, avg_rewards: np.ndarray, n: int
+    ) -> Tuple[List[BanditState], np.ndarray]:
+        raise NotImplementedError
+
+    def get_probabilities_from_recent_stats(self, n_observations: np.ndarray, avg_rewards: np.ndarray) -> np.ndarray:
+        raise NotImplementedError
+
+    def choose_arm_indexes(self, arm_stats: ArmStats, n: int) -> Tuple[List[BanditState], np.ndarray]:
+        n_observations, avg_rewards = self.get_recent_stats(arm_stats)
+        return self.choose_from_recent_stats(n_observations, avg_rewards, n=n)
+
+    def get_arm_probabilities(self, arm_stats: ArmStats) -> np.ndarray:
+        n_observations, avg_rewards = self.get_recent_stats(arm_stats)
+        return self.get_probabilities_from_recent_stats(n_observations, avg_rewards)
+
+
+class UCBChoice:
+    """
+    UCB1 on recent stats: arms without recent observations are explored first.
+    """
+
+    def choose_from_recent_stats(self, n_observations, avg_rewards, n):
+        arm_indexes, explore = ucb1_indexes(n_observations, avg_rewards, n=n)
+        return [BanditState.EXPLORE if e else BanditState.NOT_APPLICABLE for e in explore], arm_indexes
+
+    def get_probabilities_from_recent_stats(self, n_observations, avg_rewards):
+        return ucb1_probabilities(n_observations, avg_rewards)
+
+
+class SoftmaxChoice:
+    """
+    Softmax with temperature tau on recent average rewards.
+    """
+
+    tau = 0.1
+
+    def choose_from_recent_stats(self, n_observations, avg_rewards, n):
+        return [BanditState.NOT_APPLICABLE] * n, softmax_indexes(avg_rewards, tau=self.tau, n=n)
+
+    def get_probabilities_from_recent_stats(self, n_observations, avg_rewards):
+        return softmax_probabilities(avg_rewards, tau=self.tau)
+
+
+class DiscountedBandit(DriftingRewardsBandit):
+    """
+    Chooses from exponentially discounted counts and average rewards,
+    the weight of an observation halves every REWARD_HALF_LIFE_SECONDS.
+    """
+
+    def get_recent_stats(self, arm_stats: ArmStats) -> Tuple[np.ndarray, np.ndarray]:
+        return arm_stats.discounted(now=self.clock())
+
+
+class SlidingWindowBandit(DriftingRewardsBandit):
+    """
+    Chooses from the counts and average rewards of the last REWARD_WINDOW_SECONDS.
+    """
+
+    def get_recent_stats(self, arm_stats: ArmStats) -> Tuple[np.ndarray, np.ndarray]:
+        return arm_stats.windowed(now=self.clock())
+
+
+class DiscountedUCBBandit(UCBChoice, DiscountedBandit):
+    name = "discounted UCB"
+
+
+class DiscountedSoftmaxBandit(SoftmaxChoice, DiscountedBandit):
+    name = "discounted softmax"
+
+
+class SlidingWindowUCBBandit(UCBChoice, SlidingWindowBandit):
+    name = "sliding window UCB"
+
+
+class SlidingWindowSoftmaxBandit(SoftmaxChoice, SlidingWindowBandit):
+    name = "sliding window softmax"
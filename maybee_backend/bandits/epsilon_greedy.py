@@ -1,56 +1,40 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
-from maybee_backend.models.get_average_rewards_per_arm import (
-    get_average_rewards_per_arm,
-)
 from maybee_backend.models.core_models import Bandit, BanditState
-from typing import Tuple
-from maybee_backend.logging import log
+from maybee_backend.bandits.kernels import (
+    greedy_index,
+    uniform_index,
+    epsilon_greedy_indexes,
+    epsilon_greedy_probabilities,
+)
+from maybee_backend.models.arm_stats import ArmStats
+from typing import List, Tuple
+import numpy as np
 import random
 
 
 class EpsilonGreedyBandit(Bandit):
+    name = "epsilon greedy"
+
     def __init__(self, epsilon=0.05, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.epsilon = epsilon
 
-    def choose_arm(self) -> Tuple[BanditState, int]:
+    def choose_arm_index(self, arm_stats: ArmStats) -> Tuple[BanditState, int]:
         """
         Generate a random float p between 0 and 1.
         If p > epsilon,
-        exploit by serving the id of the arm with the highest avg reward.
-        Otherwise, explore by serving a random arm_id.
+        exploit by serving the arm with the highest avg reward.
+        Otherwise, explore by serving a random arm.
         """
         p = round(random.uniform(0, 1), 2)
         if p >= self.epsilon:
-            bandit_state = BanditState.EXPLOIT
+            return BanditState.EXPLOIT, greedy_index(arm_stats.avg_rewards)
+        return BanditState.EXPLORE, uniform_index(len(arm_stats))
 
-            avg_rewards_per_arm = get_average_rewards_per_arm(
-                session=self.session,
-                environment_id=self.environment_id,
-                replace_null_rewards_with_zeros=True
-            )
-            arm = sorted(
-                avg_rewards_per_arm,
-                key=lambda x: x.avg_reward,
-                reverse=True,
-            )[0]
-            arm_id = arm.arm_id
+    def choose_arm_indexes(self, arm_stats: ArmStats, n: int) -> Tuple[List[BanditState], np.ndarray]:
+        arm_indexes, explore = epsilon_greedy_indexes(arm_stats.avg_rewards, epsilon=self.epsilon, n=n)
+        return [BanditState.EXPLORE if e else BanditState.EXPLOIT for e in explore], arm_indexes
 
-        else:
-            bandit_state = BanditState.EXPLORE
-            avg_rewards_per_arm = get_average_rewards_per_arm(
-                session=self.session,
-                environment_id=self.environment_id, 
-                replace_null_rewards_with_zeros=True
-            )
-            arm = sorted(
-                avg_rewards_per_arm,
-                key=lambda x: random.uniform(0, 1),
-                reverse=True,
-            )[0]
-            arm_id = arm.arm_id
-        log.debug(
-            f"Chose arm with epsilon greedy bandit: {arm_id=}  {p=}, {self.epsilon=}, {bandit_state=}"
-        )
-        return bandit_state, arm_id
+    def get_arm_probabilities(self, arm_stats: ArmStats) -> np.ndarray:
+        return epsilon_greedy_probabilities(arm_stats.avg_rewards, epsilon=self.epsilon)
@@ -10,6 +10,16 @@ from maybee_backend.models.core_models import (
 from maybee_backend.bandits.epsilon_greedy import EpsilonGreedyBandit
 from maybee_backend.bandits.softmax import SoftmaxBandit
 from maybee_backend.bandits.ucb1 import UCB1Bandit
+from maybee_backend.bandits.thompson_sampling import (
+    ThompsonSamplingBandit,
+    GaussianThompsonSamplingBandit,
+)
+from maybee_backend.bandits.drifting_rewards import (
+    DiscountedUCBBandit,
+    DiscountedSoftmaxBandit,
+    SlidingWindowUCBBandit,
+    SlidingWindowSoftmaxBandit,
+)
 from maybee_backend.logging import log
 
 
@@ -17,6 +27,12 @@ environment_bandit_config_to_bandit_mapping = {
     EnvironmentBanditConfig.EPSILON_GREEDY: EpsilonGreedyBandit,
     EnvironmentBanditConfig.SOFTMAX: SoftmaxBandit,
     EnvironmentBanditConfig.UCB1: UCB1Bandit,
+    EnvironmentBanditConfig.THOMPSON_SAMPLING: ThompsonSamplingBandit,
+    EnvironmentBanditConfig.GAUSSIAN_THOMPSON_SAMPLING: GaussianThompsonSamplingBandit,
+    EnvironmentBanditConfig.DISCOUNTED_UCB: DiscountedUCBBandit,
+    EnvironmentBanditConfig.DISCOUNTED_SOFTMAX: DiscountedSoftmaxBandit,
+    EnvironmentBanditConfig.SLIDING_WINDOW_UCB: SlidingWindowUCBBandit,
+    EnvironmentBanditConfig.SLIDING_WINDOW_SOFTMAX: SlidingWindowSoftmaxBandit,
 }
 
 
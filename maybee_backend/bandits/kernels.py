@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Array based arm selection, shared by the bandits.
+The kernels take the counts and average rewards of all arms of an environment
+as arrays (see ArmStats) and return the index of the chosen arm.
+"""
+import random
+from typing import Callable, Tuple
+import numpy as np
+
+
+def raise_if_no_arms(avg_rewards: np.ndarray) -> None:
+    if len(avg_rewards) == 0:
+        raise IndexError("Cannot choose from an empty set of arms")
+
+
+def greedy_index(avg_rewards: np.ndarray) -> int:
+    """
+    Index of the arm with the highest average reward, the first one on ties.
+    """
+    raise_if_no_arms(avg_rewards)
+    return int(np.argmax(avg_rewards))
+
+
+def uniform_index(n_arms: int) -> int:
+    """
+    Index of an arm chosen uniformly at random.
+    """
+    if n_arms == 0:
+        raise IndexError("Cannot choose from an empty set of arms")
+    return random.randrange(n_arms)
+
+
+def softmax_probabilities(avg_rewards: np.ndarray, tau: float) -> np.ndarray:
+    """
+    Boltzmann distribution over the arms with temperature tau.
+    The largest scaled reward is subtracted before exponentiating (log-sum-exp),
+    so small values of tau don't overflow.
+    """
+    raise_if_no_arms(avg_rewards)
+    scaled_rewards = np.asarray(avg_rewards, dtype=np.float64) / tau
+    exp_values = np.exp(scaled_rewards - scaled_rewards.max())
+    return exp_values / exp_values.sum()
+
+
+def softmax_index(avg_rewards: np.ndarray, tau: float) -> int:
+    probabilities = softmax_probabilities(avg_rewards, tau)
+    return int(np.random.choice(len(probabilities), p=probabilities))
+
+
+def ucb1_values(n_observations: np.ndarray, avg_rewards: np.ndarray) -> np.ndarray:
+    """
+    Average reward plus the UCB1 exploration bonus sqrt(2 ln(N) / n) of every arm.
+    Every arm needs a count above 0. Counts may be fractional, as for the discounted bandits,
+    a total below 1 is treated as 1.
+    """
+    n_observations = np.asarray(n_observations, dtype=np.float64)
+    total_observations = max(n_observations.sum(), 1.0)
+    return avg_rewards + np.sqrt(2 * np.log(total_observations) / n_observations)
+
+
+def unobserved_index(n_observations: np.ndarray) -> int:
+    """
+    Index of the first arm without observations, or -1 if all arms have been observed.
+    """
+    unobserved = np.flatnonzero(n_observations == 0)
+    return int(unobserved[0]) if len(unobserved) else -1
+
+
+def ucb1_index(n_observations: np.ndarray, avg_rewards: np.ndarray) -> int:
+    raise_if_no_arms(avg_rewards)
+    return int(np.argmax(ucb1_values(n_observations, avg_rewards)))
+
+
+def one_hot_probabilities(n_arms: int, index: int) -> np.ndarray:
+    probabilities = np.zeros(n_arms, dtype=np.float64)
+    probabilities[index] = 1.0
+    return probabilities
+
+
+def epsilon_greedy_probabilities(avg_rewards: np.ndarray, epsilon: float) -> np.ndarray:
+    """
+    Probability of every arm to be chosen by epsilon-greedy:
+    epsilon spread uniformly over all arms, the rest on the greedy arm.
+    """
+    raise_if_no_arms(avg_rewards)
+    probabilities = np.full(len(avg_rewards), epsilon / len(avg_rewards))
+    probabilities[greedy_index(avg_rewards)] += 1 - epsilon
+    return probabilities
+
+
+def ucb1_probabilities(n_observations: np.ndarray, avg_rewards: np.ndarray) -> np.ndarray:
+    """
+    UCB1 is deterministic, all probability is on the arm it chooses next.
+    """
+    indexes, _ = ucb1_indexes(n_observations, avg_rewards, n=1)
+    return one_hot_probabilities(len(avg_rewards), int(indexes[0]))
+
+
+def epsilon_greedy_indexes(avg_rewards: np.ndarray, epsilon: float, n: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Draw n epsilon-greedy choices at once.
+    Returns the chosen indexes and a mask of the choices that explored.
+    """
+    raise_if_no_arms(avg_rewards)
+    explore = np.random.random_sample(n) < epsilon
+    indexes = np.full(n, greedy_index(avg_rewards))
+    indexes[explore] = np.random.randint(len(avg_rewards), size=int(explore.sum()))
+    return indexes, explore
+
+
+def softmax_indexes(avg_rewards: np.ndarray, tau: float, n: int) -> np.ndarray:
+    """
+    Draw n independent softmax choices at once.
+    """
+    probabilities = softmax_probabilities(avg_rewards, tau)
+    return np.random.choice(len(probabilities), size=n, p=probabilities)
+
+
+def ucb1_indexes(n_observations: np.ndarray, avg_rewards: np.ndarray, n: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Make n UCB1 choices from one snapshot of the arm stats.
+    Arms without observations are chosen first, once each. The remaining choices
+    go to the observed arm with the highest UCB1 value, or round robin over all arms
+    when none has been observed yet.
+    Returns the chosen indexes and a mask of the choices that explored an unobserved arm.
+    """
+    raise_if_no_arms(avg_rewards)
+    unobserved = np.flatnonzero(n_observations == 0)
+    observed = np.flatnonzero(n_observations > 0)
+    if len(observed) == 0:
+        return np.resize(unobserved, n), np.ones(n, dtype=bool)
+    unobserved = unobserved[:n]
+    best_index = observed[ucb1_index(n_observations[observed], avg_rewards[observed])]
+    indexes = np.concatenate([unobserved, np.full(n - len(unobserved), best_index)])
+    explore = np.arange(n) < len(unobserved)
+    return indexes, explore
+
+
+# posterior draws are made in chunks of at most this many values, to bound memory use
+max_posterior_draws_per_chunk = 1_000_000
+
+# priors of the thompson sampling bandits: a uniform Beta(1, 1) for bernoulli rewards,
+# and a weak normal-inverse-gamma prior centered on 0 for gaussian rewards
+beta_prior = (1.0, 1.0)
+normal_inverse_gamma_prior = (0.0, 1.0, 1.0, 1.0)
+
+
+def beta_posterior(n_observations: np.ndarray, avg_rewards: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Beta posterior (alpha, beta) of the success probability of every arm,
+    for rewards between 0 and 1.
+    """
+    prior_alpha, prior_beta = beta_prior
+    successes = n_observations * np.clip(avg_rewards, 0.0, 1.0)
+    return prior_alpha + successes, prior_beta + n_observations - successes
+
+
+def normal_inverse_gamma_posterior(
+    n_observations: np.ndarray, avg_rewards: np.ndarray, sum_squared_rewards: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Normal-inverse-gamma posterior (mu, kappa, alpha, beta) of the mean and variance
+    of the rewards of every arm, from the count, mean and sum of squares of its rewards.
+    """
+    prior_mu, prior_kappa, prior_alpha, prior_beta = normal_inverse_gamma_prior
+    n_observations = np.asarray(n_observations, dtype=np.float64)
+    sum_of_squared_deviations = np.maximum(sum_squared_rewards - n_observations * avg_rewards ** 2, 0.0)
+    kappa = prior_kappa + n_observations
+    mu = (prior_kappa * prior_mu + n_observations * avg_rewards) / kappa
+    alpha = prior_alpha + n_observations / 2
+    beta = (
+        prior_beta
+        + sum_of_squared_deviations / 2
+        + prior_kappa * n_observations * (avg_rewards - prior_mu) ** 2 / (2 * kappa)
+    )
+    return mu, kappa, alpha, beta
+
+
+def argmax_of_draws(draw: Callable[[int], np.ndarray], n_arms: int, n: int) -> np.ndarray:
+    """
+    Index of the highest value in each of n draws over all arms.
+    draw(size) returns a (size, n_arms) array.
+    """
+    chunk_size = max(1, max_posterior_draws_per_chunk // n_arms)
+    return np.concatenate([
+        np.argmax(draw(min(chunk_size, n - start)), axis=1)
+        for start in range(0, n, chunk_size)
+    ])
+
+
+def estimate_choice_probabilities(indexes: np.ndarray, n_arms: int) -> np.ndarray:
+    """
+    Estimate the probability of every arm to be chosen from a sample of choices.
+    Every arm gets one extra pseudo choice, so no arm that could be chosen gets a probability of 0.
+    """
+    return (np.bincount(indexes, minlength=n_arms) + 1) / (len(indexes) + n_arms)
+
+
+def beta_thompson_indexes(n_observations: np.ndarray, avg_rewards: np.ndarray, n: int) -> np.ndarray:
+    """
+    Make n Beta-Bernoulli thompson sampling choices, each from its own posterior draw.
+    """
+    raise_if_no_arms(avg_rewards)
+    alpha, beta = beta_posterior(n_observations, avg_rewards)
+    return argmax_of_draws(
+        lambda size: np.random.beta(alpha, beta, size=(size, len(alpha))), len(alpha), n
+    )
+
+
+def gaussian_thompson_indexes(
+    n_observations: np.ndarray, avg_rewards: np.ndarray, sum_squared_rewards: np.ndarray, n: int
+) -> np.ndarray:
+    """
+    Make n gaussian thompson sampling choices, each from its own posterior draw.
+    A variance is drawn from the inverse gamma posterior, then a mean given that variance.
+    """
+    raise_if_no_arms(avg_rewards)
+    mu, kappa, alpha, beta = normal_inverse_gamma_posterior(n_observations, avg_rewards, sum_squared_rewards)
+
+    def draw(size: int) -> np.ndarray:
+        variance = beta / np.random.gamma(alpha, size=(size, len(alpha)))
+        return np.random.normal(mu, np.sqrt(variance / kappa))
+
+    return argmax_of_draws(draw, len(mu), n)
@@ -1,46 +1,24 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 from maybee_backend.models.core_models import Bandit, BanditState
-from maybee_backend.models.get_average_rewards_per_arm import (
-    get_average_rewards_per_arm,
-)
-from typing import Tuple
-import math
+from maybee_backend.models.arm_stats import ArmStats
+from typing import List, Tuple
 import numpy as np
-from maybee_backend.logging import log
+from maybee_backend.bandits.kernels import softmax_index, softmax_indexes, softmax_probabilities
 
 
 class SoftmaxBandit(Bandit):
+    name = "softmax"
+
     def __init__(self, tau=0.1, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.tau = tau
 
-    def choose_arm(self) -> Tuple[BanditState, int]:
-        """
-        Choose an arm
-        """
-        avg_rewards_per_arm = get_average_rewards_per_arm(
-            session=self.session,
-            environment_id=self.environment_id,
-            replace_null_rewards_with_zeros=True,
-        )
-
-        if avg_rewards_per_arm == []:
-            arm_id = None
-            bandit_state = BanditState.NO_ARMS_AVAILABLE
-            log.warning(
-                f"Failed to choose arm with softmax bandit: {self.environment_id=} (no arms available)"
-            )
-            return bandit_state, arm_id
+    def choose_arm_index(self, arm_stats: ArmStats) -> Tuple[BanditState, int]:
+        return BanditState.NOT_APPLICABLE, softmax_index(arm_stats.avg_rewards, tau=self.tau)
 
-        exp_values = [
-            math.exp((arm.avg_reward) / self.tau) for arm in avg_rewards_per_arm
-        ]
-        z = sum(exp_values)
-        probs = [exp_val / z for exp_val in exp_values]
+    def choose_arm_indexes(self, arm_stats: ArmStats, n: int) -> Tuple[List[BanditState], np.ndarray]:
+        return [BanditState.NOT_APPLICABLE] * n, softmax_indexes(arm_stats.avg_rewards, tau=self.tau, n=n)
 
-        chosen_arm_index = np.random.choice(range(len(probs)), p=probs)
-        arm_id = avg_rewards_per_arm[chosen_arm_index].arm_id
-        bandit_state = BanditState.NOT_APPLICABLE
-        log.debug(f"Chose arm with softmax bandit: {arm_id=} from {probs=}")
-        return bandit_state, arm_id
+    def get_arm_probabilities(self, arm_stats: ArmStats) -> np.ndarray:
+        return softmax_probabilities(arm_stats.avg_rewards, tau=self.tau)
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+from typing import Dict, List, Tuple
+import numpy as np
+from maybee_backend.bandits.kernels import (
+    beta_posterior,
+    beta_thompson_indexes,
+    estimate_choice_probabilities,
+    gaussian_thompson_indexes,
+    normal_inverse_gamma_posterior,
+)
+from maybee_backend.models.arm_stats import ArmStats
+from maybee_backend.models.core_models import Bandit, BanditState
+
+# posterior draws to estimate the probability of every arm to be chosen from
+n_probability_draws = 1000
+
+
+class ThompsonSamplingBandit(Bandit):
+    """
+    Beta-Bernoulli thompson sampling, for rewards between 0 and 1.
+    Every choice draws a success probability for each arm from its Beta posterior,
+    and goes to the arm with the highest draw.
+    """
+
+    name = "Beta-Bernoulli thompson sampling"
+
+    def draw_arm_indexes(self, arm_stats: ArmStats, n: int) -> np.ndarray:
+        return beta_thompson_indexes(arm_stats.n_observations, arm_stats.avg_rewards, n=n)
+
+    @staticmethod
+    def get_posterior_parameters(arm_stats: ArmStats) -> List[Dict[str, float]]:
+        alpha, beta = beta_posterior(arm_stats.n_observations, arm_stats.avg_rewards)
+        return [{"alpha": float(a), "beta": float(b)} for a, b in zip(alpha, beta)]
+
+    def choose_arm_indexes(self, arm_stats: ArmStats, n: int) -> Tuple[List[BanditState], np.ndarray]:
+        return [BanditState.NOT_APPLICABLE] * n, self.draw_arm_indexes(arm_stats, n=n)
+
+    def get_arm_probabilities(self, arm_stats: ArmStats) -> np.ndarray:
+        """
+        The chance of an arm to have the highest draw has no closed form,
+        it's estimated from a sample of draws, once per version of the arm stats.
+        """
+        probabilities = arm_stats.derived.get(self.name)
+        if probabilities is None:
+            probabilities = arm_stats.derived[self.name] = estimate_choice_probabilities(
+                self.draw_arm_indexes(arm_stats, n=n_probability_draws), len(arm_stats)
+            )
+        return probabilities
+
+    def choose_arm_indexes_with_probabilities(
+        self, arm_stats: ArmStats, n: int
+    ) -> Tuple[List[BanditState], np.ndarray, np.ndarray]:
+        """
+        The estimate is kept with the arm stats, later choices from the same version only draw n times.
+        Without an estimate yet, the n choices are the first of the draws it's estimated from.
+        """
+        probabilities = arm_stats.derived.get(self.name)
+        if probabilities is not None:
+            return [BanditState.NOT_APPLICABLE] * n, self.draw_arm_indexes(arm_stats, n=n), probabilities
+        arm_indexes = self.draw_arm_indexes(arm_stats, n=max(n, n_probability_draws))
+        probabilities = arm_stats.derived[self.name] = estimate_choice_probabilities(arm_indexes, len(arm_stats))
+        return [BanditState.NOT_APPLICABLE] * n, arm_indexes[:n], probabilities
+
+
+class GaussianThompsonSamplingBandit(ThompsonSamplingBandit):
+    """
+    Thompson sampling for continuous rewards, with a normal-inverse-gamma posterior
+    over the unknown mean and variance of the rewards of each arm.
+    """
+
+    name = "gaussian thompson sampling"
+
+    def draw_arm_indexes(self, arm_stats: ArmStats, n: int) -> np.ndarray:
+        return gaussian_thompson_indexes(
+            arm_stats.n_observations, arm_stats.avg_rewards, arm_stats.sum_squared_rewards, n=n
+        )
+
+    @staticmethod
+    def get_posterior_parameters(arm_stats: ArmStats) -> List[Dict[str, float]]:
+        mu, kappa, alpha, beta = normal_inverse_gamma_posterior(
+            arm_stats.n_observations, arm_stats.avg_rewards, arm_stats.sum_squared_rewards
+        )
+        return [
+            {"mu": float(m), "kappa": float(k), "alpha": float(a), "beta": float(b)}
+            for m, k, a, b in zip(mu, kappa, alpha, beta)
+        ]
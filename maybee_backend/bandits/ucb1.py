@@ -1,53 +1,38 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
-from typing import Tuple
-import math
+from typing import List, Tuple
+import numpy as np
 from maybee_backend.logging import log
+from maybee_backend.bandits.kernels import ucb1_index, ucb1_indexes, ucb1_probabilities, unobserved_index
 
+from maybee_backend.models.arm_stats import ArmStats
 from maybee_backend.models.core_models import Bandit, BanditState
-from maybee_backend.models.get_average_rewards_per_arm import (
-    get_average_rewards_per_arm,
-)
 
 
 class UCB1Bandit(Bandit):
+    """
+    UCB1 is deterministic, so apart from exploring unobserved arms
+    every choice from one snapshot of the arm stats goes to the same arm.
+    """
+
+    name = "UCB1"
+
     def __init__(self, epsilon=0.05, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.epsilon = epsilon
 
-    def choose_arm(self) -> Tuple[BanditState, int]:
-        avg_rewards_per_arm = get_average_rewards_per_arm(
-            session=self.session,
-            environment_id=self.environment_id, 
-            replace_null_rewards_with_zeros=True
-        )
-
-        if avg_rewards_per_arm == []:
-            arm_id = None
-            bandit_state = BanditState.NO_ARMS_AVAILABLE
-            log.warning(
-                f"Failed to choose arm with UCB1 bandit: {self.environment_id=} (no arms available)"
-            )
-            return bandit_state, arm_id
-
+    def choose_arm_index(self, arm_stats: ArmStats) -> Tuple[BanditState, int]:
         # UCB1 requires at least 1 observation per arm, so if there are any arms with 0 observations, we explore
-        for arm in avg_rewards_per_arm:
-            if arm.n_observations == 0:
-                bandit_state = BanditState.EXPLORE
-                log.info(
-                    f"Chose arm with UCB1 bandit: {arm.arm_id=}, {bandit_state=} (0 observations)"
-                )
-                return bandit_state, arm.arm_id
-
-        ucb_values = []
-        total_observations = sum(arm.n_observations for arm in avg_rewards_per_arm)
-        for arm in avg_rewards_per_arm:
-            bonus = math.sqrt(
-                (2 * math.log(total_observations)) / float(arm.n_observations)
-            )
-            ucb_value = arm.avg_reward + bonus
-            ucb_values.append(ucb_value)
-        maximum_reward_arm_index = ucb_values.index(max(ucb_values))
-        arm_id = avg_rewards_per_arm[maximum_reward_arm_index].arm_id
-
-        return BanditState.NOT_APPLICABLE, arm_id
+        arm_index = unobserved_index(arm_stats.n_observations)
+        if arm_index >= 0:
+            log.info(f"Chose arm with UCB1 bandit: {arm_index=} (0 observations)")
+            return BanditState.EXPLORE, arm_index
+
+        return BanditState.NOT_APPLICABLE, ucb1_index(arm_stats.n_observations, arm_stats.avg_rewards)
+
+    def choose_arm_indexes(self, arm_stats: ArmStats, n: int) -> Tuple[List[BanditState], np.ndarray]:
+        arm_indexes, explore = ucb1_indexes(arm_stats.n_observations, arm_stats.avg_rewards, n=n)
+        return [BanditState.EXPLORE if e else BanditState.NOT_APPLICABLE for e in explore], arm_indexes
+
+    def get_arm_probabilities(self, arm_stats: ArmStats) -> np.ndarray:
+        return ucb1_probabilities(arm_stats.n_observations, arm_stats.avg_rewards)
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+# caches created with a name, by name, their stats are reported at /metrics
+named_caches: Dict[str, "LRUCache"] = {}
+
+
+class LRUCache:
+    """
+    Size bounded, thread safe in-memory cache.
+    When full, the least recently used entry is evicted.
+    Entries older than ttl_seconds are treated as missing, so they get reloaded.
+    """
+
+    def __init__(
+        self,
+        maxsize: int,
+        ttl_seconds: float,
+        clock: Callable[[], float] = time.monotonic,
+        name: Optional[str] = None,
+    ):
+        if name is not None:
+            named_caches[name] = self
+        self.maxsize = maxsize
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Hashable, tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            return self._get_fresh_entry(key) is not None
+
+    def _get_fresh_entry(self, key: Hashable) -> Optional[tuple]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        stored_at, _ = entry
+        if self.clock() - stored_at > self.ttl_seconds:
+            del self._entries[key]
+            return None
+        return entry
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._get_fresh_entry(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._entries[key] = (self.clock(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def replace(self, key: Hashable, update: Callable[[Any], Any]) -> None:
+        """
+        Replace a cached value with update(value), keeping its age.
+        Does nothing when the key isn't cached, or its entry has expired.
+        Returning None from update drops the entry.
+        """
+        with self._lock:
+            entry = self._get_fresh_entry(key)
+            if entry is None:
+                return
+            stored_at, value = entry
+            new_value = update(value)
+            if new_value is None:
+                del self._entries[key]
+            else:
+                self._entries[key] = (stored_at, new_value)
+
+    def invalidate(self, key: Hashable) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def invalidate_matching(self, predicate: Callable[[Any], bool]) -> int:
+        """
+        Drop every entry whose value matches the predicate, and return how many were dropped.
+        Scans the whole cache, so it's meant for rare events.
+        """
+        with self._lock:
+            keys = [key for key, (_, value) in self._entries.items() if predicate(value)]
+            for key in keys:
+                del self._entries[key]
+            return len(keys)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else None,
+        }
@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import asyncio
+from typing import Dict, List, Optional, Sequence, Type
+import logging
+
+import httpx
+import numpy as np
+from maybee_backend.api.export import action_columns, observation_columns, read_csv_columns
+from maybee_backend.client.client import (default_host, page_size, default_retries, default_backoff_factor,
+                                          default_pool_size, default_timeout_seconds, retry_statuses,
+                                          retried_methods, import_pyarrow_or_none, is_access_token_rejected,
+                                          read_arrow_columns)
+from maybee_backend.models.core_models import (Action, ActionBatchResponse, ActionReport, Arm, AvgRewardsPerArm,
+                                               Environment, Observation, ObservationBatchResponse,
+                                               ObservationCreate, PolicySnapshot)
+
+
+def get_retry_delay(backoff_factor: float, attempt: int, response: Optional[httpx.Response] = None) -> float:
+    """
+    Seconds to wait before retrying: the Retry-After of the response, or else an exponential backoff.
+    """
+    if response is not None:
+        try:
+            return float(response.headers["Retry-After"])
+        except (KeyError, ValueError):
+            pass
+    return backoff_factor * 2 ** attempt
+
+
+class AsyncMaybeeClient():
+    """
+    Asynchronous client for the Maybee API, with the methods of MaybeeClient.
+    Calls can run concurrently, for example with asyncio.gather, over a pool of up to pool_size connections.
+    Authenticates, renews access tokens and retries like MaybeeClient.
+    Close the client when done, or use it as an async context manager.
+    """
+    def __init__(self, username: Optional[str] = None, password: Optional[str] = None,
+                 host: str = default_host, api_key: Optional[str] = None,
+                 retries: int = default_retries, backoff_factor: float = default_backoff_factor,
+                 pool_size: int = default_pool_size,
+                 timeout: Optional[float] = default_timeout_seconds,
+                 transport: Optional[httpx.AsyncBaseTransport] = None) -> None:
+        if host == default_host:
+            logging.info("Initializing async Maybee client for localhost")
+        if api_key is None and (username is None or password is None):
+            raise ValueError("Either an api_key or a username and password are required")
+        self.host = host
+        self.username = username
+        self.password = password
+        self.api_key = api_key
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self._access_token = None
+        # concurrent calls that find no valid access token wait for one login
+        self._access_token_lock = asyncio.Lock()
+        self.client = httpx.AsyncClient(
+            base_url=host,
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+            timeout=timeout,
+            transport=transport,
+        )
+
+
+    async def aclose(self) -> None:
+        await self.client.aclose()
+
+
+    async def __aenter__(self) -> "AsyncMaybeeClient":
+        return self
+
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.aclose()
+
+
+    async def _send(self, method: str, path: str, **kwargs) -> httpx.Response:
+        """
+        Send a request, retried with backoff when connecting fails,
+        and for retried_methods on a retry_statuses response or another transport error.
+        """
+        attempt = 0
+        while True:
+            try:
+                r = await self.client.request(method, path, **kwargs)
+            except httpx.TransportError as e:
+                if attempt >= self.retries or not (isinstance(e, httpx.ConnectError) or method in retried_methods):
+                    raise
+                await asyncio.sleep(get_retry_delay(self.backoff_factor, attempt))
+            else:
+                if attempt >= self.retries or r.status_code not in retry_statuses or method not in retried_methods:
+                    return r
+                await asyncio.sleep(get_retry_delay(self.backoff_factor, attempt, r))
+            attempt += 1
+
+
+    async def _get_fresh_access_token(self) -> str:
+        headers = {"Content-Type": "application/x-www-form-urlencoded"}
+        data = {"username": self.username,
+                "password": self.password}
+        r = await self._send("POST", "/users/token", data=data, headers=headers)
+        r.raise_for_status()
+        token = r.json().get("access_token", None)
+        if not token:
+            raise Exception(f"Failed to retrieve access token from {self.host}")
+        return token
+
+
+    async def get_access_token(self, rejected_token: Optional[str] = None) -> str:
+        """
+        Get an access token and cache it for future requests, or replace the cached one if it was rejected.
+        """
+        async with self._access_token_lock:
+            if not self._access_token or self._access_token == rejected_token:
+                self._access_token = await self._get_fresh_access_token()
+            return self._access_token
+
+
+    async def _get_headers_for_authorized_request(self, rejected_token: Optional[str] = None) -> Dict:
+        if self.api_key is not None:
+            return {"X-API-Key": self.api_key,
+                    "Content-Type": "application/json"}
+        return {"Authorization": f"Bearer {await self.get_access_token(rejected_token)}",
+                "Content-Type": "application/json"}
+
+
+    async def _request(self, method: str, path: str, headers_update: Optional[Dict] = None,
+                       **kwargs) -> httpx.Response:
+        """
+        Send an authorized request, with a fresh access token if the cached one was rejected.
+        """
+        headers = await self._get_headers_for_authorized_request()
+        r = await self._send(method, path, headers={**headers, **(headers_update or {})}, **kwargs)
+        if self.api_key is None and is_access_token_rejected(r):
+            # the access token expired, or the server's secret key was rotated
+            rejected_token = headers["Authorization"].removeprefix("Bearer ")
+            headers = await self._get_headers_for_authorized_request(rejected_token)
+            r = await self._send(method, path, headers={**headers, **(headers_update or {})}, **kwargs)
+        return r
+
+
+    async def _get_all_pages(self, path: str, model: Type) -> List:
+        rows = []
+        params = {"limit": page_size}
+        while True:
+            r = await self._request("GET", path, params=params)
+            r.raise_for_status()
+            rows.extend(model.model_validate(entry) for entry in r.json())
+            if "X-Next-Cursor" not in r.headers:
+                return rows
+            params["cursor"] = r.headers["X-Next-Cursor"]
+
+
+    async def get_environments(self) -> List[Environment]:
+        r = await self._request("GET", "/environments")
+        r.raise_for_status()
+        return [Environment.model_validate(entry) for entry in r.json()]
+
+
+    async def get_arms(self, environment_id: int) -> List[Arm]:
+        r = await self._request("GET", f"/environments/{environment_id}/arms")
+        r.raise_for_status()
+        return [Arm.model_validate(entry) for entry in r.json()]
+
+
+    async def create_action(self, environment_id: int) -> Action:
+        r = await self._request("POST", f"/environments/{environment_id}/actions")
+        r.raise_for_status()
+        return Action.model_validate(r.json())
+
+
+    async def create_actions(self, environment_id: int, n: int) -> ActionBatchResponse:
+        r = await self._request("POST", f"/environments/{environment_id}/actions/batch", params={"n": n})
+        r.raise_for_status()
+        return ActionBatchResponse.model_validate(r.json())
+
+
+    async def get_policy_snapshot(self, environment_id: int,
+                                  if_none_match: Optional[str] = None) -> Optional[PolicySnapshot]:
+        headers = {} if if_none_match is None else {"If-None-Match": f'"{if_none_match}"'}
+        r = await self._request("GET", f"/environments/{environment_id}/policy", headers_update=headers)
+        if r.status_code == 304:
+            return None
+        r.raise_for_status()
+        return PolicySnapshot.model_validate(r.json())
+
+
+    async def report_actions(self, environment_id: int, actions: Sequence[ActionReport]) -> ActionBatchResponse:
+        r = await self._request("POST", f"/environments/{environment_id}/actions/reports",
+                                content=f"[{','.join(action.model_dump_json() for action in actions)}]")
+        r.raise_for_status()
+        return ActionBatchResponse.model_validate(r.json())
+
+
+    async def get_actions(self, environment_id: int) -> List[Action]:
+        return await self._get_all_pages(f"/environments/{environment_id}/actions", Action)
+
+
+    async def create_observation(self, environment_id: int, action_id: int, arm_id: int,
+                                 reward: float) -> Observation:
+        r = await self._request("POST", f"/environments/{environment_id}/observations/",
+                                params={"action_id": action_id, "arm_id": arm_id, "reward": reward})
+        r.raise_for_status()
+        return Observation.model_validate(r.json())
+
+
+    async def create_observations(self, environment_id: int, observations: Sequence[ObservationCreate],
+                                  response_mode: str = "id_ranges") -> ObservationBatchResponse:
+        r = await self._request("POST", f"/environments/{environment_id}/observations/batch/",
+                                params={"response_mode": response_mode},
+                                content=f"[{','.join(observation.model_dump_json() for observation in observations)}]")
+        r.raise_for_status()
+        return ObservationBatchResponse.model_validate(r.json())
+
+
+    async def get_observations(self, environment_id: int) -> List[Observation]:
+        return await self._get_all_pages(f"/environments/{environment_id}/observations", Observation)
+
+
+    async def _get_exported_columns(self, environment_id: int, table: str, columns,
+                                    use_arrow: bool = True) -> Dict[str, np.ndarray]:
+        pyarrow = import_pyarrow_or_none()
+        use_arrow = use_arrow and pyarrow is not None
+        r = await self._request("GET", f"/environments/{environment_id}/{table}/export",
+                                params={"format": "arrow" if use_arrow else "csv"})
+        if use_arrow and r.status_code == 501:
+            return await self._get_exported_columns(environment_id, table, columns, use_arrow=False)
+        r.raise_for_status()
+        if not use_arrow:
+            return read_csv_columns(r.text, columns)
+        return read_arrow_columns(pyarrow, r.content)
+
+
+    async def get_action_columns(self, environment_id: int) -> Dict[str, np.ndarray]:
+        return await self._get_exported_columns(environment_id, "actions", action_columns)
+
+
+    async def get_observation_columns(self, environment_id: int) -> Dict[str, np.ndarray]:
+        return await self._get_exported_columns(environment_id, "observations", observation_columns)
+
+
+    async def get_avg_rewards_per_arm(self, environment_id: int) -> List[AvgRewardsPerArm]:
+        r = await self._request("GET", f"/environments/{environment_id}/arms/average_rewards/")
+        r.raise_for_status()
+        return [AvgRewardsPerArm.model_validate(entry) for entry in r.json()]
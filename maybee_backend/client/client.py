@@ -1,40 +1,128 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
-from typing import Dict, List
+from typing import TYPE_CHECKING, Dict, List, Optional, Sequence, Type
 import logging
 
+import numpy as np
 import requests
-from maybee_backend.models.core_models import (Action, Arm, AvgRewardsPerArm,
-                                               Environment, Observation)
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from maybee_backend.api.export import action_columns, observation_columns, read_csv_columns
+from maybee_backend.models.core_models import (Action, ActionBatchResponse, ActionReport, Arm, AvgRewardsPerArm,
+                                               Environment, Observation, ObservationBatchResponse,
+                                               ObservationCreate, PolicySnapshot)
+
+if TYPE_CHECKING:
+    from maybee_backend.client.local_policy import LocalPolicy
+    from maybee_backend.client.reporter import ObservationReporter
 
 
 default_host = "http://localhost:80"
+# rows per page when following paginated listings
+page_size = 10_000
+default_retries = 3
+default_backoff_factor = 0.5
+default_pool_size = 10
+default_timeout_seconds = 60.0
+# responses that are retried, they mean the request wasn't handled, a Retry-After header is respected
+retry_statuses = (429, 502, 503, 504)
+# requests that are retried on a response or a read error, posts may have been handled already,
+# and posting an action twice would take two actions, so they're only retried when connecting failed
+retried_methods = frozenset({"GET", "HEAD", "PUT", "DELETE", "OPTIONS"})
+# the detail of the 401 for an access token the server can't validate, expired tokens included,
+# the other 401s refuse the request to the user (not an admin, no access to an environment)
+invalid_credentials_detail = "Could not validate credentials"
+
+
+def is_access_token_rejected(response) -> bool:
+    """
+    Whether a requests or httpx response refused the access token itself, so a fresh one may be accepted.
+    """
+    if response.status_code != 401:
+        return False
+    try:
+        body = response.json()
+    except ValueError:
+        return False
+    return isinstance(body, dict) and body.get("detail") == invalid_credentials_detail
+
+
+def import_pyarrow_or_none():
+    try:
+        import pyarrow
+        import pyarrow.ipc
+    except ImportError:
+        return None
+    return pyarrow
+
+
+def read_arrow_columns(pyarrow, source) -> Dict[str, np.ndarray]:
+    """
+    Read an exported Arrow stream from bytes or a file into a numpy array per column.
+    """
+    exported_table = pyarrow.ipc.open_stream(source).read_all()
+    return {name: exported_table.column(name).to_numpy() for name in exported_table.column_names}
 
 
 class MaybeeClient():
     """
-    Client for the Maybee API
+    Client for the Maybee API.
+    Authenticates with an api key when one is given (see /users/api_keys),
+    or else with an access token obtained with the username and password, which is renewed when it expires.
+    Requests share a pool of keep-alive connections, and are retried with exponential backoff
+    when connecting fails or the server is unavailable.
+    Close the client when done, or use it as a context manager.
     """
-    def __init__(self, username: str, password: str, host: str=default_host) -> None:
+    def __init__(self, username: Optional[str] = None, password: Optional[str] = None,
+                 host: str=default_host, api_key: Optional[str] = None,
+                 retries: int = default_retries, backoff_factor: float = default_backoff_factor,
+                 pool_size: int = default_pool_size,
+                 timeout: Optional[float] = default_timeout_seconds) -> None:
         if host == default_host:
             logging.info("Initializing Maybee client for localhost")
+        if api_key is None and (username is None or password is None):
+            raise ValueError("Either an api_key or a username and password are required")
         self.host = host
         self.username = username
         self.password = password
+        self.api_key = api_key
+        self.timeout = timeout
         self._access_token = None
-        
-        
+
+        retry = Retry(total=retries,
+                      backoff_factor=backoff_factor,
+                      status_forcelist=retry_statuses,
+                      allowed_methods=retried_methods,
+                      raise_on_status=False)
+        adapter = HTTPAdapter(pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+
+    def close(self) -> None:
+        self.session.close()
+
+
+    def __enter__(self) -> "MaybeeClient":
+        return self
+
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
     def _get_fresh_access_token(self) -> str:
         headers = {"Content-Type": "application/x-www-form-urlencoded"}
         data = {"username": self.username,
                 "password": self.password}
-        r = requests.post(url=f"{self.host}/users/token", data=data, headers=headers)
+        r = self.session.post(url=f"{self.host}/users/token", data=data, headers=headers, timeout=self.timeout)
         r.raise_for_status()
         token = r.json().get("access_token", None)
         if not token:
             raise Exception(f"Failed to retrieve access token from {self.host}")
         return token
-    
+
 
     @property
     def access_token(self) -> str:
@@ -47,68 +135,204 @@ class MaybeeClient():
 
 
     def _get_headers_for_authorized_request(self) -> Dict:
-        return {"Authorization": f"Bearer {self.access_token}", 
+        if self.api_key is not None:
+            return {"X-API-Key": self.api_key,
+                    "Content-Type": "application/json"}
+        return {"Authorization": f"Bearer {self.access_token}",
                 "Content-Type": "application/json"}
-    
+
+
+    def _request(self, method: str, path: str, headers_update: Optional[Dict] = None,
+                 **kwargs) -> requests.Response:
+        """
+        Send an authorized request, with a fresh access token if the cached one was rejected.
+        """
+        def send() -> requests.Response:
+            headers = {**self._get_headers_for_authorized_request(), **(headers_update or {})}
+            return self.session.request(method, f"{self.host}{path}", timeout=self.timeout, headers=headers, **kwargs)
+
+        r = send()
+        if self.api_key is None and is_access_token_rejected(r):
+            # the access token expired, or the server's secret key was rotated
+            r.close()
+            self._access_token = None
+            r = send()
+        return r
+
+
+    def _get_all_pages(self, path: str, model: Type) -> List:
+        """
+        Follow the pages of a listing, and validate its rows into model.
+        """
+        rows = []
+        params = {"limit": page_size}
+        while True:
+            r = self._request("GET", path, params=params)
+            r.raise_for_status()
+            rows.extend(model.model_validate(entry) for entry in r.json())
+            if "X-Next-Cursor" not in r.headers:
+                return rows
+            params["cursor"] = r.headers["X-Next-Cursor"]
+
 
     def get_environments(self) -> List[Environment]:
-        r = requests.get(
-            url=f"{self.host}/environments", 
-            headers=self._get_headers_for_authorized_request()
-            )
+        r = self._request("GET", "/environments")
         r.raise_for_status()
         return [Environment.model_validate(entry) for entry in r.json()]
 
 
     def get_arms(self, environment_id: int) -> List[Arm]:
-        r = requests.get(
-            url=f"{self.host}/environments/{environment_id}/arms", 
-            headers=self._get_headers_for_authorized_request()
-            )
+        r = self._request("GET", f"/environments/{environment_id}/arms")
         r.raise_for_status()
         return [Arm.model_validate(entry) for entry in r.json()]
-    
-    
+
+
     def create_action(self, environment_id: int) -> Action:
         """
-        Create a new Action. 
-        This action object contains the arm_id 
-        chosen by the bandit configured for the environment. 
+        Create a new Action.
+        This action object contains the arm_id
+        chosen by the bandit configured for the environment.
         """
-        r = requests.post(url=f"{self.host}/environments/{{environment_id}}/actions", 
-                          headers=self._get_headers_for_authorized_request())
+        r = self._request("POST", f"/environments/{environment_id}/actions")
         r.raise_for_status()
         return Action.model_validate(r.json())
-    
+
+
+    def create_actions(self, environment_id: int, n: int) -> ActionBatchResponse:
+        """
+        Create n Actions at once, with the arm_ids chosen by the bandit configured for the environment.
+        """
+        r = self._request("POST", f"/environments/{environment_id}/actions/batch", params={"n": n})
+        r.raise_for_status()
+        return ActionBatchResponse.model_validate(r.json())
+
+
+    def get_policy_snapshot(self, environment_id: int,
+                            if_none_match: Optional[str] = None) -> Optional[PolicySnapshot]:
+        """
+        Get the policy snapshot of an environment, to choose arms from without a request per choice.
+        Returns None if its version is still if_none_match.
+        """
+        headers = {} if if_none_match is None else {"If-None-Match": f'"{if_none_match}"'}
+        r = self._request("GET", f"/environments/{environment_id}/policy", headers_update=headers)
+        if r.status_code == 304:
+            return None
+        r.raise_for_status()
+        return PolicySnapshot.model_validate(r.json())
+
+
+    def report_actions(self, environment_id: int, actions: Sequence[ActionReport]) -> ActionBatchResponse:
+        """
+        Record actions that were chosen from a policy snapshot, with their rewards if they're known.
+        """
+        r = self._request("POST", f"/environments/{environment_id}/actions/reports",
+                          data=f"[{','.join(action.model_dump_json() for action in actions)}]")
+        r.raise_for_status()
+        return ActionBatchResponse.model_validate(r.json())
+
+
+    def create_local_policy(self, environment_id: int, **kwargs) -> "LocalPolicy":
+        """
+        Choose the arms of an environment here, from a policy snapshot that's refreshed in the background,
+        and report the choices in batches. See LocalPolicy for the arguments, close it when done:
+
+            with client.create_local_policy(environment_id) as policy:
+                action = policy.choose_arm()
+                policy.report(action, reward)
+        """
+        from maybee_backend.client.local_policy import LocalPolicy
+
+        return LocalPolicy(self, environment_id, **kwargs)
+
+
     def get_actions(self, environment_id: int) -> List[Action]:
         """
-        Gets a log of the previously taken actions
+        Gets a log of the previously taken actions, following the pages of the listing
         """
-        r = requests.get(
-            url=f"{self.host}/environments/{environment_id}/actions", 
-            headers=self._get_headers_for_authorized_request()
-            )
+        return self._get_all_pages(f"/environments/{environment_id}/actions", Action)
+
+
+    def create_observation(self, environment_id: int, action_id: int, arm_id: int, reward: float) -> Observation:
+        """
+        Report the reward of an action.
+        """
+        r = self._request("POST", f"/environments/{environment_id}/observations/",
+                          params={"action_id": action_id, "arm_id": arm_id, "reward": reward})
         r.raise_for_status()
-        return [Action.model_validate(entry) for entry in r.json()]
-    
+        return Observation.model_validate(r.json())
 
-    def get_observations(self, environment_id: int) -> List[Observation]:
-        r = requests.get(
-            url=f"{self.host}/environments/{environment_id}/arms", 
-            headers=self._get_headers_for_authorized_request()
-            )
+
+    def create_observations(self, environment_id: int, observations: Sequence[ObservationCreate],
+                            response_mode: str = "id_ranges") -> ObservationBatchResponse:
+        """
+        Report the rewards of many actions at once, the response has the ranges of the new observation_ids,
+        or only their number with response_mode="count".
+        """
+        r = self._request("POST", f"/environments/{environment_id}/observations/batch/",
+                          params={"response_mode": response_mode},
+                          data=f"[{','.join(observation.model_dump_json() for observation in observations)}]")
         r.raise_for_status()
-        return [Observation.model_validate(entry) for entry in r.json()]
-    
+        return ObservationBatchResponse.model_validate(r.json())
 
-    def get_avg_rewards_per_arm(self, environment_id: int) -> List[AvgRewardsPerArm]:
-        r = requests.get(
-            url=f"{self.host}/environments/{environment_id}/arms/average_rewards", 
-            headers=self._get_headers_for_authorized_request()
-            )
+
+    def create_observation_reporter(self, **kwargs) -> "ObservationReporter":
+        """
+        Report observations in batches from a background thread, rather than one request per observation.
+        See ObservationReporter for the arguments, close the reporter when done, or use it in a with block:
+
+            with client.create_observation_reporter(max_batch_size=500) as reporter:
+                reporter.report(environment_id, action_id, arm_id, reward)
+        """
+        from maybee_backend.client.reporter import ObservationReporter
+
+        return ObservationReporter(self, **kwargs)
+
+
+    def get_observations(self, environment_id: int) -> List[Observation]:
+        """
+        Gets a log of the observations, following the pages of the listing
+        """
+        return self._get_all_pages(f"/environments/{environment_id}/observations", Observation)
+
+
+    def _get_exported_columns(self, environment_id: int, table: str, columns,
+                              use_arrow: bool = True) -> Dict[str, np.ndarray]:
+        """
+        Download an export as an Arrow stream when pyarrow is installed here and on the server,
+        or else as csv, and return a numpy array per column, ready for pandas.DataFrame(columns).
+        """
+        pyarrow = import_pyarrow_or_none()
+        use_arrow = use_arrow and pyarrow is not None
+        r = self._request("GET", f"/environments/{environment_id}/{table}/export",
+                          params={"format": "arrow" if use_arrow else "csv"},
+                          stream=use_arrow)
+        if use_arrow and r.status_code == 501:
+            r.close()
+            return self._get_exported_columns(environment_id, table, columns, use_arrow=False)
         r.raise_for_status()
-        return [AvgRewardsPerArm.model_validate(entry) for entry in r.json()]
+        if not use_arrow:
+            return read_csv_columns(r.text, columns)
+        with r:
+            return read_arrow_columns(pyarrow, r.raw)
+
 
+    def get_action_columns(self, environment_id: int) -> Dict[str, np.ndarray]:
+        """
+        Gets all actions of an environment, without their bandit_state, as a numpy array per column.
+        Int columns with missing values are float columns with nan.
+        """
+        return self._get_exported_columns(environment_id, "actions", action_columns)
 
 
-        
+    def get_observation_columns(self, environment_id: int) -> Dict[str, np.ndarray]:
+        """
+        Gets all observations of an environment as a numpy array per column.
+        Int columns with missing values are float columns with nan.
+        """
+        return self._get_exported_columns(environment_id, "observations", observation_columns)
+
+
+    def get_avg_rewards_per_arm(self, environment_id: int) -> List[AvgRewardsPerArm]:
+        r = self._request("GET", f"/environments/{environment_id}/arms/average_rewards/")
+        r.raise_for_status()
+        return [AvgRewardsPerArm.model_validate(entry) for entry in r.json()]
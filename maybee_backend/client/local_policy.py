@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Choosing arms on the client, from a policy snapshot of the environment.
+
+The snapshot (see GET /environments/{environment_id}/policy) holds the arm stats of the environment,
+the client runs the environment's bandit on them, so a choice takes no request.
+A background thread keeps the snapshot fresh, it's only downloaded again once the arm stats changed.
+The choices are reported in batches, each with the version of the snapshot it was made from,
+and with its reward when that's known by then.
+Until the next refresh, choices don't learn from the rewards of the choices before them,
+so the deterministic bandits (ucb1) keep choosing the same arm in between.
+"""
+import logging
+import threading
+from typing import List, Optional, Tuple
+
+from maybee_backend.client.reporter import ActionReporter
+from maybee_backend.models.arm_stats import ArmStats
+from maybee_backend.models.core_models import ActionReport, Bandit, PolicySnapshot
+from maybee_backend.models.policy_snapshot import get_snapshot_arm_stats, get_snapshot_bandit
+
+default_refresh_interval_seconds = 10.0
+
+
+class NoArmsAvailableError(ValueError):
+    """
+    Raised when choosing from the snapshot of an environment without arms,
+    for which the act routes return the NO_ARMS_AVAILABLE bandit state.
+    """
+
+
+class LocalPolicy():
+    """
+    Chooses arms of an environment from its latest policy snapshot, see MaybeeClient.create_local_policy.
+    The keyword arguments are those of the ActionReporter that reports the choices.
+    Close the policy when done, or use it as a context manager, to report the last choices.
+    """
+    def __init__(self, client, environment_id: int,
+                 refresh_interval_seconds: float = default_refresh_interval_seconds, **reporter_kwargs) -> None:
+        self.client = client
+        self.environment_id = environment_id
+        self.refresh_interval_seconds = refresh_interval_seconds
+        self.n_refreshes = 0
+        self.n_failed_refreshes = 0
+        self._state = self._get_state(client.get_policy_snapshot(environment_id))
+        self.reporter = ActionReporter(client, **reporter_kwargs)
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="maybee-policy-refresh", daemon=True)
+        self._thread.start()
+
+    def __enter__(self) -> "LocalPolicy":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    @staticmethod
+    def _get_state(snapshot: PolicySnapshot) -> Tuple[PolicySnapshot, ArmStats, Bandit]:
+        return snapshot, get_snapshot_arm_stats(snapshot), get_snapshot_bandit(snapshot)
+
+    @property
+    def snapshot(self) -> PolicySnapshot:
+        return self._state[0]
+
+    def refresh(self) -> bool:
+        """
+        Replace the snapshot if the arm stats changed since it was taken, and return whether they did.
+        """
+        snapshot = self.client.get_policy_snapshot(self.environment_id, if_none_match=self.snapshot.version)
+        self.n_refreshes += 1
+        if snapshot is None:
+            return False
+        # choices read the state as one tuple, so they never mix two snapshots
+        self._state = self._get_state(snapshot)
+        return True
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.refresh_interval_seconds):
+            try:
+                self.refresh()
+            except Exception as e:
+                # keep choosing from the last snapshot until the server is back
+                self.n_failed_refreshes += 1
+                logging.warning(f"Failed to refresh the policy snapshot of environment {self.environment_id}: {e!r}")
+
+    def choose_arms(self, n: int) -> List[ActionReport]:
+        """
+        Make n choices at once, from one snapshot.
+        Report them with report, once their rewards are known, or without them.
+        Raises NoArmsAvailableError when the environment had no arms when the snapshot was taken.
+        """
+        snapshot, arm_stats, bandit = self._state
+        if len(arm_stats) == 0:
+            raise NoArmsAvailableError(f"Environment {self.environment_id} has no arms to choose from")
+        bandit_states, arm_indexes = bandit.choose_arm_indexes(arm_stats, n)
+        return [
+            ActionReport(
+                arm_id=snapshot.arm_ids[arm_index],
+                bandit_state=bandit_state.value,
+                propensity=snapshot.probabilities[arm_index],
+                policy_version=snapshot.version,
+            )
+            for bandit_state, arm_index in zip(bandit_states, arm_indexes)
+        ]
+
+    def choose_arm(self) -> ActionReport:
+        return self.choose_arms(1)[0]
+
+    def report(self, action: ActionReport, reward: Optional[float] = None) -> bool:
+        """
+        Queue a choice to be reported, with its reward if it's known.
+        Returns False when it was dropped, because the queue of the reporter stayed full.
+        """
+        if reward is not None:
+            action = action.model_copy(update={"reward": reward})
+        return self.reporter.report(self.environment_id, action)
+
+    def close(self) -> None:
+        """
+        Stop refreshing the snapshot, and report the choices that are still queued.
+        """
+        self._stopped.set()
+        self._thread.join()
+        self.reporter.close()
@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Batching of observations and actions on the client.
+
+Observations (or actions) are reported into a bounded local queue, and a background thread posts them
+to the batch endpoint of their environment once max_batch_size are waiting, or every flush_interval_seconds.
+A batch that fails because the server is unavailable is retried with exponential backoff.
+A batch that timed out isn't retried, as it may have been written. The server writes a batch in one transaction,
+so a batch is either written whole or not at all.
+What's still queued is flushed when the reporter is closed, or when the interpreter exits.
+"""
+import atexit
+import datetime
+import logging
+import threading
+import time
+from collections import defaultdict, deque
+from enum import Enum
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+import requests
+from maybee_backend.client.client import retry_statuses
+from maybee_backend.models.core_models import ActionReport, ObservationCreate
+
+default_max_batch_size = 1_000
+default_flush_interval_seconds = 1.0
+default_max_buffered = 100_000
+
+
+class FullBufferPolicy(str, Enum):
+    # wait for room in the queue, up to block_timeout_seconds, then drop
+    BLOCK = "block"
+    # drop the item right away
+    DROP = "drop"
+
+
+class BatchReporter():
+    """
+    Posts reported items in batches per environment from a background thread.
+    At most max_buffered items are held, counting those that are being posted.
+    Subclasses post a batch with post_batch.
+    """
+
+    # what the items are called in the logs
+    item_name = "items"
+
+    def __init__(self, client, max_batch_size: int = default_max_batch_size,
+                 flush_interval_seconds: float = default_flush_interval_seconds,
+                 max_buffered: int = default_max_buffered,
+                 full_buffer_policy: FullBufferPolicy = FullBufferPolicy.BLOCK,
+                 block_timeout_seconds: Optional[float] = None,
+                 retries: int = 3, backoff_factor: float = 1.0) -> None:
+        if max_batch_size > max_buffered:
+            raise ValueError(f"{max_batch_size=} can't be larger than {max_buffered=}")
+        self.client = client
+        self.max_batch_size = max_batch_size
+        self.flush_interval_seconds = flush_interval_seconds
+        self.max_buffered = max_buffered
+        self.full_buffer_policy = FullBufferPolicy(full_buffer_policy)
+        self.block_timeout_seconds = block_timeout_seconds
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self._pending: Deque[Tuple[int, Any]] = deque()
+        self._n_in_flight = 0
+        self._flush_requested = False
+        self._closed = False
+        self._condition = threading.Condition()
+        self.n_reported = 0
+        self.n_dropped = 0
+        self.n_sent = 0
+        self.n_failed = 0
+        self.n_batches = 0
+        self.n_retries = 0
+        self._thread = threading.Thread(target=self._run, name=f"maybee-{self.item_name}-reporter", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+
+    def __enter__(self) -> "BatchReporter":
+        return self
+
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+    def __len__(self) -> int:
+        return len(self._pending) + self._n_in_flight
+
+
+    def put(self, environment_id: int, item) -> bool:
+        """
+        Queue an item for the next batch of its environment.
+        Returns False when it was dropped, because the queue stayed full.
+        """
+        with self._condition:
+            if self._closed:
+                raise RuntimeError(f"The {self.item_name} reporter is closed")
+            if len(self) >= self.max_buffered:
+                has_room = self.full_buffer_policy == FullBufferPolicy.BLOCK and self._condition.wait_for(
+                    lambda: len(self) < self.max_buffered or self._closed, timeout=self.block_timeout_seconds
+                )
+                if not has_room or self._closed:
+                    self.n_dropped += 1
+                    return False
+            self._pending.append((environment_id, item))
+            self.n_reported += 1
+            if len(self._pending) >= self.max_batch_size:
+                self._condition.notify_all()
+            return True
+
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        Post everything that's queued now, and wait until it's done.
+        Returns False if it wasn't done within timeout.
+        """
+        with self._condition:
+            self._flush_requested = True
+            self._condition.notify_all()
+            return self._condition.wait_for(lambda: len(self) == 0, timeout=timeout)
+
+
+    def close(self, timeout: Optional[float] = None) -> None:
+        """
+        Stop accepting items, and post what's queued before the background thread ends.
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join(timeout)
+        atexit.unregister(self.close)
+
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                self._condition.wait_for(
+                    lambda: self._closed or self._flush_requested or len(self._pending) >= self.max_batch_size,
+                    timeout=self.flush_interval_seconds,
+                )
+                if self._closed and not self._pending:
+                    return
+                items = list(self._pending)
+                self._pending.clear()
+                self._n_in_flight = len(items)
+                self._flush_requested = False
+            try:
+                self._post(items)
+            finally:
+                with self._condition:
+                    self._n_in_flight = 0
+                    self._condition.notify_all()
+
+
+    def _post(self, items: List[Tuple[int, Any]]) -> None:
+        items_per_environment: Dict[int, List] = defaultdict(list)
+        for environment_id, item in items:
+            items_per_environment[environment_id].append(item)
+        for environment_id, environment_items in items_per_environment.items():
+            for start in range(0, len(environment_items), self.max_batch_size):
+                batch = environment_items[start:start + self.max_batch_size]
+                if self._post_batch_with_retries(environment_id, batch):
+                    self.n_sent += len(batch)
+                else:
+                    self.n_failed += len(batch)
+
+
+    def post_batch(self, environment_id: int, batch: List) -> None:
+        raise NotImplementedError
+
+
+    def _post_batch_with_retries(self, environment_id: int, batch: List) -> bool:
+        """
+        Post a batch, retried when the server is unavailable or couldn't be reached,
+        and return whether it was written.
+        """
+        self.n_batches += 1
+        for attempt in range(self.retries + 1):
+            if attempt > 0:
+                self.n_retries += 1
+                time.sleep(self.backoff_factor * 2 ** (attempt - 1))
+            try:
+                self.post_batch(environment_id, batch)
+                return True
+            except requests.HTTPError as e:
+                error = e
+                status_code = e.response.status_code
+                if status_code not in retry_statuses and status_code != 500:
+                    break
+            except requests.Timeout as e:
+                # the batch may have been written, retrying it could record it twice
+                error = e
+                if not isinstance(e, requests.ConnectTimeout):
+                    break
+            except requests.ConnectionError as e:
+                error = e
+        logging.error(f"Failed to report {len(batch)} {self.item_name} of {environment_id=}: {error!r}")
+        return False
+
+
+    def stats(self) -> dict:
+        return {
+            "depth": len(self),
+            "max_buffered": self.max_buffered,
+            "reported": self.n_reported,
+            "dropped": self.n_dropped,
+            "sent": self.n_sent,
+            "failed": self.n_failed,
+            "batches": self.n_batches,
+            "retries": self.n_retries,
+        }
+
+
+class ObservationReporter(BatchReporter):
+    """
+    Reports observations in batches from a background thread, see MaybeeClient.create_observation_reporter.
+    """
+
+    item_name = "observations"
+
+    def report(self, environment_id: int, action_id: int, arm_id: int, reward: float,
+               event_datetime: Optional[datetime.datetime] = None) -> bool:
+        """
+        Queue an observation for the next batch.
+        Returns False when it was dropped, because the queue stayed full.
+        """
+        observation = ObservationCreate(environment_id=environment_id, action_id=action_id, arm_id=arm_id,
+                                        reward=reward, event_datetime=event_datetime or datetime.datetime.now())
+        return self.put(environment_id, observation)
+
+
+    def post_batch(self, environment_id: int, batch: List[ObservationCreate]) -> None:
+        self.client.create_observations(environment_id, batch, response_mode="count")
+
+
+class ActionReporter(BatchReporter):
+    """
+    Reports actions chosen from policy snapshots in batches from a background thread, see LocalPolicy.
+    """
+
+    item_name = "actions"
+
+    def report(self, environment_id: int, action: ActionReport) -> bool:
+        """
+        Queue an action for the next batch.
+        Returns False when it was dropped, because the queue stayed full.
+        """
+        return self.put(environment_id, action)
+
+
+    def post_batch(self, environment_id: int, batch: List[ActionReport]) -> None:
+        self.client.report_actions(environment_id, batch)
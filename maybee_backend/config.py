@@ -6,8 +6,45 @@ import os
 class Config:
     print("Creating config")
     db_uri = os.getenv("DB_URI", None)
+    # defaults to DB_URI with its driver swapped for an async one
+    async_db_uri = os.getenv("ASYNC_DB_URI", None)
     secret_key = os.getenv("SECRET_KEY", None)
 
+    # connection pool settings, applied to the engine shared by a worker process
+    db_pool_size = int(os.getenv("DB_POOL_SIZE", 5))
+    db_max_overflow = int(os.getenv("DB_MAX_OVERFLOW", 10))
+    db_pool_pre_ping = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+    db_pool_recycle = int(os.getenv("DB_POOL_RECYCLE", 1800))
+
+    # per worker cache of the arm stats the bandits choose from
+    arm_stats_cache_size = int(os.getenv("ARM_STATS_CACHE_SIZE", 1024))
+    arm_stats_cache_ttl_seconds = float(os.getenv("ARM_STATS_CACHE_TTL_SECONDS", 5))
+
+    # per worker cache of verified access tokens and the users they belong to
+    user_cache_size = int(os.getenv("USER_CACHE_SIZE", 10_000))
+    user_cache_ttl_seconds = float(os.getenv("USER_CACHE_TTL_SECONDS", 60))
+
+    # per worker cache of the ids of the environments a user has access to
+    environment_access_cache_size = int(os.getenv("ENVIRONMENT_ACCESS_CACHE_SIZE", 10_000))
+    environment_access_cache_ttl_seconds = float(os.getenv("ENVIRONMENT_ACCESS_CACHE_TTL_SECONDS", 60))
+
+    # write-behind buffer for observations posted with buffered=true
+    observation_buffer_enabled = os.getenv("OBSERVATION_BUFFER_ENABLED", "false").lower() == "true"
+    observation_buffer_max_rows = int(os.getenv("OBSERVATION_BUFFER_MAX_ROWS", 100_000))
+    observation_buffer_flush_rows = int(os.getenv("OBSERVATION_BUFFER_FLUSH_ROWS", 5_000))
+    observation_buffer_flush_interval_ms = float(os.getenv("OBSERVATION_BUFFER_FLUSH_INTERVAL_MS", 200))
+
+    # how fast the discounted bandits forget, and the window of the sliding window bandits
+    reward_half_life_seconds = float(os.getenv("REWARD_HALF_LIFE_SECONDS", 86400))
+    reward_window_seconds = float(os.getenv("REWARD_WINDOW_SECONDS", 3600))
+    reward_window_buckets = int(os.getenv("REWARD_WINDOW_BUCKETS", 12))
+
+    # request, database and cache metrics of each worker, at /metrics
+    metrics_enabled = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+
+    # profile the sql statements of requests that send X-Query-Profile (header), of every request (all), or not (off)
+    query_profiler = os.getenv("QUERY_PROFILER", "off").lower()
+
 
 def get_config():
     return Config()
@@ -1,15 +1,128 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 from fastapi import Depends
-import os
+from typing import AsyncIterator, Iterator, Optional
 from sqlmodel import create_engine, Session
-from sqlalchemy.engine import Engine
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+
+from maybee_backend.config import Config, get_config
+from maybee_backend.logging import log
+from maybee_backend.metrics import get_timed_pool_class
+
+
+# async drivers to use in place of the sync driver configured in DB_URI
+async_drivers = {
+    "postgresql": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+# one engine (and therefore one connection pool) per worker process
+_engine: Optional[Engine] = None
+_async_engine: Optional[AsyncEngine] = None
+
+
+def get_async_db_uri(db_uri: str) -> str:
+    """
+    Swap the driver of a sync db uri for its async counterpart,
+    e.g. postgresql://... becomes postgresql+asyncpg://...
+    """
+    url = make_url(db_uri)
+    backend_name = url.get_backend_name()
+    if backend_name not in async_drivers:
+        raise ValueError(f"No async driver available for database backend {backend_name}")
+    return url.set(drivername=async_drivers[backend_name]).render_as_string(
+        hide_password=False
+    )
+
+
+def get_pool_kwargs(config: Config, db_uri: str) -> dict:
+    """
+    Translate the pool settings in the config to engine arguments.
+    The pool is the one the dialect would pick, timed for the checkout metrics.
+    """
+    url = make_url(db_uri)
+    pool_kwargs = {
+        "pool_pre_ping": config.db_pool_pre_ping,
+        "poolclass": get_timed_pool_class(url.get_dialect().get_pool_class(url)),
+    }
+    # sqlite uses a single connection / per thread pool that doesn't take sizing arguments
+    if not db_uri.startswith("sqlite"):
+        pool_kwargs.update(
+            pool_size=config.db_pool_size,
+            max_overflow=config.db_max_overflow,
+            pool_recycle=config.db_pool_recycle,
+        )
+    return pool_kwargs
+
+
+def create_pooled_engine(config: Config) -> Engine:
+    """
+    Create an engine with a connection pool configured from the config.
+    """
+    return create_engine(config.db_uri, **get_pool_kwargs(config, config.db_uri))
+
+
+def create_pooled_async_engine(config: Config) -> AsyncEngine:
+    """
+    Create an async engine with a connection pool configured from the config.
+    """
+    async_db_uri = config.async_db_uri or get_async_db_uri(config.db_uri)
+    return create_async_engine(async_db_uri, **get_pool_kwargs(config, async_db_uri))
+
+
+def init_engine(config: Optional[Config] = None) -> Engine:
+    """
+    Create the process wide engine if it doesn't exist yet, and return it.
+    """
+    global _engine
+    if _engine is None:
+        _engine = create_pooled_engine(config or get_config())
+        log.info(f"Created database engine with pool {_engine.pool.status()}")
+    return _engine
+
+
+def init_async_engine(config: Optional[Config] = None) -> AsyncEngine:
+    """
+    Create the process wide async engine if it doesn't exist yet, and return it.
+    """
+    global _async_engine
+    if _async_engine is None:
+        _async_engine = create_pooled_async_engine(config or get_config())
+        log.info(f"Created async database engine with pool {_async_engine.pool.status()}")
+    return _async_engine
+
+
+async def dispose_engines() -> None:
+    """
+    Close all pooled connections and forget the process wide engines.
+    """
+    global _engine, _async_engine
+    if _engine is not None:
+        _engine.dispose()
+        _engine = None
+    if _async_engine is not None:
+        await _async_engine.dispose()
+        _async_engine = None
 
 
 def get_engine() -> Engine:
-    return create_engine(os.getenv("DB_URI", None))
+    return init_engine()
+
+
+def get_async_engine() -> AsyncEngine:
+    return init_async_engine()
 
 
-def get_session(engine: Engine = Depends(get_engine)) -> Session:
+def get_session(engine: Engine = Depends(get_engine)) -> Iterator[Session]:
     with Session(engine) as session:
-        return session
+        yield session
+
+
+async def get_async_session(
+    engine: AsyncEngine = Depends(get_async_engine),
+) -> AsyncIterator[AsyncSession]:
+    # objects stay loaded after commit, so they can be returned without a refresh
+    async with AsyncSession(engine, expire_on_commit=False) as session:
+        yield session
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Off-policy evaluation of candidate bandits on the logged actions and observations of an environment.
+
+The history is streamed from the database in chunks of actions, and every candidate is run over it:
+in each batch of logged actions the candidate makes its own choices from the arm stats it has learned so far.
+- Replay (rejection sampling): the logged actions where the candidate chose the logged arm are kept,
+  the estimate is the average reward of those, and only those are learned from.
+  Unbiased when the logged arms were chosen uniformly at random.
+- Inverse propensity scoring: every logged reward is weighed by the probability the candidate
+  had of choosing the logged arm, divided by the propensity the logging bandit had of choosing it.
+  Only actions that were logged with a propensity count.
+"""
+import datetime
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Optional, Sequence
+import numpy as np
+from sqlmodel import Session, select
+
+from maybee_backend.models.core_models import (
+    Action,
+    Arm,
+    Observation,
+    PolicyCandidate,
+    PolicyEvaluation,
+)
+from maybee_backend.simulations.simulation_environment import create_offline_bandit, get_simulated_arm_stats
+from maybee_backend.logging import log
+
+default_chunk_size = 10_000
+default_batch_size = 100
+
+
+@dataclass
+class LoggedEvents:
+    """
+    A chunk of logged actions with their rewards, as positions of the arms in the environment's arm_ids.
+    Propensities that weren't logged are nan.
+    """
+
+    arm_indexes: np.ndarray
+    rewards: np.ndarray
+    propensities: np.ndarray
+    event_datetimes: List[datetime.datetime]
+
+    def __len__(self) -> int:
+        return len(self.arm_indexes)
+
+
+def stream_logged_events(
+    session: Session,
+    environment_id: int,
+    arm_ids: Sequence[int],
+    chunk_size: int = default_chunk_size,
+    missing_reward: Optional[float] = None,
+) -> Iterator[LoggedEvents]:
+    """
+    Yield the actions of an environment in the order they were taken, chunk_size actions at a time,
+    with the sum of the rewards observed for them.
+    Actions without observations are skipped, or get missing_reward if it's given.
+    Actions on arms that aren't in arm_ids are skipped.
+    """
+    positions = {arm_id: position for position, arm_id in enumerate(arm_ids)}
+    last_action_id = 0
+    while True:
+        actions = (
+            select(Action.action_id, Action.arm_id, Action.propensity, Action.event_datetime)
+            .where(Action.environment_id == environment_id)
+            .where(Action.action_id > last_action_id)
+            .order_by(Action.action_id)
+            .limit(chunk_size)
+            .subquery()
+        )
+        sql = (
+            select(actions, Observation.reward)
+            .outerjoin(Observation, Observation.action_id == actions.c.action_id)
+            .order_by(actions.c.action_id)
+        )
+        rows = session.exec(sql).all()
+        if not rows:
+            return
+        last_action_id = rows[-1].action_id
+
+        rewards_per_action: Dict[int, Optional[float]] = {}
+        action_rows = {}
+        for row in rows:
+            action_rows.setdefault(row.action_id, row)
+            if row.reward is not None:
+                rewards_per_action[row.action_id] = rewards_per_action.get(row.action_id, 0.0) + row.reward
+
+        arm_indexes, rewards, propensities, event_datetimes = [], [], [], []
+        for action_id, row in action_rows.items():
+            reward = rewards_per_action.get(action_id, missing_reward)
+            if reward is None or row.arm_id not in positions:
+                continue
+            arm_indexes.append(positions[row.arm_id])
+            rewards.append(reward)
+            propensities.append(row.propensity if row.propensity else np.nan)
+            event_datetimes.append(row.event_datetime)
+        yield LoggedEvents(
+            arm_indexes=np.array(arm_indexes, dtype=np.int64),
+            rewards=np.array(rewards, dtype=np.float64),
+            propensities=np.array(propensities, dtype=np.float64),
+            event_datetimes=event_datetimes,
+        )
+
+
+@dataclass
+class CandidateReplay:
+    """
+    The state of a candidate while it's run over the logged history.
+    """
+
+    candidate: PolicyCandidate
+    arm_ids: np.ndarray
+    n_observations: np.ndarray = field(init=False)
+    sum_rewards: np.ndarray = field(init=False)
+    sum_squared_rewards: np.ndarray = field(init=False)
+    n_events: int = 0
+    n_replay_matches: int = 0
+    replay_reward_sum: float = 0.0
+    n_ips_events: int = 0
+    ips_reward_sum: float = 0.0
+    ips_weight_sum: float = 0.0
+
+    def __post_init__(self):
+        self.bandit = create_offline_bandit(self.candidate.bandit_type, self.candidate.hyperparameters)
+        self.n_observations = np.zeros(len(self.arm_ids), dtype=np.int64)
+        self.sum_rewards = np.zeros(len(self.arm_ids), dtype=np.float64)
+        self.sum_squared_rewards = np.zeros(len(self.arm_ids), dtype=np.float64)
+
+    def replay(self, events: LoggedEvents) -> None:
+        """
+        Run the candidate over a batch of logged events, it sees their rewards once the whole batch is done.
+        The history is replayed without forgetting, the bandits for drifting rewards
+        see all matched events as if they were observed at the time of the batch.
+        """
+        now = events.event_datetimes[-1]
+        if hasattr(self.bandit, "clock"):
+            self.bandit.clock = lambda: now
+        arm_stats = get_simulated_arm_stats(
+            self.arm_ids, self.n_observations, self.sum_rewards, self.sum_squared_rewards, now
+        )
+        _, arm_indexes, probabilities = self.bandit.choose_arm_indexes_with_probabilities(arm_stats, n=len(events))
+        probabilities = probabilities[events.arm_indexes]
+
+        logged_propensity = ~np.isnan(events.propensities)
+        weights = probabilities[logged_propensity] / events.propensities[logged_propensity]
+        self.n_ips_events += int(logged_propensity.sum())
+        self.ips_reward_sum += float(np.dot(weights, events.rewards[logged_propensity]))
+        self.ips_weight_sum += float(weights.sum())
+
+        matches = np.asarray(arm_indexes) == events.arm_indexes
+        matched_arm_indexes = events.arm_indexes[matches]
+        matched_rewards = events.rewards[matches]
+        self.n_events += len(events)
+        self.n_replay_matches += int(matches.sum())
+        self.replay_reward_sum += float(matched_rewards.sum())
+        self.n_observations = self.n_observations + np.bincount(matched_arm_indexes, minlength=len(self.arm_ids))
+        self.sum_rewards = self.sum_rewards + np.bincount(
+            matched_arm_indexes, weights=matched_rewards, minlength=len(self.arm_ids)
+        )
+        self.sum_squared_rewards = self.sum_squared_rewards + np.bincount(
+            matched_arm_indexes, weights=matched_rewards ** 2, minlength=len(self.arm_ids)
+        )
+
+    def get_evaluation(self) -> PolicyEvaluation:
+        return PolicyEvaluation(
+            bandit_type=self.candidate.bandit_type,
+            hyperparameters=self.candidate.hyperparameters,
+            n_events=self.n_events,
+            n_replay_matches=self.n_replay_matches,
+            replay_reward=self.replay_reward_sum / self.n_replay_matches if self.n_replay_matches else None,
+            n_ips_events=self.n_ips_events,
+            ips_reward=self.ips_reward_sum / self.n_ips_events if self.n_ips_events else None,
+            snips_reward=self.ips_reward_sum / self.ips_weight_sum if self.ips_weight_sum else None,
+        )
+
+
+def evaluate_policies(
+    session: Session,
+    environment_id: int,
+    candidates: Sequence[PolicyCandidate],
+    chunk_size: int = default_chunk_size,
+    batch_size: int = default_batch_size,
+    missing_reward: Optional[float] = None,
+) -> List[PolicyEvaluation]:
+    """
+    Estimate the average reward per action of every candidate on the logged history of an environment,
+    in one pass over the history.
+    """
+    sql = select(Arm.arm_id).where(Arm.environment_id == environment_id).order_by(Arm.arm_id)
+    arm_ids = np.array(session.exec(sql).all(), dtype=np.int64)
+    replays = [CandidateReplay(candidate=candidate, arm_ids=arm_ids) for candidate in candidates]
+    if len(arm_ids) == 0:
+        return [replay.get_evaluation() for replay in replays]
+
+    for events in stream_logged_events(
+        session=session,
+        environment_id=environment_id,
+        arm_ids=arm_ids.tolist(),
+        chunk_size=chunk_size,
+        missing_reward=missing_reward,
+    ):
+        for start in range(0, len(events), batch_size):
+            batch = slice(start, start + batch_size)
+            batch_events = LoggedEvents(
+                arm_indexes=events.arm_indexes[batch],
+                rewards=events.rewards[batch],
+                propensities=events.propensities[batch],
+                event_datetimes=events.event_datetimes[batch],
+            )
+            for replay in replays:
+                replay.replay(batch_events)
+    log.info(f"Evaluated {len(replays)} policies on {replays[0].n_events if replays else 0} events of {environment_id=}")
+    return [replay.get_evaluation() for replay in replays]
@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Writing observations, directly or write-behind.
+
+Buffered observations are acknowledged before they're written: they wait in a bounded in-process queue,
+and a background task writes them every flush_interval_seconds, or as soon as flush_rows are waiting,
+with one bulk insert and one aggregate update per arm for each environment.
+Observations that are still queued when a worker is killed are lost, a graceful shutdown flushes them.
+An observation that can't be written is dropped and logged, without the rest of its batch.
+"""
+import asyncio
+import time
+from collections import defaultdict, deque
+from typing import Callable, Deque, Dict, List, Optional, Sequence
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from maybee_backend.config import Config
+from maybee_backend.models.core_models import (
+    Environment,
+    Observation,
+    ObservationCreate,
+    update_average_rewards_per_arm_in_batch,
+    update_windowed_rewards_per_arm,
+    bandit_types_with_reward_windows,
+)
+from maybee_backend.models.arm_stats import update_cached_arm_stats, update_cached_reward_windows
+from maybee_backend.models.bulk_insert import bulk_insert_async
+from maybee_backend.logging import log
+
+
+async def write_observations(
+    session: AsyncSession,
+    environment: Environment,
+    observations: Sequence[ObservationCreate],
+    return_ids: bool = True,
+) -> Optional[List[int]]:
+    """
+    Insert the observations of an environment in bulk and fold them into the aggregates of their arms,
+    in one transaction. The cached arm stats are updated once it's committed.
+    """
+    environment_id = environment.environment_id
+    rows = [
+        dict(environment_id=environment_id,
+             arm_id=observation.arm_id,
+             action_id=observation.action_id,
+             event_datetime=observation.event_datetime,
+             reward=observation.reward)
+        for observation in observations
+    ]
+    observation_ids = await bulk_insert_async(session=session, model=Observation, rows=rows, return_ids=return_ids)
+    avg_rewards_per_arms = await session.run_sync(
+        update_average_rewards_per_arm_in_batch, environment_id=environment_id, observations=observations, commit=False
+    )
+    windowed_rewards_per_arms = []
+    if environment.bandit_type in bandit_types_with_reward_windows:
+        windowed_rewards_per_arms = await session.run_sync(
+            update_windowed_rewards_per_arm, environment_id=environment_id, observations=observations, commit=False
+        )
+    await session.commit()
+    update_cached_arm_stats(environment_id, avg_rewards_per_arms)
+    update_cached_reward_windows(environment_id, windowed_rewards_per_arms)
+    return observation_ids
+
+
+class ObservationBuffer:
+    """
+    Bounded queue of observations that are written in the background, per worker process.
+    Observations are submitted from the event loop, so the queue needs no lock.
+    """
+
+    def __init__(
+        self,
+        max_rows: int,
+        flush_rows: int,
+        flush_interval_seconds: float,
+        clock: Callable[[], float] = time.perf_counter,
+    ):
+        self.max_rows = max_rows
+        self.flush_rows = flush_rows
+        self.flush_interval_seconds = flush_interval_seconds
+        self.clock = clock
+        self.session_factory: Optional[Callable[[], AsyncSession]] = None
+        self._pending: Deque[ObservationCreate] = deque()
+        self._flush_requested: Optional[asyncio.Event] = None
+        self._stopping = False
+        self._task: Optional[asyncio.Task] = None
+        self.n_accepted_rows = 0
+        self.n_rejected_rows = 0
+        self.n_flushed_rows = 0
+        self.n_dropped_rows = 0
+        self.n_flushes = 0
+        self.total_flush_seconds = 0.0
+        self.last_flush_seconds: Optional[float] = None
+        self.max_flush_seconds: Optional[float] = None
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    @property
+    def is_open(self) -> bool:
+        return self.session_factory is not None and not self._stopping
+
+    def open(self, session_factory: Callable[[], AsyncSession]) -> None:
+        """
+        Accept observations, to be written with sessions from session_factory when flush is called.
+        """
+        self.session_factory = session_factory
+        self._stopping = False
+
+    def start(self, session_factory: Callable[[], AsyncSession]) -> None:
+        """
+        Accept observations, and flush them from a background task on the running event loop.
+        """
+        self.open(session_factory)
+        self._flush_requested = asyncio.Event()
+        self._task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        """
+        Stop accepting observations, let the background task finish its flush, and flush what's left.
+        """
+        self._stopping = True
+        if self._task is not None:
+            self._flush_requested.set()
+            await self._task
+            self._task = None
+        await self.flush()
+        self.session_factory = None
+
+    def submit(self, observations: Sequence[ObservationCreate]) -> bool:
+        """
+        Queue observations for the next flush, all or none of them.
+        Returns False when they don't fit in the queue.
+        """
+        if not self.is_open or len(self._pending) + len(observations) > self.max_rows:
+            self.n_rejected_rows += len(observations)
+            return False
+        self._pending.extend(observations)
+        self.n_accepted_rows += len(observations)
+        if len(self._pending) >= self.flush_rows and self._flush_requested is not None:
+            self._flush_requested.set()
+        return True
+
+    async def run(self) -> None:
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._flush_requested.wait(), timeout=self.flush_interval_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_requested.clear()
+            # an unexpected error must not end the task, or nothing would be written until shutdown
+            try:
+                await self.flush()
+            except Exception as e:
+                log.exception(f"Failed to flush buffered observations: {e!r}")
+
+    async def flush(self) -> int:
+        """
+        Write everything that's queued, one transaction per environment, and return the number of rows written.
+        """
+        if not self._pending:
+            return 0
+        observations_per_environment: Dict[int, List[ObservationCreate]] = defaultdict(list)
+        while self._pending:
+            observation = self._pending.popleft()
+            observations_per_environment[observation.environment_id].append(observation)
+
+        start_time = self.clock()
+        n_flushed_rows = 0
+        for environment_id, observations in observations_per_environment.items():
+            n_flushed_rows += await self.write_environment_observations(environment_id, observations)
+
+        flush_seconds = self.clock() - start_time
+        self.n_flushed_rows += n_flushed_rows
+        self.n_flushes += 1
+        self.total_flush_seconds += flush_seconds
+        self.last_flush_seconds = flush_seconds
+        self.max_flush_seconds = max(self.max_flush_seconds or 0.0, flush_seconds)
+        log.debug(f"Flushed {n_flushed_rows} buffered observations in {flush_seconds:.3f}s")
+        return n_flushed_rows
+
+    async def write_environment_observations(self, environment_id: int, observations: List[ObservationCreate]) -> int:
+        """
+        Write the observations of an environment, and return the number of rows written.
+        A failed write is rolled back as a whole, so when it fails the observations are split in halves
+        that are written on their own, down to single rows, and only the rows that can't be written are dropped.
+        Observations of an environment that doesn't exist are all dropped.
+        """
+        try:
+            async with self.session_factory() as session:
+                environment = await session.get(Environment, environment_id)
+                if environment is None:
+                    self.n_dropped_rows += len(observations)
+                    log.error(f"Dropped {len(observations)} buffered observations of {environment_id=}: "
+                              f"the environment does not exist")
+                    return 0
+                await write_observations(session, environment, observations, return_ids=False)
+            return len(observations)
+        except Exception as e:
+            if len(observations) == 1:
+                self.n_dropped_rows += 1
+                log.error(f"Dropped a buffered observation of {environment_id=}: {observations[0]!r}, {e!r}")
+                return 0
+            log.warning(f"Failed to write {len(observations)} buffered observations of {environment_id=}, "
+                        f"writing them in halves: {e!r}")
+        middle = len(observations) // 2
+        return (await self.write_environment_observations(environment_id, observations[:middle])
+                + await self.write_environment_observations(environment_id, observations[middle:]))
+
+    def stats(self) -> dict:
+        return {
+            "is_open": self.is_open,
+            "depth": len(self._pending),
+            "max_rows": self.max_rows,
+            "accepted_rows": self.n_accepted_rows,
+            "rejected_rows": self.n_rejected_rows,
+            "flushed_rows": self.n_flushed_rows,
+            "dropped_rows": self.n_dropped_rows,
+            "flushes": self.n_flushes,
+            "last_flush_seconds": self.last_flush_seconds,
+            "max_flush_seconds": self.max_flush_seconds,
+            "mean_flush_seconds": self.total_flush_seconds / self.n_flushes if self.n_flushes else None,
+        }
+
+
+# per worker process, started by the app's lifespan when OBSERVATION_BUFFER_ENABLED is set
+observation_buffer = ObservationBuffer(
+    max_rows=Config.observation_buffer_max_rows,
+    flush_rows=Config.observation_buffer_flush_rows,
+    flush_interval_seconds=Config.observation_buffer_flush_interval_ms / 1000,
+)
@@ -4,11 +4,17 @@ from contextlib import asynccontextmanager
 import os
 from fastapi import FastAPI
 from sqlmodel import SQLModel, Session
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 from maybee_backend.api.routes import router
-from maybee_backend.database import get_engine
+from maybee_backend.config import Config
+from maybee_backend.database import init_engine, init_async_engine, dispose_engines
+from maybee_backend.ingestion import observation_buffer
 from maybee_backend.logging import log, log_level
+from maybee_backend.metrics import MetricsMiddleware
+from maybee_backend.query_profiler import QueryProfilerMiddleware, QueryProfilerMode
 from maybee_backend.setup.create_admin_user import create_admin_user
+from maybee_backend.setup.migrations import run_migrations
 from maybee_backend.simulations.simulation_environment import (
     add_simulation_environment,
 )
@@ -18,8 +24,10 @@ log.info(f"{log_level=}")
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    engine = get_engine()
+    engine = init_engine()
+    async_engine = init_async_engine()
     SQLModel.metadata.create_all(engine)
+    run_migrations(engine)
 
     init_admin_username = os.getenv("ADMIN_USERNAME", None)
     init_admin_user_password = os.getenv("ADMIN_PASSWORD", None)
@@ -40,8 +48,20 @@ async def lifespan(app: FastAPI):
         )
         if init_with_simulation_environment:
             add_simulation_environment(session=session, bandit_type="softmax")
+
+    if Config.observation_buffer_enabled:
+        observation_buffer.start(lambda: AsyncSession(async_engine, expire_on_commit=False))
     yield
+    # write the buffered observations before the connections are closed
+    if observation_buffer.is_open:
+        await observation_buffer.stop()
+    await dispose_engines()
 
 
 app = FastAPI(lifespan=lifespan)
 app.include_router(router)
+if Config.metrics_enabled:
+    app.add_middleware(MetricsMiddleware)
+query_profiler_mode = QueryProfilerMode(Config.query_profiler)
+if query_profiler_mode != QueryProfilerMode.OFF:
+    app.add_middleware(QueryProfilerMiddleware, profile_all=query_profiler_mode == QueryProfilerMode.ALL)
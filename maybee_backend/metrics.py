@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Request, database, bandit and cache metrics, rendered in the Prometheus text format at /metrics.
+
+Metrics are kept per worker process, like the caches, so each worker is scraped as its own target.
+Recording a value takes a lock and a few additions, and the cache and pool stats are only read when scraped,
+so the instrumentation stays off the hot path. The queries of a request are counted through
+SQLAlchemy's cursor events, into the RequestStats of the request found in a context variable,
+which is also seen by the sync sessions of run_sync and the thread pool.
+The same hook records the statements into the active query profiles, see query_profiler.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple, Type
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import Pool
+
+from maybee_backend.caching import named_caches
+from maybee_backend.query_profiler import record_query
+
+content_type = "text/plain; version=0.0.4; charset=utf-8"
+
+# seconds, the default buckets of the Prometheus clients
+latency_buckets = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 7.5, 10.0)
+fast_latency_buckets = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+query_count_buckets = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200)
+
+Labels = Tuple[str, ...]
+
+
+def format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    escaped = (str(value).replace("\\", r"\\").replace("\n", r"\n").replace('"', r"\"") for value in values)
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(names, escaped)) + "}"
+
+
+class Metric:
+    """
+    A metric with a value per combination of label values.
+    """
+
+    type_name = "untyped"
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+
+    def collect(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}", *self.collect()]
+
+    def clear(self) -> None:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    type_name = "counter"
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, *label_values: str, amount: float = 1) -> None:
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def get(self, *label_values: str) -> float:
+        return self._values.get(label_values, 0)
+
+    def collect(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f"{self.name}{format_labels(self.label_names, labels)} {format_value(value)}"
+                for labels, value in values]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+
+class Gauge(Counter):
+    type_name = "gauge"
+
+    def dec(self, *label_values: str, amount: float = 1) -> None:
+        self.inc(*label_values, amount=-amount)
+
+
+class Histogram(Metric):
+    """
+    Counts observations in cumulative buckets, with their sum, like a Prometheus histogram.
+    """
+
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = (),
+                 buckets: Sequence[float] = latency_buckets) -> None:
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(buckets)
+        # per label values, the count of each bucket (not cumulative, the last one is +Inf) and the sum
+        self._values: Dict[Labels, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, *label_values: str) -> None:
+        bucket = bisect_left(self.buckets, value)
+        with self._lock:
+            values = self._values.get(label_values)
+            if values is None:
+                values = self._values[label_values] = ([0] * (len(self.buckets) + 1), [0.0])
+            values[0][bucket] += 1
+            values[1][0] += value
+
+    def get_count(self, *label_values: str) -> int:
+        values = self._values.get(label_values)
+        return sum(values[0]) if values else 0
+
+    def get_sum(self, *label_values: str) -> float:
+        values = self._values.get(label_values)
+        return values[1][0] if values else 0.0
+
+    def collect(self) -> List[str]:
+        with self._lock:
+            values = sorted((labels, (list(counts), total[0])) for labels, (counts, total) in self._values.items())
+        label_names = (*self.label_names, "le")
+        lines = []
+        for labels, (counts, total) in values:
+            cumulative_count = 0
+            for upper_bound, count in zip((*self.buckets, float("inf")), counts):
+                cumulative_count += count
+                lines.append(f"{self.name}_bucket{format_labels(label_names, (*labels, format_value(upper_bound)))} "
+                             f"{cumulative_count}")
+            lines.append(f"{self.name}_sum{format_labels(self.label_names, labels)} {format_value(total)}")
+            lines.append(f"{self.name}_count{format_labels(self.label_names, labels)} {cumulative_count}")
+        return lines
+
+    def clear(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+
+class MetricsRegistry:
+    """
+    The metrics of a worker process, and collectors of the stats that are only read when scraped.
+    """
+
+    def __init__(self) -> None:
+        self.metrics: Dict[str, Metric] = {}
+        self.collectors: List[Callable[[], Iterable[Metric]]] = []
+
+    def register(self, metric: Metric) -> Metric:
+        if metric.name in self.metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, label_names: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, label_names))
+
+    def gauge(self, name: str, documentation: str, label_names: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, label_names))
+
+    def histogram(self, name: str, documentation: str, label_names: Sequence[str] = (),
+                  buckets: Sequence[float] = latency_buckets) -> Histogram:
+        return self.register(Histogram(name, documentation, label_names, buckets))
+
+    def render(self) -> str:
+        metrics = list(self.metrics.values())
+        for collector in self.collectors:
+            metrics.extend(collector())
+        return "\n".join(line for metric in metrics for line in metric.render()) + "\n"
+
+    def clear(self) -> None:
+        for metric in self.metrics.values():
+            metric.clear()
+
+
+registry = MetricsRegistry()
+
+request_duration = registry.histogram(
+    "maybee_request_duration_seconds", "Time to handle a request, until its response was sent.",
+    ("method", "route"),
+)
+requests_total = registry.counter(
+    "maybee_requests_total", "Requests handled, by status code.", ("method", "route", "status"),
+)
+requests_in_flight = registry.gauge("maybee_requests_in_flight", "Requests being handled.")
+request_db_queries = registry.histogram(
+    "maybee_request_db_queries", "Database queries per request.", ("route",), buckets=query_count_buckets,
+)
+request_db_duration = registry.histogram(
+    "maybee_request_db_duration_seconds", "Time spent in database queries per request.", ("route",),
+)
+db_queries_total = registry.counter("maybee_db_queries_total", "Database queries, in requests or not.")
+db_errors_total = registry.counter("maybee_db_errors_total", "Database queries and connections that raised an error.")
+db_pool_checkout_duration = registry.histogram(
+    "maybee_db_pool_checkout_duration_seconds", "Time to check a connection out of the pool, waits included.",
+    ("pool",), buckets=fast_latency_buckets,
+)
+choose_arm_duration = registry.histogram(
+    "maybee_choose_arm_duration_seconds", "Time a bandit took to choose arms, per call.",
+    ("bandit_type",), buckets=fast_latency_buckets,
+)
+
+
+def collect_cache_metrics() -> List[Metric]:
+    hits = Counter("maybee_cache_hits_total", "Cache lookups that found a fresh entry.", ("cache",))
+    misses = Counter("maybee_cache_misses_total", "Cache lookups that found no fresh entry.", ("cache",))
+    size = Gauge("maybee_cache_entries", "Entries in the cache, including expired ones.", ("cache",))
+    for name, cache in sorted(named_caches.items()):
+        hits.inc(name, amount=cache.hits)
+        misses.inc(name, amount=cache.misses)
+        size.inc(name, amount=len(cache))
+    return [hits, misses, size]
+
+
+registry.collectors.append(collect_cache_metrics)
+
+
+@dataclass
+class RequestStats:
+    n_queries: int = 0
+    db_seconds: float = 0.0
+
+
+request_stats: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    conn.info.setdefault("query_start_times", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    start_times = conn.info.get("query_start_times")
+    if not start_times:
+        return
+    duration = time.perf_counter() - start_times.pop()
+    db_queries_total.inc()
+    stats = request_stats.get()
+    if stats is not None:
+        stats.n_queries += 1
+        stats.db_seconds += duration
+    record_query(statement, duration, cursor.rowcount, executemany)
+
+
+@event.listens_for(Engine, "handle_error")
+def handle_error(exception_context) -> None:
+    connection = exception_context.connection
+    if connection is not None and connection.info.get("query_start_times"):
+        connection.info["query_start_times"].pop()
+    db_errors_total.inc()
+
+
+_timed_pool_classes: Dict[Type[Pool], Type[Pool]] = {}
+
+
+def get_timed_pool_class(pool_class: Type[Pool]) -> Type[Pool]:
+    """
+    A subclass of pool_class that records how long checking a connection out takes,
+    which is mostly waiting for one when the pool is exhausted.
+    """
+    if pool_class not in _timed_pool_classes:
+        def connect(self):
+            start = time.perf_counter()
+            try:
+                return pool_class.connect(self)
+            finally:
+                db_pool_checkout_duration.observe(time.perf_counter() - start, pool_class.__name__)
+
+        _timed_pool_classes[pool_class] = type(f"Timed{pool_class.__name__}", (pool_class,), {"connect": connect})
+    return _timed_pool_classes[pool_class]
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware that records the duration, status and database queries of each request,
+    per route template, so that the path parameters don't make a series per environment.
+    """
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_with_status(message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        stats = RequestStats()
+        token = request_stats.set(stats)
+        requests_in_flight.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            duration = time.perf_counter() - start
+            requests_in_flight.dec()
+            request_stats.reset(token)
+            # the router stores the route it matched in the scope
+            route = getattr(scope.get("route"), "path", "unmatched")
+            method = scope["method"]
+            request_duration.observe(duration, method, route)
+            requests_total.inc(method, route, str(status_code))
+            request_db_queries.observe(stats.n_queries, route)
+            request_db_duration.observe(stats.db_seconds, route)
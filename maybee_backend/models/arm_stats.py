@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import datetime
+from dataclasses import dataclass, field, replace
+from typing import Dict, Iterable, Optional, Tuple
+import numpy as np
+
+from maybee_backend.caching import LRUCache
+from maybee_backend.config import Config
+from maybee_backend.models import reward_decay
+
+
+@dataclass(frozen=True)
+class ArmStats:
+    """
+    The arms of an environment with their observation counts, average rewards
+    and sums of squared rewards, as arrays that share one index, for the bandits to choose from.
+    The discounted rewards and the ring buffers of windowed rewards serve the bandits for drifting rewards,
+    the ring buffers are only kept for environments that have them.
+    """
+
+    arm_ids: np.ndarray
+    n_observations: np.ndarray
+    avg_rewards: np.ndarray
+    sum_squared_rewards: np.ndarray
+    decay_epochs: np.ndarray
+    discounted_n_observations: np.ndarray
+    discounted_rewards: np.ndarray
+    positions: Dict[int, int] = field(default_factory=dict, compare=False)
+    # (arm, bucket slot) arrays
+    window_bucket_numbers: Optional[np.ndarray] = None
+    window_n_observations: Optional[np.ndarray] = None
+    window_rewards: Optional[np.ndarray] = None
+    # values that are costly to derive from these stats, kept per bandit, the copies made by updates start empty
+    derived: Dict[str, np.ndarray] = field(default_factory=dict, init=False, compare=False, repr=False)
+
+    @classmethod
+    def from_rows(cls, rows: Iterable, window_rows: Iterable = ()) -> "ArmStats":
+        """
+        Build from rows with the columns of AvgRewardsPerArm, and optionally WindowedRewardsPerArm rows.
+        Missing values are read as zeros.
+        """
+        rows = list(rows)
+        arm_ids = np.array([row.arm_id for row in rows], dtype=np.int64)
+        arm_stats = cls(
+            arm_ids=arm_ids,
+            n_observations=np.array([row.n_observations or 0 for row in rows], dtype=np.int64),
+            avg_rewards=np.array([row.avg_reward or 0.0 for row in rows], dtype=np.float64),
+            sum_squared_rewards=np.array([row.sum_squared_reward or 0.0 for row in rows], dtype=np.float64),
+            decay_epochs=np.array([row.decay_epoch or 0 for row in rows], dtype=np.int64),
+            discounted_n_observations=np.array([row.discounted_n_observations or 0.0 for row in rows], dtype=np.float64),
+            discounted_rewards=np.array([row.discounted_reward or 0.0 for row in rows], dtype=np.float64),
+            positions={int(arm_id): position for position, arm_id in enumerate(arm_ids)},
+        )
+        window_rows = [row for row in window_rows if row.arm_id in arm_stats.positions]
+        if window_rows:
+            arm_stats = arm_stats.with_window_updates(window_rows)
+        return arm_stats
+
+    def __len__(self) -> int:
+        return len(self.arm_ids)
+
+    def with_updates(self, rows: Iterable) -> Optional["ArmStats"]:
+        """
+        Return a copy with the values of the given AvgRewardsPerArm rows.
+        The cached arrays are never changed in place, as a bandit may be reading them.
+        Returns None if a row belongs to an arm that isn't known yet.
+        """
+        n_observations = self.n_observations.copy()
+        avg_rewards = self.avg_rewards.copy()
+        sum_squared_rewards = self.sum_squared_rewards.copy()
+        decay_epochs = self.decay_epochs.copy()
+        discounted_n_observations = self.discounted_n_observations.copy()
+        discounted_rewards = self.discounted_rewards.copy()
+        for row in rows:
+            position = self.positions.get(row.arm_id)
+            if position is None:
+                return None
+            n_observations[position] = row.n_observations or 0
+            avg_rewards[position] = row.avg_reward or 0.0
+            sum_squared_rewards[position] = row.sum_squared_reward or 0.0
+            decay_epochs[position] = row.decay_epoch or 0
+            discounted_n_observations[position] = row.discounted_n_observations or 0.0
+            discounted_rewards[position] = row.discounted_reward or 0.0
+        return replace(
+            self,
+            n_observations=n_observations,
+            avg_rewards=avg_rewards,
+            sum_squared_rewards=sum_squared_rewards,
+            decay_epochs=decay_epochs,
+            discounted_n_observations=discounted_n_observations,
+            discounted_rewards=discounted_rewards,
+        )
+
+    def with_window_updates(self, window_rows: Iterable) -> Optional["ArmStats"]:
+        """
+        Return a copy with the time buckets of the given WindowedRewardsPerArm rows.
+        Returns None if a row belongs to an arm that isn't known yet.
+        """
+        shape = (len(self), reward_decay.reward_window_buckets)
+        if self.window_bucket_numbers is None or self.window_bucket_numbers.shape != shape:
+            window_bucket_numbers = np.full(shape, -1, dtype=np.int64)
+            window_n_observations = np.zeros(shape, dtype=np.int64)
+            window_rewards = np.zeros(shape, dtype=np.float64)
+        else:
+            window_bucket_numbers = self.window_bucket_numbers.copy()
+            window_n_observations = self.window_n_observations.copy()
+            window_rewards = self.window_rewards.copy()
+        for row in window_rows:
+            position = self.positions.get(row.arm_id)
+            if position is None:
+                return None
+            slot = row.bucket_slot % shape[1]
+            if row.bucket_number >= window_bucket_numbers[position, slot]:
+                window_bucket_numbers[position, slot] = row.bucket_number
+                window_n_observations[position, slot] = row.n_observations
+                window_rewards[position, slot] = row.sum_reward
+        return replace(
+            self,
+            window_bucket_numbers=window_bucket_numbers,
+            window_n_observations=window_n_observations,
+            window_rewards=window_rewards,
+        )
+
+    def discounted(self, now: datetime.datetime) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Discounted observation counts and average rewards of the arms at time now.
+        """
+        decay_factors = reward_decay.get_decay_factors(self.decay_epochs, now)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            avg_rewards = np.where(
+                self.discounted_n_observations > 0,
+                self.discounted_rewards / self.discounted_n_observations,
+                0.0,
+            )
+        return self.discounted_n_observations * decay_factors, avg_rewards
+
+    def windowed(self, now: datetime.datetime) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Observation counts and average rewards of the arms within the sliding window that ends at now.
+        """
+        if self.window_bucket_numbers is None:
+            return np.zeros(len(self), dtype=np.int64), np.zeros(len(self), dtype=np.float64)
+        in_window = self.window_bucket_numbers >= reward_decay.get_oldest_bucket_number(now)
+        n_observations = np.where(in_window, self.window_n_observations, 0).sum(axis=1)
+        sum_rewards = np.where(in_window, self.window_rewards, 0.0).sum(axis=1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            avg_rewards = np.where(n_observations > 0, sum_rewards / n_observations, 0.0)
+        return n_observations, avg_rewards
+
+
+# arm stats per environment_id, per worker process
+arm_stats_cache = LRUCache(
+    maxsize=Config.arm_stats_cache_size,
+    ttl_seconds=Config.arm_stats_cache_ttl_seconds,
+    name="arm_stats",
+)
+
+
+def update_cached_arm_stats(environment_id: int, avg_rewards_per_arms: Iterable) -> None:
+    """
+    Write through committed AvgRewardsPerArm rows to the cached stats of their environment.
+    """
+    arm_stats_cache.replace(
+        environment_id, lambda arm_stats: arm_stats.with_updates(avg_rewards_per_arms)
+    )
+
+
+def update_cached_reward_windows(environment_id: int, windowed_rewards_per_arms: Iterable) -> None:
+    """
+    Write through committed WindowedRewardsPerArm rows to the cached stats of their environment.
+    """
+    windowed_rewards_per_arms = list(windowed_rewards_per_arms)
+    if not windowed_rewards_per_arms:
+        return
+    arm_stats_cache.replace(
+        environment_id, lambda arm_stats: arm_stats.with_window_updates(windowed_rewards_per_arms)
+    )
+
+
+def invalidate_cached_arm_stats(environment_id: int) -> None:
+    """
+    Drop the cached stats of an environment, e.g. after its arms changed.
+    """
+    arm_stats_cache.invalidate(environment_id)
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import csv
+import io
+from typing import Dict, List, Optional, Tuple, Type
+
+from sqlalchemy import insert
+from sqlmodel import SQLModel, Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+
+def get_bulk_insert_sql(model: Type[SQLModel], dialect_name: str, return_ids: bool):
+    """
+    Core insert, optionally returning the primary keys of the inserted rows.
+    Executed with a list of rows, SQLAlchemy batches it into multi-row inserts.
+    """
+    table = model.__table__
+    if not return_ids:
+        return insert(table)
+    primary_key_column = table.primary_key.columns[0]
+    if dialect_name == "sqlite":
+        # asking sqlite for ids in parameter order makes SQLAlchemy insert row by row,
+        # see sort_ids_in_insert_order for why that isn't needed
+        return insert(table).returning(primary_key_column)
+    return insert(table).returning(primary_key_column, sort_by_parameter_order=True)
+
+
+def sort_ids_in_insert_order(ids: List[int], dialect_name: str) -> List[int]:
+    """
+    Sqlite serializes writes and hands out increasing rowids within a transaction,
+    so sorting the returned ids puts them in the order of the inserted rows.
+    """
+    if dialect_name == "sqlite":
+        return sorted(ids)
+    return ids
+
+
+def get_id_ranges(ids: List[int]) -> List[Tuple[int, int]]:
+    """
+    Compress a list of ids into (first, last) ranges of consecutive ids.
+    """
+    id_ranges = []
+    for id in ids:
+        if id_ranges and id == id_ranges[-1][1] + 1:
+            id_ranges[-1] = (id_ranges[-1][0], id)
+        else:
+            id_ranges.append((id, id))
+    return id_ranges
+
+
+def bulk_insert(
+    session: Session, model: Type[SQLModel], rows: List[Dict], return_ids: bool = True
+) -> Optional[List[int]]:
+    """
+    Insert rows without building ORM objects.
+    On postgres, rows are streamed with COPY when their ids aren't needed.
+    """
+    if not rows:
+        return [] if return_ids else None
+    table = model.__table__
+    connection = session.connection()
+    if not return_ids and connection.dialect.driver == "psycopg2":
+        columns = list(rows[0])
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerows([row[column] for column in columns] for row in rows)
+        buffer.seek(0)
+        cursor = connection.connection.cursor()
+        cursor.copy_expert(
+            f"COPY {table.name} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buffer
+        )
+        return None
+    dialect_name = connection.dialect.name
+    result = session.exec(get_bulk_insert_sql(model, dialect_name, return_ids), params=rows)
+    if not return_ids:
+        return None
+    return sort_ids_in_insert_order(list(result.scalars().all()), dialect_name)
+
+
+async def bulk_insert_async(
+    session: AsyncSession, model: Type[SQLModel], rows: List[Dict], return_ids: bool = True
+) -> Optional[List[int]]:
+    """
+    Async version of bulk_insert, using asyncpg's binary COPY on postgres.
+    """
+    if not rows:
+        return [] if return_ids else None
+    table = model.__table__
+    connection = await session.connection()
+    if not return_ids and connection.dialect.driver == "asyncpg":
+        columns = list(rows[0])
+        raw_connection = await connection.get_raw_connection()
+        await raw_connection.driver_connection.copy_records_to_table(
+            table.name,
+            records=[tuple(row[column] for column in columns) for row in rows],
+            columns=columns,
+        )
+        return None
+    dialect_name = connection.dialect.name
+    result = await session.exec(get_bulk_insert_sql(model, dialect_name, return_ids), params=rows)
+    if not return_ids:
+        return None
+    return sort_ids_in_insert_order(list(result.scalars().all()), dialect_name)
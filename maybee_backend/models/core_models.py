@@ -4,21 +4,45 @@ from sqlmodel import (
     Field,
     SQLModel,
     CheckConstraint,
+    Index,
     select,
     Relationship,
     Session,
 )
 
+from sqlalchemy import Float, case, func, literal
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
 import datetime
-from typing import Optional, List, Tuple
+from collections import defaultdict
+from typing import Dict, Optional, List, Tuple
 import numpy as np
 from enum import Enum
 
+from maybee_backend.models.arm_stats import ArmStats, update_cached_arm_stats, update_cached_reward_windows
+from maybee_backend.models import reward_decay
+from maybee_backend.models.reward_decay import DiscountedRewards, discount_rewards, get_bucket_number
+from maybee_backend.logging import log
+
 
 class EnvironmentBanditConfig(str, Enum):
     SOFTMAX = "softmax"
     EPSILON_GREEDY = "epsilon_greedy"
     UCB1 = "ucb1"
+    THOMPSON_SAMPLING = "thompson_sampling"
+    GAUSSIAN_THOMPSON_SAMPLING = "gaussian_thompson_sampling"
+    DISCOUNTED_UCB = "discounted_ucb"
+    DISCOUNTED_SOFTMAX = "discounted_softmax"
+    SLIDING_WINDOW_UCB = "sliding_window_ucb"
+    SLIDING_WINDOW_SOFTMAX = "sliding_window_softmax"
+
+
+# bandits that choose from the rewards in a sliding window, kept in WindowedRewardsPerArm
+bandit_types_with_reward_windows = {
+    EnvironmentBanditConfig.SLIDING_WINDOW_UCB,
+    EnvironmentBanditConfig.SLIDING_WINDOW_SOFTMAX,
+}
 
 
 class Environment(SQLModel, table=True):
@@ -51,6 +75,10 @@ class Environment(SQLModel, table=True):
         back_populates="environment", cascade_delete=True
     )
 
+    windowed_rewards_per_arm: List["WindowedRewardsPerArm"] = Relationship(
+        back_populates="environment", cascade_delete=True
+    )
+
 
 class BanditState(Enum):
     TESTMODE = "TESTMODE"
@@ -103,6 +131,10 @@ class Arm(SQLModel, table=True):
         back_populates="arm", cascade_delete=True
     )
 
+    windowed_rewards_per_arm: List["WindowedRewardsPerArm"] = Relationship(
+        back_populates="arm", cascade_delete=True
+    )
+
     def pull(
         self,
         session: Session,
@@ -115,10 +147,10 @@ class Arm(SQLModel, table=True):
         Generate an action and a observation with a reward of 0.0 or 1.0
         with probability self.population_p_success
         """
-        sql = select(Environment.is_simulation_environment).where(
+        sql = select(Environment.is_simulation_environment, Environment.bandit_type).where(
             Environment.environment_id == self.environment_id
         )
-        is_simulation_environment = session.exec(sql).first()
+        is_simulation_environment, bandit_type = session.exec(sql).first() or (False, None)
         if not is_simulation_environment:
             raise ValueError("environment is not a simulation environment")
         if not self.population_p_success:
@@ -146,7 +178,9 @@ class Arm(SQLModel, table=True):
         session.add(observation)
         session.commit()
 
-        update_average_rewards_per_arm(session=session, environment_id=self.environment_id, arm_id=self.arm_id, n_new_observations=1, avg_reward_of_new_observations=reward)
+        update_average_rewards_per_arm(session=session, environment_id=self.environment_id, arm_id=self.arm_id, n_new_observations=1, avg_reward_of_new_observations=float(reward))
+        if bandit_type in bandit_types_with_reward_windows:
+            update_windowed_rewards_per_arm(session=session, environment_id=self.environment_id, observations=[observation])
 
 
 class Action(SQLModel, table=True):
@@ -154,6 +188,12 @@ class Action(SQLModel, table=True):
     Represents the choice of a particular arm within a particular environment.
     """
 
+    __table_args__ = (
+        Index("ix_action_environment_id_arm_id", "environment_id", "arm_id"),
+        # serves keyset pagination on (event_datetime, action_id)
+        Index("ix_action_environment_id_event_datetime_action_id", "environment_id", "event_datetime", "action_id"),
+    )
+
     action_id: int | None = Field(default=None, primary_key=True)
     environment_id: int | None = Field(
         default=None, foreign_key="environment.environment_id"
@@ -161,6 +201,10 @@ class Action(SQLModel, table=True):
     arm_id: int | None = Field(default=None, foreign_key="arm.arm_id")
     event_datetime: datetime.datetime = Field(default_factory=datetime.datetime.now)
     bandit_state: str
+    # probability the bandit had of choosing this arm, for off-policy evaluation
+    propensity: Optional[float] = Field(default=None)
+    # version of the policy snapshot the arm was chosen from, for actions chosen by clients
+    policy_version: Optional[str] = Field(default=None)
 
     # relationships where this is the child
     environment: Environment | None = Relationship(back_populates="actions")
@@ -178,6 +222,15 @@ class Observation(SQLModel, table=True):
     May or may not come with a reward.
     """
 
+    __table_args__ = (
+        Index("ix_observation_environment_id_arm_id", "environment_id", "arm_id"),
+        Index(
+            "ix_observation_environment_id_event_datetime_observation_id",
+            "environment_id", "event_datetime", "observation_id",
+        ),
+        Index("ix_observation_action_id", "action_id"),
+    )
+
     observation_id: int | None = Field(default=None, primary_key=True)
     environment_id: int | None = Field(
         default=None, foreign_key="environment.environment_id"
@@ -203,23 +256,166 @@ class ObservationCreate(SQLModel, table=False):
     reward: float
 
 
+class ActionBatchResponse(SQLModel, table=False):
+    """
+    Response to a batch of actions, with one list per column rather than one object per action.
+    """
+
+    n_actions: int
+    action_ids: List[int]
+    arm_ids: List[Optional[int]]
+    bandit_states: List[str]
+
+
+class ActionReport(SQLModel, table=False):
+    """
+    An action that a client chose from a policy snapshot, with its reward if that's known when it's reported.
+    """
+
+    arm_id: int
+    event_datetime: datetime.datetime = Field(default_factory=datetime.datetime.now)
+    bandit_state: str
+    propensity: Optional[float] = None
+    policy_version: str
+    reward: Optional[float] = None
+
+
+class ObservationBatchResponse(SQLModel, table=False):
+    """
+    Compact response to a batch of observations, that doesn't echo the rows.
+    """
+
+    n_observations: int
+    observation_id_ranges: Optional[List[Tuple[int, int]]] = None
+
+
 class AvgRewardsPerArm(SQLModel, table=True):
+    # a unique index rather than a constraint, so it can be added to existing tables
+    __table_args__ = (
+        Index("ix_avgrewardsperarm_environment_id_arm_id", "environment_id", "arm_id", unique=True),
+    )
+
     avg_rewards_per_arm_id: int | None = Field(default=None, primary_key=True)
     environment_id: int | None = Field(default=None, foreign_key="environment.environment_id")
     arm_id: int | None = Field(default=None, foreign_key="arm.arm_id")
     n_observations: Optional[int]
     avg_reward: Optional[float]
+    # with n_observations and avg_reward, the sufficient statistics of the gaussian thompson sampling posterior
+    sum_squared_reward: Optional[float] = None
+    # discounted count and sum of rewards, relative to the start of decay_epoch, see reward_decay
+    decay_epoch: Optional[int] = None
+    discounted_n_observations: Optional[float] = None
+    discounted_reward: Optional[float] = None
 
     # relationships where this is the child
     environment: Environment | None = Relationship(back_populates="avg_rewards_per_arm")
     arm: Arm | None = Relationship(back_populates="avg_rewards_per_arm")
 
 
+class WindowedRewardsPerArm(SQLModel, table=True):
+    """
+    One slot of the ring buffer of time buckets that holds the recent rewards of an arm,
+    for the sliding window bandits.
+    """
+
+    __table_args__ = (
+        Index(
+            "ix_windowedrewardsperarm_environment_id_arm_id_bucket_slot",
+            "environment_id", "arm_id", "bucket_slot", unique=True,
+        ),
+    )
+
+    windowed_rewards_per_arm_id: int | None = Field(default=None, primary_key=True)
+    environment_id: int | None = Field(default=None, foreign_key="environment.environment_id")
+    arm_id: int | None = Field(default=None, foreign_key="arm.arm_id")
+    bucket_slot: int
+    bucket_number: int
+    n_observations: int
+    sum_reward: float
+
+    # relationships where this is the child
+    environment: Environment | None = Relationship(back_populates="windowed_rewards_per_arm")
+    arm: Arm | None = Relationship(back_populates="windowed_rewards_per_arm")
+
+
+class PolicyCandidate(SQLModel, table=False):
+    """
+    A bandit type with hyperparameters, to evaluate on the logged actions and observations of an environment.
+    Hyperparameters that aren't given keep the bandit's defaults.
+    """
+
+    bandit_type: EnvironmentBanditConfig
+    hyperparameters: Dict[str, float] = Field(default_factory=dict)
+
+
+class PolicyEvaluation(SQLModel, table=False):
+    """
+    Estimated average reward per action of a candidate policy on logged history.
+    The replay estimate averages the rewards of the logged actions the policy would have chosen as well,
+    inverse propensity scoring (ips) reweighs all actions with a logged propensity,
+    and its self-normalized variant (snips) trades a little bias for less variance.
+    """
+
+    bandit_type: EnvironmentBanditConfig
+    hyperparameters: Dict[str, float]
+    n_events: int
+    n_replay_matches: int
+    replay_reward: Optional[float] = None
+    n_ips_events: int
+    ips_reward: Optional[float] = None
+    snips_reward: Optional[float] = None
+
+
+class PolicySnapshot(SQLModel, table=False):
+    """
+    The bandit type and arm stats of an environment, for clients to choose arms from without a request per choice.
+    The version changes whenever the arm stats do. The probabilities are those of the next choice
+    when the snapshot was taken, they're the propensities of the choices made from it.
+    Window arrays hold a row per arm, and are only given for the sliding window bandits.
+    """
+
+    environment_id: int
+    bandit_type: EnvironmentBanditConfig
+    version: str
+    snapshot_datetime: datetime.datetime
+    arm_ids: List[int]
+    n_observations: List[int]
+    avg_rewards: List[float]
+    sum_squared_rewards: List[float]
+    decay_epochs: List[int]
+    discounted_n_observations: List[float]
+    discounted_rewards: List[float]
+    window_bucket_numbers: Optional[List[List[int]]] = None
+    window_n_observations: Optional[List[List[int]]] = None
+    window_rewards: Optional[List[List[float]]] = None
+    probabilities: List[float]
+
+
+class AvgRewardsPerArmResponse(SQLModel, table=False):
+    """
+    AvgRewardsPerArm, with the posterior parameters of the arm for bandits that keep a posterior.
+    """
+
+    avg_rewards_per_arm_id: int | None = None
+    environment_id: int | None = None
+    arm_id: int | None = None
+    n_observations: Optional[int] = None
+    avg_reward: Optional[float] = None
+    sum_squared_reward: Optional[float] = None
+    decay_epoch: Optional[int] = None
+    discounted_n_observations: Optional[float] = None
+    discounted_reward: Optional[float] = None
+    posterior: Optional[Dict[str, float]] = None
+
+
 class Bandit:
     """
     Superclass for multi armed bandit.
+    Subclasses choose from given arm stats, loading the stats and environments without arms are handled here.
     """
 
+    name = "multi armed"
+
     def __init__(self, environment_id, session: Session):
         self.environment_id = environment_id
         self.session = session
@@ -233,20 +429,189 @@ class Bandit:
         arms = self.session.exec(sql).all()
         return arms
 
-    def choose_arm(self) -> Tuple[BanditState, int]:
+    def get_arm_stats(self) -> ArmStats:
+        """
+        The arm stats of the bandit's environment, from the cache of this worker if they're fresh.
+        """
+        # imported here, the module imports this one
+        from maybee_backend.models.get_average_rewards_per_arm import get_arm_stats
+
+        return get_arm_stats(session=self.session, environment_id=self.environment_id)
+
+    def warn_no_arms_available(self) -> None:
+        log.warning(f"Failed to choose arms with {self.name} bandit: {self.environment_id=} (no arms available)")
+
+    def choose_arm(self) -> Tuple[BanditState, Optional[int]]:
+        """
+        Make one choice from the current arm stats,
+        NO_ARMS_AVAILABLE without an arm if the environment has none.
+        """
+        arm_stats = self.get_arm_stats()
+        if len(arm_stats) == 0:
+            self.warn_no_arms_available()
+            return BanditState.NO_ARMS_AVAILABLE, None
+        bandit_state, arm_index = self.choose_arm_index(arm_stats)
+        arm_id = int(arm_stats.arm_ids[arm_index])
+        log.debug(f"Chose arm with {self.name} bandit: {arm_id=} {bandit_state=}")
+        return bandit_state, arm_id
+
+    def choose_arms(self, n: int) -> Tuple[List[BanditState], List[Optional[int]]]:
+        """
+        Make n choices from one snapshot of the arm stats,
+        NO_ARMS_AVAILABLE without arms if the environment has none.
+        """
+        arm_stats = self.get_arm_stats()
+        if len(arm_stats) == 0:
+            self.warn_no_arms_available()
+            return [BanditState.NO_ARMS_AVAILABLE] * n, [None] * n
+        bandit_states, arm_indexes = self.choose_arm_indexes(arm_stats, n=n)
+        arm_ids = arm_stats.arm_ids[arm_indexes].tolist()
+        log.debug(f"Chose {n} arms with {self.name} bandit: {arm_ids[:10]=}")
+        return bandit_states, arm_ids
+
+    def choose_arm_index(self, arm_stats: ArmStats) -> Tuple[BanditState, int]:
+        """
+        Make one choice from the given arm stats, which have at least one arm.
+        Bandits with a cheaper single choice than a batch of one override this.
+        """
+        bandit_states, arm_indexes = self.choose_arm_indexes(arm_stats, n=1)
+        return bandit_states[0], int(arm_indexes[0])
+
+    def choose_arm_indexes(self, arm_stats: ArmStats, n: int) -> Tuple[List[BanditState], np.ndarray]:
+        """
+        Make n choices from the given arm stats, as positions in its arrays.
+        The simulations call this with arm stats they keep in memory.
+        """
         raise NotImplementedError
 
+    def get_arm_probabilities(self, arm_stats: ArmStats) -> np.ndarray:
+        """
+        The probability of every arm to be chosen next, given the arm stats.
+        """
+        raise NotImplementedError
+
+    def choose_arm_indexes_with_probabilities(
+        self, arm_stats: ArmStats, n: int
+    ) -> Tuple[List[BanditState], np.ndarray, np.ndarray]:
+        """
+        Make n choices from the given arm stats, with the probability of every arm to be chosen.
+        Bandits that estimate the probabilities from their draws override this to share them with the choices.
+        """
+        bandit_states, arm_indexes = self.choose_arm_indexes(arm_stats, n=n)
+        return bandit_states, arm_indexes, self.get_arm_probabilities(arm_stats)
+
+    def choose_arms_with_propensities(
+        self, arm_stats: ArmStats, n: int
+    ) -> Tuple[List[BanditState], List[Optional[int]], List[Optional[float]]]:
+        """
+        Make n choices from the given arm stats, with the probability the bandit had of making each,
+        to log with the actions for the evaluation of other policies on them.
+        """
+        if len(arm_stats) == 0:
+            self.warn_no_arms_available()
+            return [BanditState.NO_ARMS_AVAILABLE] * n, [None] * n, [None] * n
+        bandit_states, arm_indexes, probabilities = self.choose_arm_indexes_with_probabilities(arm_stats, n=n)
+        return bandit_states, arm_stats.arm_ids[arm_indexes].tolist(), probabilities[arm_indexes].tolist()
+
+
+# dialect specific inserts that support ON CONFLICT ... DO UPDATE
+upsert_insert_functions = {
+    "postgresql": postgresql_insert,
+    "sqlite": sqlite_insert,
+}
+
+
+def get_update_average_rewards_per_arm_sql(
+    dialect_name: str,
+    environment_id: int,
+    arm_id: int,
+    n_new_observations: int,
+    avg_reward_of_new_observations: float,
+    sum_squared_reward_of_new_observations: float,
+    discounted_rewards: DiscountedRewards,
+):
+    """
+    Build a single upsert that folds new observations into the running mean, count
+    and sum of squared rewards of an arm.
+    The new values are computed by the database from the values in the row,
+    so concurrent updates to the same arm can't overwrite each other.
+    """
+    if dialect_name not in upsert_insert_functions:
+        raise ValueError(f"Updating average rewards is not supported for database dialect {dialect_name}")
+    insert = upsert_insert_functions[dialect_name]
+
+    avg_rewards_per_arm_table = AvgRewardsPerArm.__table__
+    n_observations = func.coalesce(avg_rewards_per_arm_table.c.n_observations, 0)
+    avg_reward = func.coalesce(avg_rewards_per_arm_table.c.avg_reward, 0.0)
+    sum_squared_reward = func.coalesce(avg_rewards_per_arm_table.c.sum_squared_reward, 0.0)
+    sum_of_new_rewards = literal(n_new_observations * avg_reward_of_new_observations, Float)
+    sum_of_new_squared_rewards = literal(sum_squared_reward_of_new_observations, Float)
+
+    # the new discounted sums are relative to their own decay epoch, the sums in the row to the row's.
+    # Whichever is older is scaled to the newer epoch, sums that are more than an epoch behind have decayed to 0.
+    decay_epoch = avg_rewards_per_arm_table.c.decay_epoch
+    new_decay_epoch = discounted_rewards.decay_epoch
+
+    def add_discounted(column, new_value: float):
+        value = func.coalesce(column, 0.0)
+        new_value = literal(new_value, Float)
+        return case(
+            (decay_epoch == new_decay_epoch, value + new_value),
+            (decay_epoch == new_decay_epoch - 1, value * reward_decay.epoch_scale + new_value),
+            (decay_epoch == new_decay_epoch + 1, value + new_value * reward_decay.epoch_scale),
+            (decay_epoch > new_decay_epoch + 1, value),
+            else_=new_value,
+        )
+
+    return (
+        insert(AvgRewardsPerArm)
+        .values(
+            environment_id=environment_id,
+            arm_id=arm_id,
+            n_observations=n_new_observations,
+            avg_reward=avg_reward_of_new_observations,
+            sum_squared_reward=sum_squared_reward_of_new_observations,
+            decay_epoch=new_decay_epoch,
+            discounted_n_observations=discounted_rewards.n_observations,
+            discounted_reward=discounted_rewards.reward,
+        )
+        .on_conflict_do_update(
+            index_elements=["environment_id", "arm_id"],
+            set_={
+                "n_observations": n_observations + n_new_observations,
+                "avg_reward": (avg_reward * n_observations + sum_of_new_rewards)
+                / (n_observations + n_new_observations),
+                "sum_squared_reward": sum_squared_reward + sum_of_new_squared_rewards,
+                "decay_epoch": case((decay_epoch > new_decay_epoch, decay_epoch), else_=new_decay_epoch),
+                "discounted_n_observations": add_discounted(
+                    avg_rewards_per_arm_table.c.discounted_n_observations, discounted_rewards.n_observations
+                ),
+                "discounted_reward": add_discounted(
+                    avg_rewards_per_arm_table.c.discounted_reward, discounted_rewards.reward
+                ),
+            },
+        )
+        .returning(AvgRewardsPerArm)
+    )
+
 
 def update_average_rewards_per_arm(
     session: Session,
     environment_id: int,
     arm_id: int,
     n_new_observations: int,
-    avg_reward_of_new_observations: float
+    avg_reward_of_new_observations: float,
+    commit: bool = True,
+    sum_squared_reward_of_new_observations: Optional[float] = None,
+    discounted_rewards: Optional[DiscountedRewards] = None,
 ) -> AvgRewardsPerArm:
     """
     Given some amount of new observations with an average reward,
-    update the n_observations and average reward in AvgRewardsPerArm table
+    update the n_observations and average reward in AvgRewardsPerArm table.
+    The sum of squared rewards and the discounted rewards default to those of
+    n observations made now that all have the average reward, which is exact for a single observation.
+    Pass commit=False to make the update part of a larger transaction,
+    the caller then writes the result through to the arm stats cache after committing.
     """
     if not isinstance(n_new_observations, int):
         raise ValueError(f"n_new_observations must be of type int, received type {type(n_new_observations)}")
@@ -256,28 +621,160 @@ def update_average_rewards_per_arm(
 
     if not isinstance(avg_reward_of_new_observations, float):
         raise ValueError(f"avg_reward_of_new_observations has to be of type float, received type {type(avg_reward_of_new_observations)}")
-    
-    sql = select(AvgRewardsPerArm).where(AvgRewardsPerArm.environment_id == environment_id).where(AvgRewardsPerArm.arm_id == arm_id)
-    avg_rewards_per_arm = session.exec(sql).first()
-
-    # if the object doesnt exist in the db yet, create a new one
-    if not avg_rewards_per_arm:
-        avg_rewards_per_arm = AvgRewardsPerArm(environment_id=environment_id,
-                                               arm_id=arm_id,
-                                            n_observations=n_new_observations, 
-                                            avg_reward=avg_reward_of_new_observations)
-    else: # the object already exists
-        if avg_rewards_per_arm.n_observations == 0:
-            avg_rewards_per_arm.n_observations = n_new_observations
-            avg_rewards_per_arm.avg_reward = avg_reward_of_new_observations
-        else:
-            avg_rewards_per_arm.n_observations += n_new_observations
-            avg_rewards_per_arm.avg_reward = (
-                (avg_rewards_per_arm.avg_reward * (avg_rewards_per_arm.n_observations - n_new_observations)) + 
-                (avg_reward_of_new_observations * n_new_observations)
-            ) / avg_rewards_per_arm.n_observations
-    
-    session.add(avg_rewards_per_arm)
-    session.commit()
-    session.refresh(avg_rewards_per_arm)
+
+    if sum_squared_reward_of_new_observations is None:
+        sum_squared_reward_of_new_observations = n_new_observations * avg_reward_of_new_observations ** 2
+
+    if discounted_rewards is None:
+        discounted_rewards = discount_rewards(
+            rewards=[avg_reward_of_new_observations] * n_new_observations,
+            event_datetimes=[datetime.datetime.now()] * n_new_observations,
+        )
+
+    sql = get_update_average_rewards_per_arm_sql(
+        dialect_name=session.get_bind().dialect.name,
+        environment_id=environment_id,
+        arm_id=arm_id,
+        n_new_observations=n_new_observations,
+        avg_reward_of_new_observations=avg_reward_of_new_observations,
+        sum_squared_reward_of_new_observations=float(sum_squared_reward_of_new_observations),
+        discounted_rewards=discounted_rewards,
+    )
+    avg_rewards_per_arm = session.exec(
+        sql, execution_options={"populate_existing": True}
+    ).scalars().one()
+
+    if commit:
+        session.commit()
+        update_cached_arm_stats(environment_id, [avg_rewards_per_arm])
     return avg_rewards_per_arm
+
+
+def update_average_rewards_per_arm_in_batch(
+    session: Session,
+    environment_id: int,
+    observations: List["Observation"],
+    commit: bool = True,
+) -> List[AvgRewardsPerArm]:
+    """
+    Fold a batch of observations into AvgRewardsPerArm,
+    with one update per arm rather than one per observation.
+    """
+    rewards_per_arm = defaultdict(list)
+    event_datetimes_per_arm = defaultdict(list)
+    for observation in observations:
+        if observation.arm_id is not None:
+            rewards_per_arm[observation.arm_id].append(observation.reward)
+            event_datetimes_per_arm[observation.arm_id].append(observation.event_datetime)
+
+    # update the arms in a fixed order, so concurrent batches can't deadlock each other
+    avg_rewards_per_arms = [
+        update_average_rewards_per_arm(
+            session=session,
+            environment_id=environment_id,
+            arm_id=arm_id,
+            n_new_observations=len(rewards_per_arm[arm_id]),
+            avg_reward_of_new_observations=float(np.mean(rewards_per_arm[arm_id])),
+            sum_squared_reward_of_new_observations=float(np.sum(np.square(rewards_per_arm[arm_id]))),
+            discounted_rewards=discount_rewards(rewards_per_arm[arm_id], event_datetimes_per_arm[arm_id]),
+            commit=False,
+        )
+        for arm_id in sorted(rewards_per_arm)
+    ]
+    if commit:
+        session.commit()
+        update_cached_arm_stats(environment_id, avg_rewards_per_arms)
+    return avg_rewards_per_arms
+
+
+def get_update_windowed_rewards_per_arm_sql(
+    dialect_name: str,
+    environment_id: int,
+    arm_id: int,
+    bucket_number: int,
+    n_new_observations: int,
+    sum_of_new_rewards: float,
+):
+    """
+    Build a single upsert that adds new observations to the time bucket they fall in.
+    A slot that still holds an older bucket is reset, observations for a bucket
+    that has already been replaced by a newer one are dropped.
+    """
+    if dialect_name not in upsert_insert_functions:
+        raise ValueError(f"Updating windowed rewards is not supported for database dialect {dialect_name}")
+    insert = upsert_insert_functions[dialect_name]
+
+    windowed_rewards_per_arm_table = WindowedRewardsPerArm.__table__
+    stored_bucket_number = windowed_rewards_per_arm_table.c.bucket_number
+
+    def add_to_bucket(column, new_value):
+        return case(
+            (stored_bucket_number == bucket_number, column + new_value),
+            (stored_bucket_number > bucket_number, column),
+            else_=new_value,
+        )
+
+    return (
+        insert(WindowedRewardsPerArm)
+        .values(
+            environment_id=environment_id,
+            arm_id=arm_id,
+            bucket_slot=bucket_number % reward_decay.reward_window_buckets,
+            bucket_number=bucket_number,
+            n_observations=n_new_observations,
+            sum_reward=sum_of_new_rewards,
+        )
+        .on_conflict_do_update(
+            index_elements=["environment_id", "arm_id", "bucket_slot"],
+            set_={
+                "bucket_number": case(
+                    (stored_bucket_number > bucket_number, stored_bucket_number),
+                    else_=bucket_number,
+                ),
+                "n_observations": add_to_bucket(windowed_rewards_per_arm_table.c.n_observations, n_new_observations),
+                "sum_reward": add_to_bucket(
+                    windowed_rewards_per_arm_table.c.sum_reward, literal(sum_of_new_rewards, Float)
+                ),
+            },
+        )
+        .returning(WindowedRewardsPerArm)
+    )
+
+
+def update_windowed_rewards_per_arm(
+    session: Session,
+    environment_id: int,
+    observations: List["Observation"],
+    commit: bool = True,
+) -> List[WindowedRewardsPerArm]:
+    """
+    Add a batch of observations to the ring buffers of the sliding window bandits,
+    with one update per arm and time bucket.
+    Like update_average_rewards_per_arm, pass commit=False to make the update part of a larger transaction.
+    """
+    rewards_per_bucket = defaultdict(list)
+    for observation in observations:
+        if observation.arm_id is not None:
+            bucket_number = get_bucket_number(observation.event_datetime)
+            rewards_per_bucket[(observation.arm_id, bucket_number)].append(observation.reward)
+
+    dialect_name = session.get_bind().dialect.name
+    # update the buckets in a fixed order, so concurrent batches can't deadlock each other
+    windowed_rewards_per_arms = [
+        session.exec(
+            get_update_windowed_rewards_per_arm_sql(
+                dialect_name=dialect_name,
+                environment_id=environment_id,
+                arm_id=arm_id,
+                bucket_number=bucket_number,
+                n_new_observations=len(rewards_per_bucket[(arm_id, bucket_number)]),
+                sum_of_new_rewards=float(sum(rewards_per_bucket[(arm_id, bucket_number)])),
+            ),
+            execution_options={"populate_existing": True},
+        ).scalars().one()
+        for arm_id, bucket_number in sorted(rewards_per_bucket)
+    ]
+    if commit:
+        session.commit()
+        update_cached_reward_windows(environment_id, windowed_rewards_per_arms)
+    return windowed_rewards_per_arms
@@ -5,7 +5,10 @@ from sqlalchemy import func
 from maybee_backend.models.core_models import (
     Arm,
     AvgRewardsPerArm,
+    WindowedRewardsPerArm,
 )
+from maybee_backend.models.reward_decay import get_oldest_bucket_number
+from maybee_backend.models.arm_stats import ArmStats, arm_stats_cache
 
 
 def get_average_rewards_per_arm(
@@ -23,7 +26,11 @@ def get_average_rewards_per_arm(
                 AvgRewardsPerArm.avg_reward,
                 0.0 if replace_null_rewards_with_zeros else None,
             ).label("avg_reward"),
-               AvgRewardsPerArm.avg_reward,
+               AvgRewardsPerArm.n_observations,
+               AvgRewardsPerArm.sum_squared_reward,
+               AvgRewardsPerArm.decay_epoch,
+               AvgRewardsPerArm.discounted_n_observations,
+               AvgRewardsPerArm.discounted_reward,
                ).join(
             Arm,
             Arm.arm_id == AvgRewardsPerArm.arm_id,
@@ -32,3 +39,30 @@ def get_average_rewards_per_arm(
     )
     results = session.exec(sql).all()
     return results
+
+
+def get_windowed_rewards_per_arm(session: Session, environment_id: int):
+    """
+    The time buckets of an environment that are in the current window of the sliding window bandits.
+    """
+    sql = (
+        select(WindowedRewardsPerArm)
+        .where(WindowedRewardsPerArm.environment_id == environment_id)
+        .where(WindowedRewardsPerArm.bucket_number >= get_oldest_bucket_number())
+    )
+    return session.exec(sql).all()
+
+
+def get_arm_stats(session: Session, environment_id: int) -> ArmStats:
+    """
+    Get the arm stats of an environment from the per worker cache,
+    loading them from the db on a miss or once the cached stats expired.
+    """
+    arm_stats = arm_stats_cache.get(environment_id)
+    if arm_stats is None:
+        arm_stats = ArmStats.from_rows(
+            get_average_rewards_per_arm(session=session, environment_id=environment_id),
+            window_rows=get_windowed_rewards_per_arm(session=session, environment_id=environment_id),
+        )
+        arm_stats_cache.set(environment_id, arm_stats)
+    return arm_stats
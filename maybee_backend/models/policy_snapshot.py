@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Policy snapshots: the arm stats of an environment as published to clients that choose arms themselves.
+
+A client runs the environment's bandit on the arm stats of its snapshot, so it chooses like the server would
+have when the snapshot was taken. The version is a digest of the bandit type and the arm stats,
+so every worker gives a snapshot of the same stats the same version, and it's used as the snapshot's ETag.
+"""
+import datetime
+import hashlib
+from typing import Optional
+import numpy as np
+
+from maybee_backend.models.arm_stats import ArmStats
+from maybee_backend.models.core_models import Bandit, EnvironmentBanditConfig, PolicySnapshot
+from maybee_backend.simulations.simulation_environment import create_offline_bandit
+
+
+def get_policy_version(bandit_type: EnvironmentBanditConfig, arm_stats: ArmStats) -> str:
+    digest = hashlib.sha256(EnvironmentBanditConfig(bandit_type).value.encode())
+    for array in (
+        arm_stats.arm_ids,
+        arm_stats.n_observations,
+        arm_stats.avg_rewards,
+        arm_stats.sum_squared_rewards,
+        arm_stats.decay_epochs,
+        arm_stats.discounted_n_observations,
+        arm_stats.discounted_rewards,
+        arm_stats.window_bucket_numbers,
+        arm_stats.window_n_observations,
+        arm_stats.window_rewards,
+    ):
+        if array is not None:
+            digest.update(np.ascontiguousarray(array).tobytes())
+    return digest.hexdigest()[:16]
+
+
+def to_list(array: Optional[np.ndarray]) -> Optional[list]:
+    return None if array is None else array.tolist()
+
+
+def get_policy_snapshot(
+    environment_id: int,
+    bandit_type: EnvironmentBanditConfig,
+    arm_stats: ArmStats,
+    snapshot_datetime: Optional[datetime.datetime] = None,
+) -> PolicySnapshot:
+    bandit = create_offline_bandit(bandit_type)
+    probabilities = bandit.get_arm_probabilities(arm_stats) if len(arm_stats) else np.zeros(0)
+    return PolicySnapshot(
+        environment_id=environment_id,
+        bandit_type=bandit_type,
+        version=get_policy_version(bandit_type, arm_stats),
+        snapshot_datetime=snapshot_datetime or datetime.datetime.now(),
+        arm_ids=arm_stats.arm_ids.tolist(),
+        n_observations=arm_stats.n_observations.tolist(),
+        avg_rewards=arm_stats.avg_rewards.tolist(),
+        sum_squared_rewards=arm_stats.sum_squared_rewards.tolist(),
+        decay_epochs=arm_stats.decay_epochs.tolist(),
+        discounted_n_observations=arm_stats.discounted_n_observations.tolist(),
+        discounted_rewards=arm_stats.discounted_rewards.tolist(),
+        window_bucket_numbers=to_list(arm_stats.window_bucket_numbers),
+        window_n_observations=to_list(arm_stats.window_n_observations),
+        window_rewards=to_list(arm_stats.window_rewards),
+        probabilities=np.asarray(probabilities, dtype=np.float64).tolist(),
+    )
+
+
+def get_snapshot_arm_stats(snapshot: PolicySnapshot) -> ArmStats:
+    arm_ids = np.array(snapshot.arm_ids, dtype=np.int64)
+    has_windows = snapshot.window_bucket_numbers is not None
+    return ArmStats(
+        arm_ids=arm_ids,
+        n_observations=np.array(snapshot.n_observations, dtype=np.int64),
+        avg_rewards=np.array(snapshot.avg_rewards, dtype=np.float64),
+        sum_squared_rewards=np.array(snapshot.sum_squared_rewards, dtype=np.float64),
+        decay_epochs=np.array(snapshot.decay_epochs, dtype=np.int64),
+        discounted_n_observations=np.array(snapshot.discounted_n_observations, dtype=np.float64),
+        discounted_rewards=np.array(snapshot.discounted_rewards, dtype=np.float64),
+        positions={int(arm_id): position for position, arm_id in enumerate(arm_ids)},
+        window_bucket_numbers=np.array(snapshot.window_bucket_numbers, dtype=np.int64) if has_windows else None,
+        window_n_observations=np.array(snapshot.window_n_observations, dtype=np.int64) if has_windows else None,
+        window_rewards=np.array(snapshot.window_rewards, dtype=np.float64) if has_windows else None,
+    )
+
+
+def get_snapshot_bandit(snapshot: PolicySnapshot) -> Bandit:
+    """
+    The bandit of a snapshot, without a database session, to choose from its arm stats (see choose_arm_indexes).
+    """
+    return create_offline_bandit(snapshot.bandit_type)
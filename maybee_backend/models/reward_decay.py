@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Time based forgetting of rewards, for bandits in environments where reward rates drift.
+
+Discounting: an observation at time t gets weight 2 ** ((t - epoch start) / half life),
+relative to the start of a decay epoch of epoch_half_lives half lives.
+Discounted sums of those weights can be updated by adding to them, in any order,
+and are brought to the present by a single factor when they're read.
+Weights stay in float range, as rows move to the next epoch by scaling down with 2 ** -epoch_half_lives.
+
+Sliding window: rewards are counted in a ring buffer of time buckets per arm,
+a bucket is reset when it's reused for a newer part of the window.
+"""
+import datetime
+import math
+from dataclasses import dataclass
+from typing import List, Optional
+import numpy as np
+
+from maybee_backend.config import Config
+
+reward_half_life_seconds = Config.reward_half_life_seconds
+epoch_half_lives = 256
+# factor that takes discounted sums from one decay epoch to the next
+epoch_scale = 2.0 ** -epoch_half_lives
+
+reward_window_seconds = Config.reward_window_seconds
+reward_window_buckets = Config.reward_window_buckets
+
+
+def get_epoch_seconds() -> float:
+    return epoch_half_lives * reward_half_life_seconds
+
+
+def get_decay_epoch(event_datetime: datetime.datetime) -> int:
+    return math.floor(event_datetime.timestamp() / get_epoch_seconds())
+
+
+@dataclass
+class DiscountedRewards:
+    """
+    The discounted count and sum of rewards of some observations, relative to decay_epoch.
+    """
+
+    decay_epoch: int
+    n_observations: float
+    reward: float
+
+
+def discount_rewards(
+    rewards: List[float], event_datetimes: List[datetime.datetime]
+) -> DiscountedRewards:
+    """
+    Weigh rewards by the time they were observed, relative to the latest decay epoch among them.
+    """
+    timestamps = np.array([event_datetime.timestamp() for event_datetime in event_datetimes])
+    decay_epoch = math.floor(timestamps.max() / get_epoch_seconds())
+    weights = np.exp2((timestamps - decay_epoch * get_epoch_seconds()) / reward_half_life_seconds)
+    return DiscountedRewards(
+        decay_epoch=decay_epoch,
+        n_observations=float(weights.sum()),
+        reward=float(np.dot(weights, rewards)),
+    )
+
+
+def get_decay_factors(decay_epochs: np.ndarray, now: datetime.datetime) -> np.ndarray:
+    """
+    Factors that bring discounted sums of the given decay epochs to the present.
+    """
+    return np.exp2(
+        (decay_epochs * get_epoch_seconds() - now.timestamp()) / reward_half_life_seconds
+    )
+
+
+def get_bucket_seconds() -> float:
+    return reward_window_seconds / reward_window_buckets
+
+
+def get_bucket_number(event_datetime: datetime.datetime) -> int:
+    """
+    Number of the time bucket an observation falls in, counted from the unix epoch.
+    Bucket number b is kept in slot b % reward_window_buckets of the ring buffer of its arm.
+    """
+    return math.floor(event_datetime.timestamp() / get_bucket_seconds())
+
+
+def get_oldest_bucket_number(now: Optional[datetime.datetime] = None) -> int:
+    """
+    Oldest bucket number that still falls in the window.
+    """
+    return get_bucket_number(now or datetime.datetime.now()) - reward_window_buckets + 1
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import time
+from dataclasses import dataclass
+from typing import Callable, FrozenSet, Hashable, Iterable, Optional, Tuple
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+from maybee_backend.caching import LRUCache
+from maybee_backend.config import Config
+from maybee_backend.models.user_models import ApiKey, User, UserEnvironmentLink
+
+
+@dataclass(frozen=True)
+class CurrentUser:
+    """
+    The fields of an authenticated user that the routes need, detached from any session.
+    """
+
+    user_id: int
+    username: str
+    is_admin: bool
+    # false for api keys with the read scope
+    can_write: bool = True
+
+    @classmethod
+    def from_user(cls, user: User, can_write: bool = True) -> "CurrentUser":
+        return cls(user_id=user.user_id, username=user.username, is_admin=user.is_admin, can_write=can_write)
+
+
+# the decoded claims and user of verified access tokens and api keys, per token or key, per worker process
+authenticated_user_cache = LRUCache(
+    maxsize=Config.user_cache_size,
+    ttl_seconds=Config.user_cache_ttl_seconds,
+    name="authenticated_users",
+)
+
+# the ids of the environments a user has a link to, per user_id, per worker process
+environment_access_cache = LRUCache(
+    maxsize=Config.environment_access_cache_size,
+    ttl_seconds=Config.environment_access_cache_ttl_seconds,
+    name="environment_access",
+)
+
+
+def get_cached_user(token: str) -> Optional[CurrentUser]:
+    """
+    The user of an access token or api key that was verified before, if its claims haven't expired since.
+    """
+    entry: Optional[Tuple[dict, CurrentUser]] = authenticated_user_cache.get(token)
+    if entry is None:
+        return None
+    claims, current_user = entry
+    expires_at = claims.get("exp")
+    if expires_at is not None and expires_at <= time.time():
+        authenticated_user_cache.invalidate(token)
+        return None
+    return current_user
+
+
+def cache_user(token: str, claims: dict, current_user: CurrentUser) -> None:
+    authenticated_user_cache.set(token, (claims, current_user))
+
+
+def invalidate_cached_user(user_id: int) -> int:
+    """
+    Drop every cached access token of a user, and return how many were dropped.
+    """
+    return authenticated_user_cache.invalidate_matching(lambda entry: entry[1].user_id == user_id)
+
+
+def invalidate_cached_api_key(api_key_id: int) -> int:
+    return authenticated_user_cache.invalidate_matching(lambda entry: entry[0].get("api_key_id") == api_key_id)
+
+
+def get_cached_environment_ids(user_id: int) -> Optional[FrozenSet[int]]:
+    return environment_access_cache.get(user_id)
+
+
+def cache_environment_ids(user_id: int, environment_ids: Iterable[int]) -> None:
+    environment_access_cache.set(user_id, frozenset(environment_ids))
+
+
+def invalidate_cached_environment_ids(user_id: int) -> None:
+    environment_access_cache.invalidate(user_id)
+
+
+def invalidate_on_flush_and_commit(target, invalidate: Callable[[Hashable], object], key: Hashable) -> None:
+    """
+    Invalidate a cache entry when a change to target is flushed, and again once it's committed,
+    as a request that reads in between would cache the state from before the change.
+    A rolled back change only costs a cache miss. Other workers keep their entries until they expire.
+    """
+    invalidate(key)
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault("cache_invalidations", set()).add((invalidate, key))
+
+
+@event.listens_for(Session, "after_commit")
+def invalidate_after_commit(session: Session) -> None:
+    for invalidate, key in session.info.pop("cache_invalidations", ()):
+        invalidate(key)
+
+
+@event.listens_for(Session, "after_rollback")
+def discard_invalidations_after_rollback(session: Session) -> None:
+    session.info.pop("cache_invalidations", None)
+
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def invalidate_cached_user_on_change(mapper, connection, user: User) -> None:
+    invalidate_on_flush_and_commit(user, invalidate_cached_user, user.user_id)
+
+
+@event.listens_for(ApiKey, "after_update")
+@event.listens_for(ApiKey, "after_delete")
+def invalidate_cached_api_key_on_change(mapper, connection, api_key: ApiKey) -> None:
+    invalidate_on_flush_and_commit(api_key, invalidate_cached_api_key, api_key.api_key_id)
+
+
+@event.listens_for(UserEnvironmentLink, "after_insert")
+@event.listens_for(UserEnvironmentLink, "after_update")
+@event.listens_for(UserEnvironmentLink, "after_delete")
+def invalidate_cached_environment_ids_on_change(mapper, connection, link: UserEnvironmentLink) -> None:
+    invalidate_on_flush_and_commit(link, invalidate_cached_environment_ids, link.user_id)
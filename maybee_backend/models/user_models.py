@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
-from sqlmodel import Field, SQLModel, Relationship
+import datetime
+from sqlmodel import Field, SQLModel, Relationship, Index
 from typing import Optional, List
 from enum import Enum
 
@@ -20,9 +21,16 @@ class User(SQLModel, table=True):
     environment_links: List["UserEnvironmentLink"] = Relationship(
         back_populates="user", cascade_delete=True
     )
+    api_keys: List["ApiKey"] = Relationship(
+        back_populates="user", cascade_delete=True
+    )
 
 
 class UserEnvironmentLink(SQLModel, table=True):
+    __table_args__ = (
+        Index("ix_userenvironmentlink_user_id_environment_id", "user_id", "environment_id"),
+    )
+
     user_environment_link_id: int | None = Field(default=None, primary_key=True)
 
     user_id: int | None = Field(default=None, foreign_key="user.user_id")
@@ -33,6 +41,46 @@ class UserEnvironmentLink(SQLModel, table=True):
     user: User | None = Relationship(back_populates="environment_links")
 
 
+class ApiKeyScope(str, Enum):
+    READ = "read"
+    WRITE = "write"
+
+
+class ApiKey(SQLModel, table=True):
+    """
+    A long-lived key for a service account, sent in the X-API-Key header.
+    Only the key's prefix is stored in the clear, to look it up by,
+    the key itself is stored as its HMAC-SHA256 digest under the secret key.
+    Keys with the read scope can only be used for GET requests.
+    """
+
+    api_key_id: int | None = Field(default=None, primary_key=True)
+    user_id: int = Field(foreign_key="user.user_id", index=True)
+    prefix: str = Field(index=True, unique=True)
+    digest: str
+    scope: ApiKeyScope = Field(default=ApiKeyScope.WRITE)
+    description: Optional[str] = None
+    created_at: datetime.datetime = Field(default_factory=datetime.datetime.now)
+    expires_at: Optional[datetime.datetime] = None
+
+    user: User | None = Relationship(back_populates="api_keys")
+
+
+class ApiKeyResponse(SQLModel, table=False):
+    api_key_id: int
+    user_id: int
+    prefix: str
+    scope: ApiKeyScope
+    description: Optional[str] = None
+    created_at: datetime.datetime
+    expires_at: Optional[datetime.datetime] = None
+
+
+class ApiKeyCreationResponse(ApiKeyResponse, table=False):
+    # only returned when the key is created, it can't be recovered afterwards
+    api_key: str
+
+
 class UserCreationInput(SQLModel, table=False):
     username: str
     password: str
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Profiling of the SQL statements a request runs, to find routes that query more than they need.
+
+A request is profiled when it sends the X-Query-Profile header (with QUERY_PROFILER=header),
+or always (with QUERY_PROFILER=all). Every statement is recorded with its duration and row count,
+statements are grouped by shape, their text without literals and with IN lists collapsed,
+and shapes that ran n_plus_one_threshold times or more are flagged as a likely N+1.
+The summary is returned in response headers and logged, the statements are logged at debug level.
+Statements are timed by the cursor hook of the metrics, which hands them to record_query.
+Headers are sent before a streamed body, so they only count the queries that ran before it,
+the log has them all.
+"""
+import re
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from enum import Enum
+from typing import Counter as CounterType, Dict, Iterator, List, Optional, Tuple
+
+from maybee_backend.logging import log
+
+
+class QueryProfilerMode(str, Enum):
+    OFF = "off"
+    # profile the requests that send the profile header
+    HEADER = "header"
+    ALL = "all"
+
+
+profile_header = "x-query-profile"
+# runs of one statement shape in a request from which it's flagged
+n_plus_one_threshold = 3
+# characters of a shape shown in the summary
+max_shape_length = 200
+
+whitespace_pattern = re.compile(r"\s+")
+literal_pattern = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+# a placeholder in the paramstyles of sqlite, psycopg2 and asyncpg
+placeholder = r"(?:\?|%s|%\(\w+\)s|\$\d+|:\w+)"
+# placeholders of expanded IN lists and of rows of values
+placeholder_list_pattern = re.compile(rf"\(\s*{placeholder}(?:\s*,\s*{placeholder})+\s*\)")
+values_list_pattern = re.compile(r"(VALUES\s*\(\.\.\.\))(?:\s*,\s*\(\.\.\.\))+", re.IGNORECASE)
+
+
+def get_statement_shape(statement: str) -> str:
+    """
+    The statement without literals, with lists of placeholders collapsed to (...),
+    so executions that only differ in their parameters have the same shape.
+    """
+    shape = whitespace_pattern.sub(" ", statement).strip()
+    shape = placeholder_list_pattern.sub("(...)", shape)
+    shape = values_list_pattern.sub(r"\1", shape)
+    return literal_pattern.sub("?", shape)
+
+
+@dataclass
+class QueryRecord:
+    statement: str
+    duration: float
+    # rows the statement changed or returned, -1 when the driver doesn't tell before they're fetched
+    rowcount: int
+    executemany: bool
+
+
+class QueryProfile:
+    """
+    The statements run while a profile is active.
+    """
+
+    def __init__(self) -> None:
+        self.queries: List[QueryRecord] = []
+
+    def record(self, statement: str, duration: float, rowcount: int, executemany: bool) -> None:
+        self.queries.append(QueryRecord(statement, duration, rowcount, executemany))
+
+    @property
+    def n_queries(self) -> int:
+        return len(self.queries)
+
+    @property
+    def duration(self) -> float:
+        return sum(query.duration for query in self.queries)
+
+    def get_shape_counts(self) -> CounterType[str]:
+        return Counter(get_statement_shape(query.statement) for query in self.queries)
+
+    def get_repeated_shapes(self, threshold: int = n_plus_one_threshold) -> List[Tuple[str, int]]:
+        """
+        The shapes that ran threshold times or more, most frequent first.
+        """
+        return [(shape, count) for shape, count in self.get_shape_counts().most_common() if count >= threshold]
+
+    def get_headers(self) -> Dict[str, str]:
+        duration_ms = self.duration * 1000
+        return {
+            "X-Query-Count": str(self.n_queries),
+            "X-Query-Duration-Ms": f"{duration_ms:.3f}",
+            "X-Query-Repeated-Shapes": str(len(self.get_repeated_shapes())),
+            "Server-Timing": f'db;dur={duration_ms:.3f};desc="{self.n_queries} queries"',
+        }
+
+    def summary(self, all_shapes: bool = False) -> str:
+        """
+        The number and duration of the queries, and the repeated shapes, or every shape with all_shapes.
+        """
+        lines = [f"{self.n_queries} queries in {self.duration * 1000:.3f} ms"]
+        for shape, count in self.get_shape_counts().most_common():
+            if count >= n_plus_one_threshold:
+                lines.append(f"possible N+1, ran {count} times: {shape[:max_shape_length]}")
+            elif all_shapes:
+                lines.append(f"ran {count} times: {shape[:max_shape_length]}")
+        return "\n".join(lines)
+
+
+# the profile of the request being handled, seen by the sync sessions of run_sync and the thread pool
+query_profile: ContextVar[Optional[QueryProfile]] = ContextVar("query_profile", default=None)
+# profiles that record the queries of the whole process, see profile_queries
+_process_profiles: List[QueryProfile] = []
+_process_profiles_lock = threading.Lock()
+
+
+@contextmanager
+def profile_queries() -> Iterator[QueryProfile]:
+    """
+    Record the queries of every engine of the process while the block runs, whichever thread runs them.
+    Meant for tests and scripts, where nothing else queries at the same time:
+
+        with profile_queries() as profile:
+            client.post(...)
+        assert profile.n_queries <= 3, profile.summary()
+    """
+    profile = QueryProfile()
+    with _process_profiles_lock:
+        _process_profiles.append(profile)
+    try:
+        yield profile
+    finally:
+        with _process_profiles_lock:
+            _process_profiles.remove(profile)
+
+
+def get_active_profiles() -> List[QueryProfile]:
+    request_profile = query_profile.get()
+    with _process_profiles_lock:
+        process_profiles = list(_process_profiles)
+    if request_profile is None:
+        return process_profiles
+    return [request_profile, *process_profiles]
+
+
+def record_query(statement: str, duration: float, rowcount: int, executemany: bool) -> None:
+    """
+    Record a statement in the active profiles, called by the cursor hook of the metrics, which times every statement.
+    """
+    for profile in get_active_profiles():
+        profile.record(statement, duration, rowcount, executemany)
+
+
+class QueryProfilerMiddleware:
+    """
+    ASGI middleware that profiles the queries of the requests that ask for it, or of all requests.
+    """
+
+    def __init__(self, app, profile_all: bool = False) -> None:
+        self.app = app
+        self.profile_all = profile_all
+
+    def is_profiled(self, scope) -> bool:
+        if scope["type"] != "http":
+            return False
+        return self.profile_all or any(name == profile_header.encode() for name, _ in scope["headers"])
+
+    async def __call__(self, scope, receive, send) -> None:
+        if not self.is_profiled(scope):
+            await self.app(scope, receive, send)
+            return
+
+        profile = QueryProfile()
+
+        async def send_with_profile(message) -> None:
+            if message["type"] == "http.response.start":
+                headers = [(name.lower().encode(), value.encode()) for name, value in profile.get_headers().items()]
+                message = {**message, "headers": [*message.get("headers", []), *headers]}
+            await send(message)
+
+        token = query_profile.set(profile)
+        try:
+            await self.app(scope, receive, send_with_profile)
+        finally:
+            query_profile.reset(token)
+            request = f"{scope['method']} {scope['path']}"
+            for query in profile.queries:
+                log.debug(f"{request} query in {query.duration * 1000:.3f} ms, "
+                          f"{query.rowcount} rows: {query.statement}")
+            if profile.get_repeated_shapes():
+                log.warning(f"{request} {profile.summary()}")
+            else:
+                log.info(f"{request} {profile.summary()}")
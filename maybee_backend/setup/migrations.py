@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+from sqlalchemy import Enum, func, inspect, text, update
+from sqlalchemy.engine import Engine
+from sqlmodel import Session, SQLModel, select
+
+from maybee_backend.models.core_models import AvgRewardsPerArm, Observation
+from maybee_backend.logging import log
+
+
+def merge_duplicate_avg_rewards_per_arm(session: Session) -> None:
+    """
+    Older deployments could end up with more than one AvgRewardsPerArm row per arm.
+    Fold those into a single row, so the unique index on (environment_id, arm_id) can be created.
+    """
+    sql = (
+        select(AvgRewardsPerArm.environment_id, AvgRewardsPerArm.arm_id)
+        .group_by(AvgRewardsPerArm.environment_id, AvgRewardsPerArm.arm_id)
+        .having(func.count() > 1)
+    )
+    for environment_id, arm_id in session.exec(sql).all():
+        sql = (
+            select(AvgRewardsPerArm)
+            .where(AvgRewardsPerArm.environment_id == environment_id)
+            .where(AvgRewardsPerArm.arm_id == arm_id)
+            .order_by(AvgRewardsPerArm.avg_rewards_per_arm_id)
+        )
+        kept, *duplicates = session.exec(sql).all()
+        rows = [kept, *duplicates]
+        n_observations = sum(row.n_observations or 0 for row in rows)
+        if n_observations > 0:
+            kept.avg_reward = (
+                sum((row.avg_reward or 0.0) * (row.n_observations or 0) for row in rows)
+                / n_observations
+            )
+        kept.n_observations = n_observations
+        # left for backfill_sum_squared_reward when it isn't known for every row
+        sum_squared_rewards = [row.sum_squared_reward for row in rows]
+        kept.sum_squared_reward = None if None in sum_squared_rewards else sum(sum_squared_rewards)
+        session.add(kept)
+        for duplicate in duplicates:
+            session.delete(duplicate)
+        log.warning(
+            f"Merged {len(duplicates)} duplicate AvgRewardsPerArm rows for {environment_id=} {arm_id=}"
+        )
+    session.commit()
+
+
+def create_missing_indexes(engine: Engine) -> None:
+    """
+    SQLModel.metadata.create_all skips tables that already exist,
+    so indexes that were added to existing tables are created here.
+    """
+    inspector = inspect(engine)
+    for table in SQLModel.metadata.sorted_tables:
+        existing_index_names = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing_index_names:
+                index.create(bind=engine)
+                log.info(f"Created index {index.name} on {table.name}")
+
+
+# indexes that were replaced by wider ones, per table
+replaced_index_names = {
+    "action": ["ix_action_environment_id_event_datetime"],
+    "observation": ["ix_observation_environment_id_event_datetime"],
+}
+
+
+def drop_replaced_indexes(engine: Engine) -> None:
+    """
+    Drop indexes that were replaced by wider ones, once their replacements exist.
+    """
+    inspector = inspect(engine)
+    for table_name, index_names in replaced_index_names.items():
+        existing_index_names = {index["name"] for index in inspector.get_indexes(table_name)}
+        for index_name in index_names:
+            if index_name in existing_index_names:
+                with engine.begin() as connection:
+                    connection.execute(text(f"DROP INDEX {index_name}"))
+                log.info(f"Dropped index {index_name} on {table_name}, it was replaced by a wider one")
+
+
+def add_missing_columns(engine: Engine) -> None:
+    """
+    Add nullable columns that were added to the models to existing tables.
+    """
+    inspector = inspect(engine)
+    for table in SQLModel.metadata.sorted_tables:
+        existing_column_names = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing_column_names:
+                continue
+            if not column.nullable:
+                raise ValueError(f"Can't add non nullable column {column.name} to existing table {table.name}")
+            column_type = column.type.compile(dialect=engine.dialect)
+            with engine.begin() as connection:
+                connection.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+            log.info(f"Added column {column.name} to {table.name}")
+
+
+def add_missing_enum_values(engine: Engine) -> None:
+    """
+    Postgres stores enums as types, that create_all doesn't update when members are added,
+    e.g. new bandit types in EnvironmentBanditConfig.
+    """
+    if engine.dialect.name != "postgresql":
+        return
+    existing_enums = {enum["name"]: set(enum["labels"]) for enum in inspect(engine).get_enums()}
+    for table in SQLModel.metadata.sorted_tables:
+        for column in table.columns:
+            if not isinstance(column.type, Enum) or column.type.name not in existing_enums:
+                continue
+            for value in column.type.enums:
+                if value in existing_enums[column.type.name]:
+                    continue
+                # ALTER TYPE ... ADD VALUE can't be used in the transaction that adds it
+                with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+                    connection.execute(text(f"ALTER TYPE {column.type.name} ADD VALUE IF NOT EXISTS '{value}'"))
+                existing_enums[column.type.name].add(value)
+                log.info(f"Added value {value} to enum {column.type.name}")
+
+
+def backfill_sum_squared_reward(session: Session) -> None:
+    """
+    Compute the sum of squared rewards of AvgRewardsPerArm rows that predate the column
+    from the observations of their arm.
+    """
+    sum_squared_reward = (
+        select(func.coalesce(func.sum(Observation.reward * Observation.reward), 0.0))
+        .where(Observation.environment_id == AvgRewardsPerArm.environment_id)
+        .where(Observation.arm_id == AvgRewardsPerArm.arm_id)
+        .scalar_subquery()
+    )
+    sql = (
+        update(AvgRewardsPerArm)
+        .where(AvgRewardsPerArm.sum_squared_reward.is_(None))
+        .values(sum_squared_reward=sum_squared_reward)
+    )
+    result = session.exec(sql)
+    if result.rowcount:
+        log.info(f"Backfilled sum_squared_reward of {result.rowcount} AvgRewardsPerArm rows")
+    session.commit()
+
+
+def run_migrations(engine: Engine) -> None:
+    """
+    Bring the schema of an existing deployment up to date with the models.
+    Meant to run at startup, after SQLModel.metadata.create_all.
+    """
+    add_missing_columns(engine=engine)
+    add_missing_enum_values(engine=engine)
+    with Session(engine) as session:
+        merge_duplicate_avg_rewards_per_arm(session=session)
+        backfill_sum_squared_reward(session=session)
+    create_missing_indexes(engine=engine)
+    drop_replaced_indexes(engine=engine)
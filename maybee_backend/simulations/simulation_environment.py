@@ -1,22 +1,257 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
-from sqlmodel import select, Session
+"""
+Simulation environments, with arms that pay a reward of 1.0 with a known probability.
+
+The bandit's policy is run in memory: every round it chooses a batch of arms from arm stats
+that are kept in numpy arrays, the rewards of the whole batch are drawn at once,
+and the arrays are updated before the next round.
+The resulting actions, observations and aggregates are written in one transaction at the end.
+"""
+import datetime
 import random
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+import numpy as np
+from sqlmodel import Session
+
 from maybee_backend.models.core_models import (
-    Environment,
+    Action,
     Arm,
+    AvgRewardsPerArm,
+    Bandit,
+    BanditState,
+    Environment,
     EnvironmentBanditConfig,
+    Observation,
+    WindowedRewardsPerArm,
+    bandit_types_with_reward_windows,
 )
-from maybee_backend.bandits.get_bandit import get_bandit
+from maybee_backend.models import reward_decay
+from maybee_backend.models.arm_stats import ArmStats, invalidate_cached_arm_stats
+from maybee_backend.models.bulk_insert import bulk_insert
+from maybee_backend.bandits.get_bandit import environment_bandit_config_to_bandit_mapping
+from maybee_backend.bandits.epsilon_greedy import EpsilonGreedyBandit
 from maybee_backend.logging import log
 
+# rows per insert statement when the simulated pulls are saved
+insert_chunk_size = 10_000
+
+
+@dataclass
+class SimulatedPulls:
+    """
+    The choices of a simulated bandit and the rewards they got, in the order they were made.
+    The propensities are the probabilities the bandit had of choosing the pulled arms.
+    The arm stats are the totals per arm after the last pull,
+    elapsed_seconds holds the time since the start of the simulation at the end of every batch.
+    """
+
+    arm_indexes: np.ndarray
+    bandit_states: List[BanditState]
+    rewards: np.ndarray
+    propensities: np.ndarray
+    arm_stats: ArmStats
+    batch_size: int
+    elapsed_seconds: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.arm_indexes)
+
+
+def create_offline_bandit(
+    bandit_type: EnvironmentBanditConfig, hyperparameters: Optional[Dict[str, float]] = None
+) -> Bandit:
+    """
+    A bandit without a database session, that chooses from the arm stats it's handed (see choose_arm_indexes).
+    Hyperparameters are set as attributes of the bandit.
+    """
+    bandit_type = EnvironmentBanditConfig(bandit_type)
+    bandit = environment_bandit_config_to_bandit_mapping[bandit_type](session=None, environment_id=None)
+    for name, value in (hyperparameters or {}).items():
+        if not hasattr(bandit, name):
+            raise ValueError(f"{bandit_type.value} bandit has no hyperparameter {name}")
+        setattr(bandit, name, value)
+    return bandit
+
+
+def get_simulated_arm_stats(
+    arm_ids: np.ndarray,
+    n_observations: np.ndarray,
+    sum_rewards: np.ndarray,
+    sum_squared_rewards: np.ndarray,
+    now: datetime.datetime,
+) -> ArmStats:
+    """
+    Arm stats for observations that were all made at time now,
+    so their discounted sums share one weight and their window is a single time bucket.
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        avg_rewards = np.where(n_observations > 0, sum_rewards / n_observations, 0.0)
+    weight = reward_decay.discount_rewards([0.0], [now]).n_observations
+    bucket_number = reward_decay.get_bucket_number(now)
+    bucket_slot = bucket_number % reward_decay.reward_window_buckets
+    shape = (len(arm_ids), reward_decay.reward_window_buckets)
+    window_bucket_numbers = np.full(shape, -1, dtype=np.int64)
+    window_bucket_numbers[:, bucket_slot] = bucket_number
+    window_n_observations = np.zeros(shape, dtype=np.int64)
+    window_n_observations[:, bucket_slot] = n_observations
+    window_rewards = np.zeros(shape, dtype=np.float64)
+    window_rewards[:, bucket_slot] = sum_rewards
+    return ArmStats(
+        arm_ids=arm_ids,
+        n_observations=n_observations,
+        avg_rewards=avg_rewards,
+        sum_squared_rewards=sum_squared_rewards,
+        decay_epochs=np.full(len(arm_ids), reward_decay.get_decay_epoch(now), dtype=np.int64),
+        discounted_n_observations=n_observations * weight,
+        discounted_rewards=sum_rewards * weight,
+        positions={int(arm_id): position for position, arm_id in enumerate(arm_ids)},
+        window_bucket_numbers=window_bucket_numbers,
+        window_n_observations=window_n_observations,
+        window_rewards=window_rewards,
+    )
+
+
+def simulate_pulls(
+    bandit: Bandit,
+    arm_ids: List[int],
+    population_p_success: List[float],
+    n_pulls: int,
+    batch_size: int = 100,
+    now: Optional[datetime.datetime] = None,
+) -> SimulatedPulls:
+    """
+    Have the bandit choose and pull arms n_pulls times, without touching the database.
+    The bandit sees the rewards of a batch once the whole batch has been pulled,
+    a batch_size of 1 updates its arm stats after every pull.
+    """
+    now = now or datetime.datetime.now()
+    if hasattr(bandit, "clock"):
+        bandit.clock = lambda: now
+    arm_ids = np.asarray(arm_ids, dtype=np.int64)
+    population_p_success = np.asarray(population_p_success, dtype=np.float64)
+    n_observations = np.zeros(len(arm_ids), dtype=np.int64)
+    sum_rewards = np.zeros(len(arm_ids), dtype=np.float64)
+
+    arm_indexes, bandit_states, rewards, propensities, elapsed_seconds = [], [], [], [], []
+    start_time = time.perf_counter()
+    for start in range(0, n_pulls, batch_size):
+        n = min(batch_size, n_pulls - start)
+        # rewards are 0.0 or 1.0, so the sum of squared rewards equals the sum of rewards
+        arm_stats = get_simulated_arm_stats(arm_ids, n_observations, sum_rewards, sum_rewards, now)
+        batch_bandit_states, batch_arm_indexes, probabilities = bandit.choose_arm_indexes_with_probabilities(
+            arm_stats, n=n
+        )
+        batch_arm_indexes = np.asarray(batch_arm_indexes, dtype=np.int64)
+        propensities.append(probabilities[batch_arm_indexes])
+        batch_rewards = (np.random.random_sample(n) < population_p_success[batch_arm_indexes]).astype(np.float64)
+        n_observations = n_observations + np.bincount(batch_arm_indexes, minlength=len(arm_ids))
+        sum_rewards = sum_rewards + np.bincount(batch_arm_indexes, weights=batch_rewards, minlength=len(arm_ids))
+        arm_indexes.append(batch_arm_indexes)
+        bandit_states.extend(batch_bandit_states)
+        rewards.append(batch_rewards)
+        elapsed_seconds.append(time.perf_counter() - start_time)
+
+    return SimulatedPulls(
+        arm_indexes=np.concatenate(arm_indexes) if arm_indexes else np.zeros(0, dtype=np.int64),
+        bandit_states=bandit_states,
+        rewards=np.concatenate(rewards) if rewards else np.zeros(0, dtype=np.float64),
+        propensities=np.concatenate(propensities) if propensities else np.zeros(0, dtype=np.float64),
+        arm_stats=get_simulated_arm_stats(arm_ids, n_observations, sum_rewards, sum_rewards, now),
+        batch_size=batch_size,
+        elapsed_seconds=np.array(elapsed_seconds, dtype=np.float64),
+    )
+
+
+def save_simulated_pulls(
+    session: Session,
+    environment_id: int,
+    pulls: SimulatedPulls,
+    now: datetime.datetime,
+    with_reward_windows: bool = False,
+) -> None:
+    """
+    Write the actions and observations of simulated pulls, with the aggregates of their arms,
+    to an environment whose arms don't have observations yet. Commits once, at the end.
+    """
+    arm_stats = pulls.arm_stats
+    arm_ids = arm_stats.arm_ids[pulls.arm_indexes].tolist()
+    bandit_states = [bandit_state.value for bandit_state in pulls.bandit_states]
+    rewards = pulls.rewards.tolist()
+    propensities = pulls.propensities.tolist()
+    for start in range(0, len(pulls), insert_chunk_size):
+        chunk = range(start, min(start + insert_chunk_size, len(pulls)))
+        action_ids = bulk_insert(
+            session=session,
+            model=Action,
+            rows=[
+                dict(environment_id=environment_id,
+                     arm_id=arm_ids[i],
+                     event_datetime=now,
+                     bandit_state=bandit_states[i],
+                     propensity=propensities[i])
+                for i in chunk
+            ],
+        )
+        bulk_insert(
+            session=session,
+            model=Observation,
+            rows=[
+                dict(environment_id=environment_id,
+                     arm_id=arm_ids[i],
+                     action_id=action_id,
+                     event_datetime=now,
+                     reward=rewards[i])
+                for i, action_id in zip(chunk, action_ids)
+            ],
+            return_ids=False,
+        )
+
+    bulk_insert(
+        session=session,
+        model=AvgRewardsPerArm,
+        rows=[
+            dict(environment_id=environment_id,
+                 arm_id=int(arm_stats.arm_ids[i]),
+                 n_observations=int(arm_stats.n_observations[i]),
+                 avg_reward=float(arm_stats.avg_rewards[i]) if arm_stats.n_observations[i] else None,
+                 sum_squared_reward=float(arm_stats.sum_squared_rewards[i]),
+                 decay_epoch=int(arm_stats.decay_epochs[i]),
+                 discounted_n_observations=float(arm_stats.discounted_n_observations[i]),
+                 discounted_reward=float(arm_stats.discounted_rewards[i]))
+            for i in range(len(arm_stats))
+        ],
+        return_ids=False,
+    )
+    if with_reward_windows:
+        bucket_number = reward_decay.get_bucket_number(now)
+        bulk_insert(
+            session=session,
+            model=WindowedRewardsPerArm,
+            rows=[
+                dict(environment_id=environment_id,
+                     arm_id=int(arm_stats.arm_ids[i]),
+                     bucket_slot=bucket_number % reward_decay.reward_window_buckets,
+                     bucket_number=bucket_number,
+                     n_observations=int(arm_stats.n_observations[i]),
+                     sum_reward=float(arm_stats.avg_rewards[i] * arm_stats.n_observations[i]))
+                for i in range(len(arm_stats))
+            ],
+            return_ids=False,
+        )
+    session.commit()
+    invalidate_cached_arm_stats(environment_id)
+
 
 def add_simulation_environment(
     session: Session,
     n_arms=3,
     n_observations=2500,
     bandit_type: EnvironmentBanditConfig = EnvironmentBanditConfig.EPSILON_GREEDY,
-):
+    batch_size: int = 100,
+) -> Environment:
     """
     Create an simulation environment, populate it with some arms, actions and observations
     """
@@ -24,6 +259,8 @@ def add_simulation_environment(
         f"Start adding simulation environment with {bandit_type=}, {n_arms=}, {n_observations=}"
     )
     random.seed(1)
+    np.random.seed(1)
+    bandit_type = EnvironmentBanditConfig(bandit_type)
 
     # create the simulation environment
     environment = Environment(
@@ -51,14 +288,25 @@ def add_simulation_environment(
         session.refresh(arm)
         log.info(f"Created new arm {arm=}")
 
-    # have the bandit select and pull an arm n_observations amount of times
-    bandit = get_bandit(session=session, environment_id=environment.environment_id)
-    for i in range(n_observations):
-        bandit_state, arm_id = bandit.choose_arm()
-        sql = select(Arm).where(Arm.arm_id == arm_id)
-        arm = session.exec(sql).first()
-
-        arm.pull(
-            session=session, bandit_state=bandit_state
-        )  # this method sinks the Actions and Oberservations into the db
-    log.info("Finished setting up simulation environment with {environment.id=}")
+    # have the bandit select and pull an arm n_observations amount of times, in memory
+    bandit = environment_bandit_config_to_bandit_mapping.get(bandit_type, EpsilonGreedyBandit)(
+        session=session, environment_id=environment.environment_id
+    )
+    now = datetime.datetime.now()
+    pulls = simulate_pulls(
+        bandit=bandit,
+        arm_ids=[arm.arm_id for arm in arms],
+        population_p_success=[arm.population_p_success for arm in arms],
+        n_pulls=n_observations,
+        batch_size=batch_size,
+        now=now,
+    )
+    save_simulated_pulls(
+        session=session,
+        environment_id=environment.environment_id,
+        pulls=pulls,
+        now=now,
+        with_reward_windows=bandit_type in bandit_types_with_reward_windows,
+    )
+    log.info(f"Finished setting up simulation environment with {environment.environment_id=}")
+    return environment
@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Sweeps over simulated bandits, to compare bandit types and tune their hyperparameters.
+
+Every combination of bandit type, hyperparameters, arm configuration and seed is simulated in memory
+(see simulate_pulls) in a pool of worker processes, no database is needed.
+A configuration is a list of population_p_success values, one per arm.
+The result is a curve per run, with the cumulative regret and the throughput at evenly spaced pull counts:
+
+    python -m maybee_backend.simulations.sweep --bandit-types softmax epsilon_greedy \\
+        --tau 0.05 0.1 0.2 --epsilon 0.01 0.05 0.1 --seeds 5 --output sweep.csv
+
+The curves are written as csv, or as parquet when the output ends with .parquet and pyarrow is installed.
+"""
+import argparse
+import csv
+import itertools
+import json
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+import numpy as np
+
+from maybee_backend.models.core_models import EnvironmentBanditConfig
+from maybee_backend.simulations.simulation_environment import create_offline_bandit, simulate_pulls
+
+# the hyperparameters that can be swept per bandit type, they're set as attributes of the bandit
+tunable_hyperparameters = {
+    EnvironmentBanditConfig.EPSILON_GREEDY: ("epsilon",),
+    EnvironmentBanditConfig.SOFTMAX: ("tau",),
+    EnvironmentBanditConfig.DISCOUNTED_SOFTMAX: ("tau",),
+    EnvironmentBanditConfig.SLIDING_WINDOW_SOFTMAX: ("tau",),
+}
+hyperparameter_names = sorted({name for names in tunable_hyperparameters.values() for name in names})
+
+sweep_columns = [
+    "bandit_type",
+    *hyperparameter_names,
+    "arm_configuration",
+    "n_arms",
+    "seed",
+    "n_pulls",
+    "cumulative_regret",
+    "avg_reward",
+    "elapsed_seconds",
+    "pulls_per_second",
+]
+
+default_arm_configurations = [
+    (0.1, 0.5, 0.9),
+    (0.45, 0.5, 0.55),
+    tuple(np.linspace(0.05, 0.95, 10).round(2).tolist()),
+]
+
+
+@dataclass(frozen=True)
+class SweepRun:
+    """
+    One simulation of a sweep.
+    """
+
+    bandit_type: EnvironmentBanditConfig
+    arm_configuration: Tuple[float, ...]
+    seed: int
+    n_pulls: int
+    batch_size: int
+    n_points: int
+    hyperparameters: Dict[str, float] = field(default_factory=dict)
+
+
+def get_hyperparameter_grid(
+    bandit_type: EnvironmentBanditConfig, hyperparameter_values: Dict[str, Sequence[float]]
+) -> List[Dict[str, float]]:
+    """
+    All combinations of the given hyperparameter values that apply to the bandit type.
+    Hyperparameters without values keep the bandit's default.
+    """
+    names = [name for name in tunable_hyperparameters.get(bandit_type, ()) if hyperparameter_values.get(name)]
+    return [
+        dict(zip(names, values))
+        for values in itertools.product(*(hyperparameter_values[name] for name in names))
+    ]
+
+
+def get_sweep_runs(
+    bandit_types: Sequence[EnvironmentBanditConfig],
+    hyperparameter_values: Dict[str, Sequence[float]],
+    arm_configurations: Sequence[Sequence[float]],
+    seeds: Sequence[int],
+    n_pulls: int,
+    batch_size: int = 100,
+    n_points: int = 100,
+) -> List[SweepRun]:
+    return [
+        SweepRun(
+            bandit_type=EnvironmentBanditConfig(bandit_type),
+            arm_configuration=tuple(arm_configuration),
+            seed=seed,
+            n_pulls=n_pulls,
+            batch_size=batch_size,
+            n_points=n_points,
+            hyperparameters=hyperparameters,
+        )
+        for bandit_type in bandit_types
+        for hyperparameters in get_hyperparameter_grid(EnvironmentBanditConfig(bandit_type), hyperparameter_values)
+        for arm_configuration in arm_configurations
+        for seed in seeds
+    ]
+
+
+def run_sweep_run(run: SweepRun) -> List[Dict]:
+    """
+    Simulate a run and return its curve, as one row per point.
+    The regret is the expected reward of always pulling the best arm, minus that of the arms pulled.
+    """
+    random.seed(run.seed)
+    np.random.seed(run.seed)
+    bandit = create_offline_bandit(run.bandit_type, run.hyperparameters)
+
+    population_p_success = np.asarray(run.arm_configuration, dtype=np.float64)
+    pulls = simulate_pulls(
+        bandit=bandit,
+        arm_ids=list(range(len(population_p_success))),
+        population_p_success=population_p_success,
+        n_pulls=run.n_pulls,
+        batch_size=run.batch_size,
+    )
+    cumulative_regret = np.cumsum(population_p_success.max() - population_p_success[pulls.arm_indexes])
+    cumulative_reward = np.cumsum(pulls.rewards)
+
+    # evenly spaced points, that fall at the end of a batch so their elapsed time is known
+    n_batches = len(pulls.elapsed_seconds)
+    batch_indexes = np.unique(np.linspace(0, n_batches - 1, min(run.n_points, n_batches)).round().astype(np.int64))
+    rows = []
+    for batch_index in batch_indexes.tolist():
+        n_pulls = min((batch_index + 1) * run.batch_size, run.n_pulls)
+        elapsed_seconds = float(pulls.elapsed_seconds[batch_index])
+        rows.append({
+            "bandit_type": run.bandit_type.value,
+            **{name: run.hyperparameters.get(name) for name in hyperparameter_names},
+            "arm_configuration": json.dumps(run.arm_configuration),
+            "n_arms": len(run.arm_configuration),
+            "seed": run.seed,
+            "n_pulls": n_pulls,
+            "cumulative_regret": float(cumulative_regret[n_pulls - 1]),
+            "avg_reward": float(cumulative_reward[n_pulls - 1] / n_pulls),
+            "elapsed_seconds": elapsed_seconds,
+            "pulls_per_second": n_pulls / elapsed_seconds if elapsed_seconds > 0 else None,
+        })
+    return rows
+
+
+def run_sweep(runs: Sequence[SweepRun], max_workers: Optional[int] = None) -> Iterator[Dict]:
+    """
+    Run the simulations in a pool of worker processes, and yield the rows of their curves in the order of the runs.
+    """
+    if max_workers == 1:
+        for run in runs:
+            yield from run_sweep_run(run)
+        return
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        for rows in executor.map(run_sweep_run, runs):
+            yield from rows
+
+
+def write_sweep_results(rows: Sequence[Dict], path: str) -> None:
+    """
+    Write the rows of a sweep to a csv file, or to a parquet file if the path ends with .parquet.
+    """
+    if path.endswith(".parquet"):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError as e:
+            raise ImportError("Writing parquet files requires pyarrow, install it or write to a .csv file") from e
+        pyarrow.parquet.write_table(pyarrow.Table.from_pylist(list(rows)), path)
+        return
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=sweep_columns)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def parse_args(args: Optional[Sequence[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Sweep bandit types and hyperparameters over simulated arms")
+    parser.add_argument("--bandit-types", nargs="+", default=[bandit_type.value for bandit_type in EnvironmentBanditConfig],
+                        choices=[bandit_type.value for bandit_type in EnvironmentBanditConfig])
+    for name in hyperparameter_names:
+        parser.add_argument(f"--{name}", nargs="+", type=float, default=[],
+                            help=f"values of {name} to sweep, the bandit's default when not given")
+    parser.add_argument("--arm-configurations", type=json.loads, default=default_arm_configurations,
+                        help="json list of arm configurations, each a list of population_p_success values")
+    parser.add_argument("--seeds", type=int, default=3, help="number of seeds per combination")
+    parser.add_argument("--n-pulls", type=int, default=10_000)
+    parser.add_argument("--batch-size", type=int, default=100,
+                        help="pulls per round, the bandit sees their rewards once the round is over")
+    parser.add_argument("--n-points", type=int, default=100, help="points per curve")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--output", default="sweep.csv")
+    return parser.parse_args(args)
+
+
+def main(args: Optional[Sequence[str]] = None) -> None:
+    args = parse_args(args)
+    runs = get_sweep_runs(
+        bandit_types=args.bandit_types,
+        hyperparameter_values={name: getattr(args, name) for name in hyperparameter_names},
+        arm_configurations=args.arm_configurations,
+        seeds=range(args.seeds),
+        n_pulls=args.n_pulls,
+        batch_size=args.batch_size,
+        n_points=args.n_points,
+    )
+    rows = list(run_sweep(runs, max_workers=args.workers))
+    write_sweep_results(rows, args.output)
+    print(f"Wrote {len(rows)} points of {len(runs)} runs to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+from unittest.mock import patch
+import pytest
+from sqlmodel import Session
+from maybee_backend.models.arm_stats import ArmStats, arm_stats_cache
+from maybee_backend.models.core_models import Arm, AvgRewardsPerArm, update_average_rewards_per_arm
+from maybee_backend.models import get_average_rewards_per_arm as get_average_rewards_per_arm_module
+from maybee_backend.models.get_average_rewards_per_arm import get_arm_stats
+from maybee_backend.bandits.epsilon_greedy import EpsilonGreedyBandit
+from tests.statics import TEST_ENVIRONMENT_ID, TEST_ARM_ID
+
+
+def test_arm_stats_from_rows():
+    arm_stats = ArmStats.from_rows([
+        AvgRewardsPerArm(arm_id=1, avg_reward=0.5, n_observations=2),
+        AvgRewardsPerArm(arm_id=2, avg_reward=None, n_observations=None),
+    ])
+    assert arm_stats.arm_ids.tolist() == [1, 2]
+    assert arm_stats.n_observations.tolist() == [2, 0]
+    assert arm_stats.avg_rewards.tolist() == [0.5, 0.0]
+    assert arm_stats.positions == {1: 0, 2: 1}
+
+
+def test_arm_stats_with_updates_copies_arrays():
+    arm_stats = ArmStats.from_rows([AvgRewardsPerArm(arm_id=1, avg_reward=0.5, n_observations=2)])
+    updated_arm_stats = arm_stats.with_updates([AvgRewardsPerArm(arm_id=1, avg_reward=0.7, n_observations=3)])
+    assert updated_arm_stats.avg_rewards.tolist() == [0.7]
+    assert updated_arm_stats.n_observations.tolist() == [3]
+    assert arm_stats.avg_rewards.tolist() == [0.5]
+    assert arm_stats.with_updates([AvgRewardsPerArm(arm_id=2, avg_reward=1.0, n_observations=1)]) is None
+
+
+@pytest.mark.usefixtures("environment", "arm", "avgrewardsperarm")
+def test_get_arm_stats_reads_the_db_once(session: Session):
+    with patch.object(
+        get_average_rewards_per_arm_module,
+        "get_average_rewards_per_arm",
+        wraps=get_average_rewards_per_arm_module.get_average_rewards_per_arm,
+    ) as get_average_rewards_per_arm:
+        for _ in range(3):
+            arm_stats = get_arm_stats(session=session, environment_id=TEST_ENVIRONMENT_ID)
+    assert get_average_rewards_per_arm.call_count == 1
+    assert arm_stats.arm_ids.tolist() == [TEST_ARM_ID]
+    assert arm_stats_cache.hits == 2
+    assert arm_stats_cache.misses == 1
+
+
+@pytest.mark.usefixtures("environment", "arm", "avgrewardsperarm")
+def test_update_average_rewards_per_arm_writes_through_to_cache(session: Session):
+    get_arm_stats(session=session, environment_id=TEST_ENVIRONMENT_ID)
+    update_average_rewards_per_arm(session=session, environment_id=TEST_ENVIRONMENT_ID, arm_id=TEST_ARM_ID, n_new_observations=1, avg_reward_of_new_observations=0.0)
+    arm_stats = arm_stats_cache.get(TEST_ENVIRONMENT_ID)
+    assert arm_stats.n_observations.tolist() == [2]
+    assert arm_stats.avg_rewards.tolist() == [0.5]
+
+
+@pytest.mark.usefixtures("environment", "arm", "avgrewardsperarm")
+def test_update_of_unknown_arm_invalidates_cache(session: Session):
+    get_arm_stats(session=session, environment_id=TEST_ENVIRONMENT_ID)
+    arm = Arm(environment_id=TEST_ENVIRONMENT_ID)
+    session.add(arm)
+    session.commit()
+    session.refresh(arm)
+    update_average_rewards_per_arm(session=session, environment_id=TEST_ENVIRONMENT_ID, arm_id=arm.arm_id, n_new_observations=1, avg_reward_of_new_observations=1.0)
+    assert TEST_ENVIRONMENT_ID not in arm_stats_cache
+    arm_stats = get_arm_stats(session=session, environment_id=TEST_ENVIRONMENT_ID)
+    assert sorted(arm_stats.arm_ids.tolist()) == sorted([TEST_ARM_ID, arm.arm_id])
+
+
+@pytest.mark.usefixtures("environment", "arm", "avgrewardsperarm")
+def test_bandit_chooses_arm_from_cache_without_db_reads(session: Session):
+    bandit = EpsilonGreedyBandit(session=session, environment_id=TEST_ENVIRONMENT_ID)
+    bandit.choose_arm()
+    with patch.object(session, "exec", side_effect=AssertionError("unexpected db read")):
+        _, arm_id = bandit.choose_arm()
+    assert arm_id == TEST_ARM_ID
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import datetime
+import random
+import numpy as np
+import pytest
+from sqlmodel import Session, select
+from maybee_backend.bandits.drifting_rewards import (
+    DiscountedUCBBandit,
+    DiscountedSoftmaxBandit,
+    SlidingWindowUCBBandit,
+    SlidingWindowSoftmaxBandit,
+)
+from maybee_backend.bandits.ucb1 import UCB1Bandit
+from maybee_backend.models.arm_stats import ArmStats
+from maybee_backend.models.core_models import (
+    Arm,
+    AvgRewardsPerArm,
+    BanditState,
+    Observation,
+    WindowedRewardsPerArm,
+    update_average_rewards_per_arm_in_batch,
+    update_windowed_rewards_per_arm,
+)
+from maybee_backend.models import reward_decay
+from tests.statics import TEST_ENVIRONMENT_ID, TEST_ARM_ID
+
+OTHER_ARM_ID = TEST_ARM_ID + 1
+start_datetime = datetime.datetime(2024, 1, 1)
+n_steps_before_drift = 150
+n_steps_after_drift = 100
+n_actions_per_step = 10
+
+
+@pytest.fixture(autouse=True)
+def short_memory(monkeypatch):
+    # one observation per second, forgotten within about a minute
+    monkeypatch.setattr(reward_decay, "reward_half_life_seconds", 20.0)
+    monkeypatch.setattr(reward_decay, "reward_window_seconds", 60.0)
+    monkeypatch.setattr(reward_decay, "reward_window_buckets", 6)
+
+
+@pytest.fixture(name="arms")
+def arms_fixture(session: Session):
+    # two arms without observations, as created by the arms endpoint
+    arms = []
+    for arm_id in [TEST_ARM_ID, OTHER_ARM_ID]:
+        arm = Arm(arm_id=arm_id, environment_id=TEST_ENVIRONMENT_ID)
+        session.add(arm)
+        session.add(AvgRewardsPerArm(
+            environment_id=TEST_ENVIRONMENT_ID, arm_id=arm_id, n_observations=0, sum_squared_reward=0.0
+        ))
+        arms.append(arm)
+    session.commit()
+    yield arms
+    for arm in arms:
+        session.delete(arm)
+    session.commit()
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = start_datetime
+
+    def __call__(self) -> datetime.datetime:
+        return self.now
+
+
+def simulate_drift(session: Session, bandit_class) -> float:
+    """
+    Choose a batch of arms every second. Arm TEST_ARM_ID pays 0.8 until the drift and 0.2 after it,
+    the other arm always pays 0.5.
+    Returns how often the other arm was chosen in the second half of the time after the drift.
+    """
+    rng = random.Random(1)
+    np.random.seed(1)
+    clock = FakeClock()
+    bandit = bandit_class(session=session, environment_id=TEST_ENVIRONMENT_ID)
+    if hasattr(bandit, "clock"):
+        bandit.clock = clock
+    chosen_arm_ids = []
+    for step in range(n_steps_before_drift + n_steps_after_drift):
+        clock.now = start_datetime + datetime.timedelta(seconds=step)
+        _, arm_ids = bandit.choose_arms(n_actions_per_step)
+        observations = []
+        for arm_id in arm_ids:
+            reward_rate = 0.5
+            if arm_id == TEST_ARM_ID:
+                reward_rate = 0.8 if step < n_steps_before_drift else 0.2
+            observations.append(Observation(
+                environment_id=TEST_ENVIRONMENT_ID,
+                arm_id=arm_id,
+                reward=float(rng.random() < reward_rate),
+                event_datetime=clock.now,
+            ))
+        update_average_rewards_per_arm_in_batch(session, TEST_ENVIRONMENT_ID, observations)
+        update_windowed_rewards_per_arm(session, TEST_ENVIRONMENT_ID, observations)
+        chosen_arm_ids.append(arm_ids)
+    last_arm_ids = np.array(chosen_arm_ids[-n_steps_after_drift // 2:])
+    return float(np.mean(last_arm_ids == OTHER_ARM_ID))
+
+
+@pytest.mark.usefixtures("environment", "arms")
+@pytest.mark.parametrize(
+    "bandit_class",
+    [DiscountedUCBBandit, DiscountedSoftmaxBandit, SlidingWindowUCBBandit, SlidingWindowSoftmaxBandit],
+)
+def test_drifting_rewards_bandit_follows_best_arm(session: Session, bandit_class):
+    assert simulate_drift(session, bandit_class) > 0.7
+
+
+@pytest.mark.usefixtures("environment", "arms")
+def test_ucb1_bandit_lags_behind_drift(session: Session):
+    # the long history of the formerly best arm keeps its all-time average up,
+    # so it is still chosen most of the time
+    assert simulate_drift(session, UCB1Bandit) < 0.5
+
+
+@pytest.mark.parametrize(
+    "bandit_class",
+    [DiscountedUCBBandit, DiscountedSoftmaxBandit, SlidingWindowUCBBandit, SlidingWindowSoftmaxBandit],
+)
+def test_drifting_rewards_bandit_no_arms(session: Session, bandit_class):
+    bandit = bandit_class(session=session, environment_id=TEST_ENVIRONMENT_ID)
+    bandit_state, arm_id = bandit.choose_arm()
+    assert bandit_state == BanditState.NO_ARMS_AVAILABLE
+    assert arm_id is None
+
+
+def test_discounted_stats_decay_with_half_life():
+    decay_epoch = reward_decay.get_decay_epoch(start_datetime)
+    discounted_rewards = reward_decay.discount_rewards([1.0, 0.0], [start_datetime, start_datetime])
+    arm_stats = ArmStats.from_rows([
+        AvgRewardsPerArm(
+            arm_id=1,
+            decay_epoch=decay_epoch,
+            discounted_n_observations=discounted_rewards.n_observations,
+            discounted_reward=discounted_rewards.reward,
+        )
+    ])
+    n_observations, avg_rewards = arm_stats.discounted(now=start_datetime + datetime.timedelta(seconds=40))
+    assert n_observations[0] == pytest.approx(0.5)
+    assert avg_rewards[0] == pytest.approx(0.5)
+
+
+@pytest.mark.usefixtures("environment", "arm")
+def test_discounted_upsert_carries_sums_into_next_epoch(session: Session):
+    # two observations a half life apart, on either side of an epoch boundary
+    next_epoch_start = datetime.datetime.fromtimestamp(
+        (reward_decay.get_decay_epoch(start_datetime) + 1) * reward_decay.get_epoch_seconds()
+    )
+    event_datetimes = [next_epoch_start - datetime.timedelta(seconds=10), next_epoch_start + datetime.timedelta(seconds=10)]
+    for reward, event_datetime in zip([1.0, 0.0], event_datetimes):
+        observation = Observation(
+            environment_id=TEST_ENVIRONMENT_ID, arm_id=TEST_ARM_ID, reward=reward, event_datetime=event_datetime
+        )
+        (avg_rewards_per_arm,) = update_average_rewards_per_arm_in_batch(session, TEST_ENVIRONMENT_ID, [observation])
+
+    n_observations, avg_rewards = ArmStats.from_rows([avg_rewards_per_arm]).discounted(now=event_datetimes[1])
+    assert avg_rewards_per_arm.decay_epoch == reward_decay.get_decay_epoch(next_epoch_start)
+    assert n_observations[0] == pytest.approx(1.5)
+    assert avg_rewards[0] == pytest.approx(0.5 / 1.5)
+
+
+@pytest.mark.usefixtures("environment", "arm")
+def test_windowed_rewards_reuse_bucket_slots(session: Session):
+    bucket_seconds = reward_decay.get_bucket_seconds()
+    observations = [
+        Observation(
+            environment_id=TEST_ENVIRONMENT_ID,
+            arm_id=TEST_ARM_ID,
+            reward=reward,
+            event_datetime=start_datetime + datetime.timedelta(seconds=seconds),
+        )
+        for reward, seconds in [(1.0, 0), (0.0, 1), (1.0, bucket_seconds), (0.0, 60)]
+    ]
+    update_windowed_rewards_per_arm(session, TEST_ENVIRONMENT_ID, observations[:3])
+    # a full window later, the first bucket's slot is reused
+    (windowed_rewards_per_arm,) = update_windowed_rewards_per_arm(session, TEST_ENVIRONMENT_ID, observations[3:])
+    assert windowed_rewards_per_arm.bucket_number == reward_decay.get_bucket_number(observations[3].event_datetime)
+    assert windowed_rewards_per_arm.n_observations == 1
+    assert windowed_rewards_per_arm.sum_reward == 0.0
+    assert len(session.exec(select(WindowedRewardsPerArm)).all()) == 2
+
+    # observations for a bucket that has already been reused are dropped
+    (windowed_rewards_per_arm,) = update_windowed_rewards_per_arm(session, TEST_ENVIRONMENT_ID, observations[:1])
+    assert windowed_rewards_per_arm.n_observations == 1
+    assert windowed_rewards_per_arm.sum_reward == 0.0
+
+    arm_stats = ArmStats.from_rows(
+        [AvgRewardsPerArm(arm_id=TEST_ARM_ID)], session.exec(select(WindowedRewardsPerArm)).all()
+    )
+    n_observations, avg_rewards = arm_stats.windowed(now=observations[3].event_datetime)
+    assert n_observations[0] == 2
+    assert avg_rewards[0] == 0.5
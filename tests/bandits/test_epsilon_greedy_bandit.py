@@ -1,9 +1,9 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
-import pytest
 from sqlmodel import Session
 from unittest.mock import patch
 from maybee_backend.bandits.epsilon_greedy import EpsilonGreedyBandit
+from maybee_backend.models.arm_stats import ArmStats
 from maybee_backend.models.core_models import BanditState, AvgRewardsPerArm
 
 
@@ -33,8 +33,8 @@ def test_epsilon_greedy_bandit_choose_arm_exploit(
             ),
         ]
         with patch(
-            "maybee_backend.bandits.epsilon_greedy.get_average_rewards_per_arm",
-            return_value=mock_rewards,
+            "maybee_backend.models.get_average_rewards_per_arm.get_arm_stats",
+            return_value=ArmStats.from_rows(mock_rewards),
         ):
             bandit_state, arm_id = bandit.choose_arm()
 
@@ -62,12 +62,12 @@ def test_epsilon_greedy_bandit_choose_arm_explore(
             ),
         ]
         with patch(
-            "maybee_backend.bandits.epsilon_greedy.get_average_rewards_per_arm",
-            return_value=mock_rewards,
+            "maybee_backend.models.get_average_rewards_per_arm.get_arm_stats",
+            return_value=ArmStats.from_rows(mock_rewards),
         ):
             with patch(
-                "random.choice", return_value=mock_rewards[1]
-            ):  # Always choose the second arm
+                "random.randrange", return_value=0
+            ):  # Always choose the first arm
                 bandit_state, arm_id = bandit.choose_arm()
 
     print(f"{bandit_state=} {arm_id=}")
@@ -92,8 +92,13 @@ def test_epsilon_greedy_bandit_no_rewards(session: Session):
     # Mock get_average_rewards_per_arm to return empty list
     with patch("random.uniform", return_value=0.2):
         with patch(
-            "maybee_backend.bandits.epsilon_greedy.get_average_rewards_per_arm",
-            return_value=[],
+            "maybee_backend.models.get_average_rewards_per_arm.get_arm_stats",
+            return_value=ArmStats.from_rows([]),
         ):
-            with pytest.raises(IndexError):
-                bandit.choose_arm()
+            bandit_state, arm_id = bandit.choose_arm()
+            bandit_states, arm_ids = bandit.choose_arms(3)
+
+    assert bandit_state == BanditState.NO_ARMS_AVAILABLE
+    assert arm_id is None
+    assert bandit_states == [BanditState.NO_ARMS_AVAILABLE] * 3
+    assert arm_ids == [None] * 3
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import math
+import numpy as np
+import pytest
+from maybee_backend.bandits.kernels import (
+    greedy_index,
+    uniform_index,
+    softmax_probabilities,
+    softmax_index,
+    ucb1_values,
+    ucb1_index,
+    unobserved_index,
+    epsilon_greedy_indexes,
+    softmax_indexes,
+    ucb1_indexes,
+    epsilon_greedy_probabilities,
+    ucb1_probabilities,
+    estimate_choice_probabilities,
+)
+
+
+def test_greedy_index_picks_first_maximum():
+    assert greedy_index(np.array([0.1, 0.7, 0.7, 0.2])) == 1
+
+
+def test_kernels_raise_on_empty_arms():
+    with pytest.raises(IndexError):
+        greedy_index(np.array([]))
+    with pytest.raises(IndexError):
+        uniform_index(0)
+    with pytest.raises(IndexError):
+        softmax_index(np.array([]), tau=0.1)
+
+
+def test_uniform_index_covers_all_arms():
+    assert {uniform_index(3) for _ in range(200)} == {0, 1, 2}
+
+
+def test_softmax_probabilities_match_definition():
+    avg_rewards = np.array([0.5, 0.7, 0.3])
+    exp_values = [math.exp(avg_reward / 0.1) for avg_reward in avg_rewards]
+    expected = [exp_value / sum(exp_values) for exp_value in exp_values]
+    assert softmax_probabilities(avg_rewards, tau=0.1) == pytest.approx(expected)
+
+
+def test_softmax_probabilities_dont_overflow():
+    # math.exp(1000 / 0.1) overflows
+    probabilities = softmax_probabilities(np.array([1000.0, 999.0, 0.0]), tau=0.1)
+    assert np.isfinite(probabilities).all()
+    assert probabilities.sum() == pytest.approx(1.0)
+    assert probabilities[0] > probabilities[1] > probabilities[2]
+
+
+def test_ucb1_values_match_definition():
+    n_observations = np.array([10, 20, 30])
+    avg_rewards = np.array([0.5, 0.7, 0.3])
+    expected = [
+        avg_reward + math.sqrt(2 * math.log(60) / n)
+        for avg_reward, n in zip(avg_rewards, n_observations)
+    ]
+    assert ucb1_values(n_observations, avg_rewards) == pytest.approx(expected)
+    assert ucb1_index(n_observations, avg_rewards) == int(np.argmax(expected))
+
+
+def test_unobserved_index():
+    assert unobserved_index(np.array([3, 0, 0])) == 1
+    assert unobserved_index(np.array([3, 1, 2])) == -1
+
+
+def test_epsilon_greedy_indexes_explore_with_probability_epsilon():
+    np.random.seed(1)
+    avg_rewards = np.array([0.1, 0.9, 0.5])
+    indexes, explore = epsilon_greedy_indexes(avg_rewards, epsilon=0.2, n=10_000)
+    assert (indexes[~explore] == 1).all()
+    assert explore.mean() == pytest.approx(0.2, abs=0.02)
+    assert set(indexes[explore].tolist()) == {0, 1, 2}
+
+
+def test_softmax_indexes_follow_softmax_probabilities():
+    np.random.seed(1)
+    avg_rewards = np.array([0.5, 0.7, 0.3])
+    indexes = softmax_indexes(avg_rewards, tau=0.1, n=20_000)
+    frequencies = np.bincount(indexes, minlength=3) / len(indexes)
+    assert frequencies == pytest.approx(softmax_probabilities(avg_rewards, tau=0.1), abs=0.02)
+
+
+def test_ucb1_indexes_explore_unobserved_arms_first():
+    indexes, explore = ucb1_indexes(np.array([0, 10, 0, 10]), np.array([0.0, 0.2, 0.0, 0.8]), n=4)
+    assert indexes.tolist() == [0, 2, 3, 3]
+    assert explore.tolist() == [True, True, False, False]
+
+
+def test_ucb1_indexes_round_robin_without_observations():
+    indexes, explore = ucb1_indexes(np.array([0, 0]), np.array([0.0, 0.0]), n=3)
+    assert indexes.tolist() == [0, 1, 0]
+    assert explore.all()
+
+
+def test_epsilon_greedy_probabilities_match_indexes():
+    np.random.seed(1)
+    avg_rewards = np.array([0.2, 0.8, 0.5])
+    probabilities = epsilon_greedy_probabilities(avg_rewards, epsilon=0.3)
+    assert probabilities == pytest.approx([0.1, 0.8, 0.1])
+    indexes, _ = epsilon_greedy_indexes(avg_rewards, epsilon=0.3, n=20_000)
+    frequencies = np.bincount(indexes, minlength=3) / len(indexes)
+    assert frequencies == pytest.approx(probabilities, abs=0.02)
+
+
+def test_ucb1_probabilities_pick_the_next_arm():
+    assert ucb1_probabilities(np.array([0, 10, 0]), np.array([0.0, 0.8, 0.0])).tolist() == [1.0, 0.0, 0.0]
+    assert ucb1_probabilities(np.array([10, 10]), np.array([0.2, 0.8])).tolist() == [0.0, 1.0]
+
+
+def test_estimate_choice_probabilities_are_smoothed():
+    probabilities = estimate_choice_probabilities(np.array([0, 0, 0, 1]), n_arms=3)
+    assert probabilities.sum() == pytest.approx(1.0)
+    assert probabilities.tolist() == pytest.approx([4 / 7, 2 / 7, 1 / 7])
@@ -6,6 +6,7 @@ from sqlmodel import Session
 from maybee_backend.database import get_session
 from unittest.mock import patch
 from maybee_backend.bandits.softmax import SoftmaxBandit
+from maybee_backend.models.arm_stats import ArmStats
 from maybee_backend.models.core_models import BanditState, AvgRewardsPerArm
 
 
@@ -32,8 +33,8 @@ def test_softmax_bandit_choose_arm(session: Session = Depends(get_session)):
     ]
 
     with patch(
-        "maybee_backend.bandits.softmax.get_average_rewards_per_arm",
-        return_value=mock_rewards,
+        "maybee_backend.models.get_average_rewards_per_arm.get_arm_stats",
+        return_value=ArmStats.from_rows(mock_rewards),
     ):
         with patch(
             "numpy.random.choice", return_value=1
@@ -62,8 +63,8 @@ def test_softmax_bandit_probability_distribution(
     ]
 
     with patch(
-        "maybee_backend.bandits.softmax.get_average_rewards_per_arm",
-        return_value=mock_rewards,
+        "maybee_backend.models.get_average_rewards_per_arm.get_arm_stats",
+        return_value=ArmStats.from_rows(mock_rewards),
     ):
         with patch("numpy.random.choice") as mock_choice:
             bandit.choose_arm()
@@ -95,8 +96,8 @@ def test_softmax_bandit_tau_effect(session: Session = Depends(get_session)):
 
     def get_probs(bandit):
         with patch(
-            "maybee_backend.bandits.softmax.get_average_rewards_per_arm",
-            return_value=mock_rewards,
+            "maybee_backend.models.get_average_rewards_per_arm.get_arm_stats",
+            return_value=ArmStats.from_rows(mock_rewards),
         ):
             with patch("numpy.random.choice") as mock_choice:
                 bandit.choose_arm()
@@ -115,7 +116,7 @@ def test_softmax_bandit_no_rewards(session: Session = Depends(get_session)):
     bandit = SoftmaxBandit(session=session, environment_id=1, tau=0.1)
 
     with patch(
-        "maybee_backend.bandits.softmax.get_average_rewards_per_arm", return_value=[]
+        "maybee_backend.models.get_average_rewards_per_arm.get_arm_stats", return_value=ArmStats.from_rows([])
     ):
         bandit_state, arm_id = bandit.choose_arm()
 
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+from collections import Counter
+from unittest.mock import patch
+import numpy as np
+import pytest
+from sqlmodel import Session
+from maybee_backend.bandits.thompson_sampling import (
+    ThompsonSamplingBandit,
+    GaussianThompsonSamplingBandit,
+)
+from maybee_backend.models.arm_stats import ArmStats
+from maybee_backend.models.core_models import BanditState, AvgRewardsPerArm
+
+
+mock_rewards = [
+    AvgRewardsPerArm(arm_id=1, avg_reward=0.2, n_observations=500, sum_squared_reward=100.0),
+    AvgRewardsPerArm(arm_id=2, avg_reward=0.8, n_observations=500, sum_squared_reward=400.0),
+    AvgRewardsPerArm(arm_id=3, avg_reward=0.5, n_observations=2, sum_squared_reward=0.5),
+]
+
+
+@pytest.mark.parametrize("bandit_class", [ThompsonSamplingBandit, GaussianThompsonSamplingBandit])
+def test_thompson_sampling_bandit_prefers_best_arm(session: Session, bandit_class):
+    np.random.seed(1)
+    bandit = bandit_class(session=session, environment_id=1)
+    with patch(
+        "maybee_backend.models.get_average_rewards_per_arm.get_arm_stats",
+        return_value=ArmStats.from_rows(mock_rewards),
+    ):
+        bandit_states, arm_ids = bandit.choose_arms(1000)
+        bandit_state, arm_id = bandit.choose_arm()
+
+    assert set(bandit_states) == {BanditState.NOT_APPLICABLE}
+    assert bandit_state == BanditState.NOT_APPLICABLE
+    assert arm_id in {1, 2, 3}
+    counts = Counter(arm_ids)
+    # the well observed worse arm is practically never chosen, the uncertain one sometimes
+    assert counts[2] > counts[3] > counts[1]
+
+
+@pytest.mark.parametrize("bandit_class", [ThompsonSamplingBandit, GaussianThompsonSamplingBandit])
+def test_thompson_sampling_bandit_no_rewards(session: Session, bandit_class):
+    bandit = bandit_class(session=session, environment_id=1)
+    with patch(
+        "maybee_backend.models.get_average_rewards_per_arm.get_arm_stats",
+        return_value=ArmStats.from_rows([]),
+    ):
+        bandit_state, arm_id = bandit.choose_arm()
+
+    assert bandit_state == BanditState.NO_ARMS_AVAILABLE
+    assert arm_id is None
+
+
+def test_thompson_sampling_posterior_parameters():
+    posteriors = ThompsonSamplingBandit.get_posterior_parameters(ArmStats.from_rows(mock_rewards))
+    assert posteriors[1] == {"alpha": 401.0, "beta": 101.0}
+
+    posteriors = GaussianThompsonSamplingBandit.get_posterior_parameters(ArmStats.from_rows(mock_rewards))
+    # 2 observations of 0.5: no spread around their mean
+    assert posteriors[2]["mu"] == pytest.approx(1 / 3)
+    assert posteriors[2]["kappa"] == 3.0
+    assert posteriors[2]["alpha"] == 2.0
+    assert posteriors[2]["beta"] == pytest.approx(1 + 2 * 0.25 / 6)
+
+
+@pytest.mark.parametrize("bandit_class", [ThompsonSamplingBandit, GaussianThompsonSamplingBandit])
+def test_thompson_sampling_probabilities_are_estimated_once_per_arm_stats(session: Session, bandit_class):
+    bandit = bandit_class(session=session, environment_id=1)
+    arm_stats = ArmStats.from_rows(mock_rewards)
+    draw_sizes = []
+    draw_arm_indexes = bandit.draw_arm_indexes
+
+    def draw_and_count(arm_stats, n):
+        draw_sizes.append(n)
+        return draw_arm_indexes(arm_stats, n=n)
+
+    with patch.object(bandit, "draw_arm_indexes", draw_and_count):
+        bandit_states, arm_indexes, probabilities = bandit.choose_arm_indexes_with_probabilities(arm_stats, n=5)
+        assert bandit.get_arm_probabilities(arm_stats) is probabilities
+        _, arm_ids, propensities = bandit.choose_arms_with_propensities(arm_stats, n=1)
+        # the choices are drawn from the sample the probabilities are estimated from
+        assert draw_sizes == [1000, 1]
+
+        updated_arm_stats = arm_stats.with_updates([mock_rewards[0]])
+        assert updated_arm_stats.derived == {}
+        bandit.get_arm_probabilities(updated_arm_stats)
+        assert draw_sizes == [1000, 1, 1000]
+
+    assert bandit_states == [BanditState.NOT_APPLICABLE] * 5
+    assert len(arm_indexes) == 5
+    assert probabilities.sum() == pytest.approx(1.0)
+    assert propensities == [probabilities[arm_stats.positions[arm_ids[0]]]]
+
+
+def test_thompson_sampling_propensities_without_arms(session: Session):
+    bandit = ThompsonSamplingBandit(session=session, environment_id=1)
+    assert bandit.choose_arms_with_propensities(ArmStats.from_rows([]), n=2) == (
+        [BanditState.NO_ARMS_AVAILABLE] * 2, [None] * 2, [None] * 2
+    )
@@ -6,6 +6,7 @@ from sqlmodel import Session
 from maybee_backend.database import get_session
 import math
 from maybee_backend.bandits.ucb1 import UCB1Bandit
+from maybee_backend.models.arm_stats import ArmStats
 from maybee_backend.models.core_models import BanditState, AvgRewardsPerArm
 from tests.statics import TEST_ENVIRONMENT_ID
 
@@ -33,8 +34,8 @@ def test_ucb1_bandit_choose_arm_not_applicable(session: Session = Depends(get_se
     ]
 
     with patch(
-        "maybee_backend.bandits.ucb1.get_average_rewards_per_arm",
-        return_value=mock_rewards,
+        "maybee_backend.models.get_average_rewards_per_arm.get_arm_stats",
+        return_value=ArmStats.from_rows(mock_rewards),
     ):
         bandit_state, arm_id = bandit.choose_arm()
 
@@ -58,8 +59,8 @@ def test_ucb1_bandit_ucb_calculation(session: Session = Depends(get_session)):
     ]
 
     with patch(
-        "maybee_backend.bandits.ucb1.get_average_rewards_per_arm",
-        return_value=mock_rewards,
+        "maybee_backend.models.get_average_rewards_per_arm.get_arm_stats",
+        return_value=ArmStats.from_rows(mock_rewards),
     ):
         bandit_state, arm_id = bandit.choose_arm()
 
@@ -77,7 +78,7 @@ def test_ucb1_bandit_no_rewards(session: Session = Depends(get_session)):
     bandit = UCB1Bandit(session=session, environment_id=1, epsilon=0.05)
 
     with patch(
-        "maybee_backend.bandits.ucb1.get_average_rewards_per_arm", return_value=[]
+        "maybee_backend.models.get_average_rewards_per_arm.get_arm_stats", return_value=ArmStats.from_rows([])
     ):
         bandit_state, arm_id = bandit.choose_arm()
 
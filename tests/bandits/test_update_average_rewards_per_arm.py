@@ -1,11 +1,20 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
+import os
+import random
+from concurrent.futures import ThreadPoolExecutor
 import pytest
-from sqlmodel import select, Session
+from sqlalchemy import delete, func
+from sqlalchemy.engine import Engine
+from sqlmodel import select, Session, SQLModel, create_engine
 from maybee_backend.models.core_models import update_average_rewards_per_arm
-from maybee_backend.models.core_models import AvgRewardsPerArm
+from maybee_backend.models.core_models import AvgRewardsPerArm, Arm, Environment, Observation
 from tests.statics import TEST_ENVIRONMENT_ID, TEST_ARM_ID
 
+postgres_db_uri = os.getenv("TEST_POSTGRES_DB_URI", None)
+n_parallel_observations = 2000
+n_workers = 16
+
 
 @pytest.mark.usefixtures("environment", "arm", "avgrewardsperarm")
 def test_update_average_rewards_per_arm(session: Session):
@@ -18,4 +27,61 @@ def test_update_average_rewards_per_arm(session: Session):
     avg_rewards_per_arm = session.exec(sql).first()
     assert avg_rewards_per_arm.n_observations == 11
     assert avg_rewards_per_arm.avg_reward == (9 / 11)
-    
+
+
+@pytest.mark.usefixtures("environment", "arm")
+def test_update_average_rewards_per_arm_creates_missing_row(session: Session):
+    avg_rewards_per_arm = update_average_rewards_per_arm(session=session, environment_id=TEST_ENVIRONMENT_ID, arm_id=TEST_ARM_ID, n_new_observations=2, avg_reward_of_new_observations=0.5)
+    assert avg_rewards_per_arm.n_observations == 2
+    assert avg_rewards_per_arm.avg_reward == 0.5
+
+
+def fire_parallel_observations(engine: Engine) -> None:
+    """
+    Report n_parallel_observations rewards for the same arm from n_workers threads at once.
+    """
+    rng = random.Random(1)
+    rewards = [float(rng.random() < 0.3) for _ in range(n_parallel_observations)]
+
+    def _create_observation(reward: float):
+        with Session(engine) as session:
+            session.add(Observation(environment_id=TEST_ENVIRONMENT_ID, arm_id=TEST_ARM_ID, reward=reward))
+            update_average_rewards_per_arm(session=session, environment_id=TEST_ENVIRONMENT_ID, arm_id=TEST_ARM_ID, n_new_observations=1, avg_reward_of_new_observations=reward, commit=False)
+            session.commit()
+
+    with ThreadPoolExecutor(max_workers=n_workers) as executor:
+        list(executor.map(_create_observation, rewards))
+
+
+def assert_avg_rewards_per_arm_matches_observations(session: Session) -> None:
+    sql = select(func.count(), func.avg(Observation.reward)).where(Observation.arm_id == TEST_ARM_ID)
+    n_observations, avg_reward = session.exec(sql).one()
+    sql = select(AvgRewardsPerArm).where(AvgRewardsPerArm.arm_id == TEST_ARM_ID)
+    avg_rewards_per_arm = session.exec(sql).one()
+    assert n_observations == n_parallel_observations
+    assert avg_rewards_per_arm.n_observations == n_observations
+    assert avg_rewards_per_arm.avg_reward == pytest.approx(avg_reward)
+
+
+@pytest.mark.usefixtures("environment", "arm")
+def test_update_average_rewards_per_arm_under_concurrency(session: Session):
+    fire_parallel_observations(engine=session.get_bind())
+    assert_avg_rewards_per_arm_matches_observations(session=session)
+
+
+@pytest.mark.skipif(postgres_db_uri is None, reason="TEST_POSTGRES_DB_URI is not set")
+def test_update_average_rewards_per_arm_under_concurrency_postgres():
+    engine = create_engine(postgres_db_uri, pool_size=n_workers)
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.add(Environment(environment_id=TEST_ENVIRONMENT_ID))
+        session.add(Arm(arm_id=TEST_ARM_ID, environment_id=TEST_ENVIRONMENT_ID))
+        session.commit()
+        try:
+            fire_parallel_observations(engine=engine)
+            assert_avg_rewards_per_arm_matches_observations(session=session)
+        finally:
+            for table in [Observation, AvgRewardsPerArm, Arm, Environment]:
+                session.exec(delete(table))
+            session.commit()
+    engine.dispose()
@@ -1,22 +1,49 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
+from contextlib import contextmanager
+from typing import Iterator
 import pytest
 from sqlmodel import Session, create_engine, SQLModel
+from sqlmodel.ext.asyncio.session import AsyncSession
 from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import NullPool
 from maybee_backend.main import app
 from fastapi.testclient import TestClient
 from maybee_backend.config import get_config
-from maybee_backend.database import get_session
-from sqlmodel.pool import StaticPool
+from maybee_backend.database import get_session, get_async_session, get_async_db_uri
 from maybee_backend.api.routes import get_password_hash
 from maybee_backend.models.core_models import Action, Environment, Arm, AvgRewardsPerArm, BanditState
 from maybee_backend.models.user_models import User, UserEnvironmentLink
+from maybee_backend.models.arm_stats import arm_stats_cache
+from maybee_backend.models.user_cache import authenticated_user_cache, environment_access_cache
+from maybee_backend.query_profiler import QueryProfile, profile_queries
 from tests.statics import (TEST_USER_ID, TEST_USER_USERNAME, TEST_USER_PASSWORD, TEST_ARM_ID, TEST_ENVIRONMENT_ID, TEST_ADMIN_USER_USERNAME, TEST_ADMIN_USER_ID)
 
 
 class TestingConfig:
     secret_key = "test_secret_key"
     db_uri = "sqlite:///:memory:?check_same_thread=False"
+    async_db_uri = None
+    db_pool_size = 5
+    db_max_overflow = 10
+    db_pool_pre_ping = True
+    db_pool_recycle = 1800
+    arm_stats_cache_size = 1024
+    arm_stats_cache_ttl_seconds = 5.0
+    user_cache_size = 10_000
+    user_cache_ttl_seconds = 60.0
+    environment_access_cache_size = 10_000
+    environment_access_cache_ttl_seconds = 60.0
+    observation_buffer_enabled = False
+    observation_buffer_max_rows = 100_000
+    observation_buffer_flush_rows = 5_000
+    observation_buffer_flush_interval_ms = 200.0
+    reward_half_life_seconds = 86400.0
+    reward_window_seconds = 3600.0
+    reward_window_buckets = 12
+    metrics_enabled = True
+    query_profiler = "header"
 
 
 def get_test_config():
@@ -51,24 +78,51 @@ def override_get_session(monkeypatch):
     monkeypatch.setattr("maybee_backend.database.get_session", get_test_session)
 
 
+@pytest.fixture(autouse=True)
+def clear_caches():
+    # every test starts from a fresh database, with the same ids
+    arm_stats_cache.clear()
+    authenticated_user_cache.clear()
+    environment_access_cache.clear()
+    yield
+    arm_stats_cache.clear()
+    authenticated_user_cache.clear()
+    environment_access_cache.clear()
+
+
+@pytest.fixture(name="db_uri")
+def db_uri_fixture(tmp_path):
+    # a database file, so the sync and the async engine see the same data
+    return f"sqlite:///{tmp_path}/test.db"
+
+
 @pytest.fixture(name="session", scope="function", autouse=True)
-def session_fixture():
-    config = TestingConfig()
-    engine = create_engine(
-        config.db_uri, connect_args={"check_same_thread": False}, poolclass=StaticPool
-    )
+def session_fixture(db_uri: str):
+    engine = create_engine(db_uri, connect_args={"check_same_thread": False})
     SQLModel.metadata.create_all(engine)
 
     with Session(engine) as session:
         yield session
+    engine.dispose()
+
+
+@pytest.fixture(name="async_engine")
+def async_engine_fixture(db_uri: str):
+    # connections are not pooled, as each request of the test client runs in its own event loop
+    return create_async_engine(get_async_db_uri(db_uri), poolclass=NullPool)
 
 
 @pytest.fixture(name="client", autouse=True)
-def client_fixture(session: Session):
+def client_fixture(session: Session, async_engine):
     def get_session_override():
         return session
 
+    async def get_async_session_override():
+        async with AsyncSession(async_engine, expire_on_commit=False) as async_session:
+            yield async_session
+
     app.dependency_overrides[get_session] = get_session_override
+    app.dependency_overrides[get_async_session] = get_async_session_override
     app.dependency_overrides[get_config] = get_test_config
 
     client = TestClient(app)
@@ -76,6 +130,23 @@ def client_fixture(session: Session):
     app.dependency_overrides.clear()
 
 
+@pytest.fixture(name="max_queries")
+def max_queries_fixture():
+    """
+    Fail when a block runs more sql statements than allowed, to catch query count regressions:
+
+        with max_queries(3):
+            client.post(...)
+    """
+
+    @contextmanager
+    def max_queries(n: int) -> Iterator[QueryProfile]:
+        with profile_queries() as profile:
+            yield profile
+        assert profile.n_queries <= n, f"Expected at most {n} queries, ran {profile.summary(all_shapes=True)}"
+
+    return max_queries
+
 
 @pytest.fixture(name="user")
 def user_fixture(session: Session):
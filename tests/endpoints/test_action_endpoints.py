@@ -1,11 +1,18 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
+import datetime
+import json
 import pytest
 from fastapi.testclient import TestClient
+from sqlmodel import Session, select
 
-from maybee_backend.models.core_models import Action
+from maybee_backend.api import routes
+from maybee_backend.api.export import action_columns, read_csv_columns
+from maybee_backend.models.core_models import Action, AvgRewardsPerArm, Observation
+from maybee_backend.models.user_cache import get_cached_environment_ids
+from maybee_backend.models.user_models import UserEnvironmentLink
 
-from tests.statics import TEST_USER_USERNAME, TEST_USER_PASSWORD, TEST_ENVIRONMENT_ID
+from tests.statics import TEST_USER_USERNAME, TEST_USER_PASSWORD, TEST_USER_ID, TEST_ENVIRONMENT_ID, TEST_ARM_ID
 from tests.endpoints.test_core_api_functionality import get_auth_token
 from tests.validate_dataclass_object import validate_dataclass_object
 
@@ -22,3 +29,309 @@ def test_create_action(client: TestClient):
     assert response.status_code == 200
     is_valid, result = validate_dataclass_object(response.json(), Action)
     assert is_valid, f"Invalid action data: {result}"
+    # the only arm is always chosen
+    assert response.json()["propensity"] == 1.0
+
+
+# Test create a batch of actions with auth -> should succeed
+@pytest.mark.usefixtures("user", "environment", "userenvironmentlink", "arm", "avgrewardsperarm")
+def test_create_actions_in_batch(client: TestClient, session: Session):
+    token = get_auth_token(
+        client=client, username=TEST_USER_USERNAME, password=TEST_USER_PASSWORD
+    )
+    response = client.post(
+        f"/environments/{TEST_ENVIRONMENT_ID}/actions/batch",
+        params={"n": 5},
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    assert response.status_code == 200
+    actions = response.json()
+    assert actions["n_actions"] == 5
+    assert actions["arm_ids"] == [TEST_ARM_ID] * 5
+    assert len(actions["bandit_states"]) == 5
+    assert len(set(actions["action_ids"])) == 5
+
+    sql = select(Action).where(Action.environment_id == TEST_ENVIRONMENT_ID)
+    assert sorted(action.action_id for action in session.exec(sql).all()) == sorted(actions["action_ids"])
+    assert all(action.propensity == 1.0 for action in session.exec(sql).all())
+
+
+# Test create a batch of actions in an environment without arms -> should succeed without arms
+@pytest.mark.usefixtures("user", "environment", "userenvironmentlink")
+def test_create_actions_in_batch_without_arms(client: TestClient):
+    token = get_auth_token(
+        client=client, username=TEST_USER_USERNAME, password=TEST_USER_PASSWORD
+    )
+    response = client.post(
+        f"/environments/{TEST_ENVIRONMENT_ID}/actions/batch",
+        params={"n": 3},
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    assert response.status_code == 200
+    actions = response.json()
+    assert actions["arm_ids"] == [None] * 3
+    assert actions["bandit_states"] == ["NO_ARMS_AVAILABLE"] * 3
+
+
+@pytest.mark.usefixtures("user", "environment", "userenvironmentlink", "arm", "avgrewardsperarm")
+@pytest.mark.parametrize("n", [0, 10_001])
+def test_create_actions_in_batch_rejects_invalid_n(client: TestClient, n: int):
+    token = get_auth_token(
+        client=client, username=TEST_USER_USERNAME, password=TEST_USER_PASSWORD
+    )
+    response = client.post(
+        f"/environments/{TEST_ENVIRONMENT_ID}/actions/batch",
+        params={"n": n},
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    assert response.status_code == 422
+
+
+# Test that access to an environment follows its links, through the cached environment ids -> should succeed
+@pytest.mark.usefixtures("user", "environment", "arm", "avgrewardsperarm")
+def test_create_action_follows_environment_links(client: TestClient, session: Session):
+    token = get_auth_token(
+        client=client, username=TEST_USER_USERNAME, password=TEST_USER_PASSWORD
+    )
+    headers = {"Authorization": f"Bearer {token}"}
+    url = f"/environments/{TEST_ENVIRONMENT_ID}/actions"
+    assert client.post(url, headers=headers).status_code == 401
+    assert get_cached_environment_ids(TEST_USER_ID) == frozenset()
+
+    user_environment_link = UserEnvironmentLink(environment_id=TEST_ENVIRONMENT_ID, user_id=TEST_USER_ID)
+    session.add(user_environment_link)
+    session.commit()
+    assert get_cached_environment_ids(TEST_USER_ID) is None
+    assert client.post(url, headers=headers).status_code == 200
+    assert client.post(url, headers=headers).status_code == 200
+    assert get_cached_environment_ids(TEST_USER_ID) == frozenset([TEST_ENVIRONMENT_ID])
+    # the cached ids refuse other environments without a query
+    assert client.post(f"/environments/{TEST_ENVIRONMENT_ID + 1}/actions", headers=headers).status_code == 401
+
+    session.delete(user_environment_link)
+    session.commit()
+    assert client.post(url, headers=headers).status_code == 401
+
+
+@pytest.fixture(name="actions")
+def actions_fixture(session: Session):
+    # pairs of actions share an event_datetime, so pages have to break ties on action_id
+    start_datetime = datetime.datetime(2024, 1, 1)
+    actions = [
+        Action(
+            environment_id=TEST_ENVIRONMENT_ID,
+            arm_id=TEST_ARM_ID,
+            bandit_state="explore",
+            event_datetime=start_datetime + datetime.timedelta(seconds=i // 2),
+        )
+        for i in range(25)
+    ]
+    session.add_all(actions)
+    session.commit()
+    return sorted(actions, key=lambda action: (action.event_datetime, action.action_id))
+
+
+def get_all_pages(client: TestClient, url: str, headers: dict, params: dict) -> list:
+    pages = []
+    cursor = None
+    while True:
+        response = client.get(url, params={**params, **({"cursor": cursor} if cursor else {})}, headers=headers)
+        assert response.status_code == 200
+        pages.append(response.json())
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            return pages
+
+
+# Test paging through the actions of an environment -> should return every action once, in order
+@pytest.mark.usefixtures("user", "environment", "userenvironmentlink", "arm")
+@pytest.mark.parametrize("sorting_mode", ["earliest", "latest"])
+def test_get_actions_in_pages(client: TestClient, actions, sorting_mode):
+    token = get_auth_token(
+        client=client, username=TEST_USER_USERNAME, password=TEST_USER_PASSWORD
+    )
+    pages = get_all_pages(
+        client,
+        f"/environments/{TEST_ENVIRONMENT_ID}/actions",
+        headers={"Authorization": f"Bearer {token}"},
+        params={"limit": 10, "sorting_mode": sorting_mode},
+    )
+    assert [len(page) for page in pages] == [10, 10, 5]
+    action_ids = [action["action_id"] for page in pages for action in page]
+    expected_action_ids = [action.action_id for action in actions]
+    if sorting_mode == "latest":
+        expected_action_ids = expected_action_ids[::-1]
+    assert action_ids == expected_action_ids
+
+
+# Test streaming the actions of an environment -> should return every action as a line of json
+@pytest.mark.usefixtures("user", "environment", "userenvironmentlink", "arm")
+def test_stream_actions(client: TestClient, actions):
+    token = get_auth_token(
+        client=client, username=TEST_USER_USERNAME, password=TEST_USER_PASSWORD
+    )
+    url = f"/environments/{TEST_ENVIRONMENT_ID}/actions"
+    headers = {"Authorization": f"Bearer {token}"}
+    response = client.get(url, params={"format": "ndjson"}, headers=headers)
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    streamed_actions = [json.loads(line) for line in response.text.splitlines()]
+    assert [action["action_id"] for action in streamed_actions] == [action.action_id for action in actions]
+
+    # a stream continues after a cursor
+    cursor = client.get(url, params={"limit": 20}, headers=headers).headers["X-Next-Cursor"]
+    response = client.get(url, params={"format": "ndjson", "cursor": cursor}, headers=headers)
+    assert [json.loads(line)["action_id"] for line in response.text.splitlines()] == [
+        action.action_id for action in actions[20:]
+    ]
+
+
+# Test an invalid cursor -> should fail
+@pytest.mark.usefixtures("user", "environment", "userenvironmentlink")
+def test_get_actions_rejects_invalid_cursor(client: TestClient):
+    token = get_auth_token(
+        client=client, username=TEST_USER_USERNAME, password=TEST_USER_PASSWORD
+    )
+    response = client.get(
+        f"/environments/{TEST_ENVIRONMENT_ID}/actions",
+        params={"cursor": "INVALID_CURSOR"},
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    assert response.status_code == 422
+
+
+# Test exporting the actions of an environment as csv -> should return every action, without bandit_state
+@pytest.mark.usefixtures("user", "environment", "userenvironmentlink", "arm")
+def test_export_actions_as_csv(client: TestClient, actions):
+    token = get_auth_token(
+        client=client, username=TEST_USER_USERNAME, password=TEST_USER_PASSWORD
+    )
+    response = client.get(
+        f"/environments/{TEST_ENVIRONMENT_ID}/actions/export",
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+    assert f'filename="environment_{TEST_ENVIRONMENT_ID}_actions.csv"' in response.headers["content-disposition"]
+    columns = read_csv_columns(response.text, action_columns)
+    assert "bandit_state" not in columns
+    assert columns["action_id"].tolist() == [action.action_id for action in actions]
+
+
+# Test exporting the actions of an environment as an arrow stream -> should return every action
+@pytest.mark.usefixtures("user", "environment", "userenvironmentlink", "arm")
+def test_export_actions_as_arrow(client: TestClient, actions):
+    pyarrow_ipc = pytest.importorskip("pyarrow.ipc")
+
+    token = get_auth_token(
+        client=client, username=TEST_USER_USERNAME, password=TEST_USER_PASSWORD
+    )
+    response = client.get(
+        f"/environments/{TEST_ENVIRONMENT_ID}/actions/export",
+        params={"format": "arrow"},
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/vnd.apache.arrow.stream"
+    table = pyarrow_ipc.open_stream(response.content).read_all()
+    assert table.column("action_id").to_pylist() == [action.action_id for action in actions]
+
+
+# Test exporting as parquet without pyarrow on the server -> should fail
+@pytest.mark.usefixtures("user", "environment", "userenvironmentlink")
+def test_export_actions_without_pyarrow(client: TestClient, monkeypatch):
+    def import_pyarrow():
+        raise ImportError("pyarrow is not installed")
+
+    monkeypatch.setattr(routes, "import_pyarrow", import_pyarrow)
+    token = get_auth_token(
+        client=client, username=TEST_USER_USERNAME, password=TEST_USER_PASSWORD
+    )
+    response = client.get(
+        f"/environments/{TEST_ENVIRONMENT_ID}/actions/export",
+        params={"format": "parquet"},
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    assert response.status_code == 501
+
+
+# Test getting the policy snapshot, and getting it again while the arm stats didn't change -> should be not modified
+@pytest.mark.usefixtures("user", "environment", "userenvironmentlink", "arm", "avgrewardsperarm")
+def test_get_policy_snapshot(client: TestClient):
+    token = get_auth_token(
+        client=client, username=TEST_USER_USERNAME, password=TEST_USER_PASSWORD
+    )
+    headers = {"Authorization": f"Bearer {token}"}
+    response = client.get(f"/environments/{TEST_ENVIRONMENT_ID}/policy", headers=headers)
+    assert response.status_code == 200
+    snapshot = response.json()
+    assert snapshot["arm_ids"] == [TEST_ARM_ID]
+    assert snapshot["n_observations"] == [1]
+    assert snapshot["probabilities"] == [1.0]
+    assert response.headers["ETag"] == f'"{snapshot["version"]}"'
+
+    response = client.get(
+        f"/environments/{TEST_ENVIRONMENT_ID}/policy",
+        headers={**headers, "If-None-Match": response.headers["ETag"]},
+    )
+    assert response.status_code == 304
+
+    # a reward changes the arm stats, and so the version
+    response = client.post(
+        f"/environments/{TEST_ENVIRONMENT_ID}/actions/reports",
+        json=[{"arm_id": TEST_ARM_ID, "bandit_state": "exploit", "policy_version": snapshot["version"],
+               "reward": 0.0}],
+        headers=headers,
+    )
+    assert response.status_code == 200
+    response = client.get(
+        f"/environments/{TEST_ENVIRONMENT_ID}/policy",
+        headers={**headers, "If-None-Match": f'"{snapshot["version"]}"'},
+    )
+    assert response.status_code == 200
+    assert response.json()["version"] != snapshot["version"]
+    assert response.json()["n_observations"] == [2]
+
+
+# Test reporting actions chosen by a client, some with their rewards -> should succeed
+@pytest.mark.usefixtures("user", "environment", "userenvironmentlink", "arm", "avgrewardsperarm")
+def test_report_actions(client: TestClient, session: Session):
+    token = get_auth_token(
+        client=client, username=TEST_USER_USERNAME, password=TEST_USER_PASSWORD
+    )
+    reports = [
+        {"arm_id": TEST_ARM_ID, "bandit_state": "exploit", "propensity": 1.0, "policy_version": "v1", "reward": 1.0},
+        {"arm_id": TEST_ARM_ID, "bandit_state": "exploit", "propensity": 1.0, "policy_version": "v1"},
+    ]
+    response = client.post(
+        f"/environments/{TEST_ENVIRONMENT_ID}/actions/reports",
+        json=reports,
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    assert response.status_code == 200
+    action_ids = response.json()["action_ids"]
+    assert response.json()["n_actions"] == 2
+
+    actions = session.exec(select(Action).where(Action.environment_id == TEST_ENVIRONMENT_ID)).all()
+    assert sorted(action.action_id for action in actions) == sorted(action_ids)
+    assert all(action.policy_version == "v1" for action in actions)
+    observations = session.exec(select(Observation).where(Observation.environment_id == TEST_ENVIRONMENT_ID)).all()
+    assert [observation.action_id for observation in observations] == [action_ids[0]]
+    avg_rewards_per_arm = session.exec(select(AvgRewardsPerArm).where(AvgRewardsPerArm.arm_id == TEST_ARM_ID)).one()
+    session.refresh(avg_rewards_per_arm)
+    assert avg_rewards_per_arm.n_observations == 2
+
+
+# Test reporting an action of an arm of another environment -> should fail
+@pytest.mark.usefixtures("user", "environment", "userenvironmentlink", "arm", "avgrewardsperarm")
+def test_report_actions_rejects_unknown_arm(client: TestClient, session: Session):
+    token = get_auth_token(
+        client=client, username=TEST_USER_USERNAME, password=TEST_USER_PASSWORD
+    )
+    response = client.post(
+        f"/environments/{TEST_ENVIRONMENT_ID}/actions/reports",
+        json=[{"arm_id": TEST_ARM_ID + 1, "bandit_state": "exploit", "policy_version": "v1"}],
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    assert response.status_code == 422
+    assert session.exec(select(Action).where(Action.environment_id == TEST_ENVIRONMENT_ID)).all() == []
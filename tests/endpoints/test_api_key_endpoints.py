@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import datetime
+import pytest
+from fastapi.testclient import TestClient
+from sqlmodel import Session, select
+
+from maybee_backend.models.user_cache import get_cached_user
+from maybee_backend.models.user_models import ApiKey
+from tests.endpoints.test_core_api_functionality import get_auth_token
+from tests.statics import (
+    TEST_USER_USERNAME,
+    TEST_USER_PASSWORD,
+    TEST_USER_ID,
+    TEST_ADMIN_USER_USERNAME,
+    TEST_ENVIRONMENT_ID,
+)
+
+
+def create_api_key(client: TestClient, username: str = TEST_USER_USERNAME, **body) -> dict:
+    token = get_auth_token(client=client, username=username, password=TEST_USER_PASSWORD)
+    response = client.post("/users/api_keys", json=body, headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200, response.json()
+    return response.json()
+
+
+# Test act with an api key instead of a token -> should succeed
+@pytest.mark.usefixtures("user", "environment", "userenvironmentlink", "arm", "avgrewardsperarm")
+def test_act_with_api_key(client: TestClient, session: Session):
+    api_key = create_api_key(client, description="service account")
+    assert api_key["user_id"] == TEST_USER_ID
+    assert api_key["scope"] == "write"
+    assert api_key["api_key"].startswith(f"mb_{api_key['prefix']}_")
+
+    # only the digest of the key is stored
+    (stored_api_key,) = session.exec(select(ApiKey)).all()
+    assert api_key["api_key"] not in stored_api_key.digest
+
+    response = client.post(
+        f"/environments/{TEST_ENVIRONMENT_ID}/actions", headers={"X-API-Key": api_key["api_key"]}
+    )
+    assert response.status_code == 200
+    assert get_cached_user(api_key["api_key"]).user_id == TEST_USER_ID
+
+
+# Test a read scoped api key -> should only be able to read
+@pytest.mark.usefixtures("user", "environment", "userenvironmentlink", "arm", "avgrewardsperarm")
+def test_read_scoped_api_key(client: TestClient):
+    api_key = create_api_key(client, scope="read")
+    headers = {"X-API-Key": api_key["api_key"]}
+    assert client.get(f"/environments/{TEST_ENVIRONMENT_ID}/actions", headers=headers).status_code == 200
+    assert client.post(f"/environments/{TEST_ENVIRONMENT_ID}/actions", headers=headers).status_code == 403
+
+
+# Test invalid, expired and revoked api keys -> should fail
+@pytest.mark.usefixtures("user", "environment", "userenvironmentlink")
+def test_invalid_api_keys(client: TestClient, session: Session):
+    url = f"/environments/{TEST_ENVIRONMENT_ID}/actions"
+    api_key = create_api_key(client, expires_in_days=1)
+    forged_api_key = api_key["api_key"][:-4] + "AAAA"
+    for invalid_api_key in ["INVALID_API_KEY", forged_api_key, f"mb_unknown_{api_key['api_key'][-20:]}"]:
+        assert client.get(url, headers={"X-API-Key": invalid_api_key}).status_code == 401
+
+    headers = {"X-API-Key": api_key["api_key"]}
+    assert client.get(url, headers=headers).status_code == 200
+    stored_api_key = session.get(ApiKey, api_key["api_key_id"])
+    stored_api_key.expires_at = datetime.datetime.now() - datetime.timedelta(seconds=1)
+    session.add(stored_api_key)
+    session.commit()
+    assert client.get(url, headers=headers).status_code == 401
+
+    api_key = create_api_key(client)
+    headers = {"X-API-Key": api_key["api_key"]}
+    assert client.get(url, headers=headers).status_code == 200
+    response = client.delete(f"/users/api_keys/{api_key['api_key_id']}", headers=headers)
+    assert response.status_code == 200
+    assert client.get(url, headers=headers).status_code == 401
+
+
+# Test listing api keys -> should only return the user's own keys, without the keys themselves
+@pytest.mark.usefixtures("user", "admin_user")
+def test_get_api_keys(client: TestClient):
+    create_api_key(client)
+    create_api_key(client, username=TEST_ADMIN_USER_USERNAME, user_id=TEST_USER_ID)
+    create_api_key(client, username=TEST_ADMIN_USER_USERNAME)
+
+    token = get_auth_token(client=client, username=TEST_USER_USERNAME, password=TEST_USER_PASSWORD)
+    response = client.get("/users/api_keys", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200
+    api_keys = response.json()
+    assert [api_key["user_id"] for api_key in api_keys] == [TEST_USER_ID, TEST_USER_ID]
+    assert all("api_key" not in api_key and "digest" not in api_key for api_key in api_keys)
+
+
+# Test creating an api key for another user as a non-admin -> should fail
+@pytest.mark.usefixtures("user", "admin_user")
+def test_create_api_key_for_other_user_non_admin(client: TestClient, admin_user):
+    token = get_auth_token(client=client, username=TEST_USER_USERNAME, password=TEST_USER_PASSWORD)
+    response = client.post(
+        "/users/api_keys", json={"user_id": admin_user.user_id}, headers={"Authorization": f"Bearer {token}"}
+    )
+    assert response.status_code == 401
@@ -1,7 +1,7 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 import pytest
-from maybee_backend.models.core_models import AvgRewardsPerArm
+from maybee_backend.models.core_models import AvgRewardsPerArm, EnvironmentBanditConfig
 
 from tests.endpoints.test_core_api_functionality import get_auth_token
 from tests.validate_dataclass_object import validate_dataclass_object, Plurality
@@ -25,3 +25,25 @@ def test_get_avg_rewards_per_arm_authenticated(client):
                                                  dataclass=AvgRewardsPerArm, 
                                                  plurality=Plurality.PLURAL)
     assert is_valid, f"Invalid avg_rewards_per_arm data: {result}"
+
+
+# Test get avg rewards of a thompson sampling environment -> should include the posterior
+@pytest.mark.usefixtures("user", "environment", "userenvironmentlink", "arm", "avgrewardsperarm")
+def test_get_avg_rewards_per_arm_with_posterior(client, session, environment):
+    environment.bandit_type = EnvironmentBanditConfig.THOMPSON_SAMPLING
+    session.add(environment)
+    session.commit()
+    token = get_auth_token(
+        client=client, username=TEST_USER_USERNAME, password=TEST_USER_PASSWORD
+    )
+    response = client.get(
+        f"/environments/{TEST_ENVIRONMENT_ID}/arms/average_rewards/", headers={"Authorization": f"Bearer {token}"}
+    )
+    assert response.status_code == 200
+    response_data = response.json()
+    is_valid, result = validate_dataclass_object(data=response_data,
+                                                 dataclass=AvgRewardsPerArm,
+                                                 plurality=Plurality.PLURAL)
+    assert is_valid, f"Invalid avg_rewards_per_arm data: {result}"
+    # 1 observation with reward 1.0 on top of a uniform prior
+    assert response_data[0]["posterior"] == {"alpha": 2.0, "beta": 1.0}
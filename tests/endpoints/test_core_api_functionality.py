@@ -1,7 +1,18 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
+import time
 import pytest
 from fastapi.testclient import TestClient
+from sqlmodel import Session
+
+from maybee_backend.api.routes import get_password_hash
+from maybee_backend.models.user_cache import (
+    CurrentUser,
+    authenticated_user_cache,
+    cache_user,
+    get_cached_user,
+)
+from maybee_backend.models.user_models import User
 
 from tests.statics import (
     username_field,
@@ -9,6 +20,7 @@ from tests.statics import (
     TEST_USER_FOR_USER_CREATION_ENDPOINT_TEST_USERNAME, 
     TEST_USER_PASSWORD,
     TEST_USER_USERNAME,
+    TEST_USER_ID,
     )
 
 
@@ -57,3 +69,54 @@ def test_get_auth_token(client: TestClient):
     )
     assert response.status_code == 200
     assert response.json().get("access_token") is not None
+
+
+# Test that a verified token is served from the cache -> should succeed
+@pytest.mark.usefixtures("user")
+def test_verified_token_is_cached(client: TestClient):
+    token = get_auth_token(client=client, username=TEST_USER_USERNAME, password=TEST_USER_PASSWORD)
+    for _ in range(3):
+        response = client.get("/environments", headers={"Authorization": f"Bearer {token}"})
+        assert response.status_code == 200
+    assert authenticated_user_cache.stats()["misses"] == 1
+    assert authenticated_user_cache.stats()["hits"] == 2
+    assert get_cached_user(token) == CurrentUser(user_id=TEST_USER_ID, username=TEST_USER_USERNAME, is_admin=False)
+
+
+# Test that a change of the admin flag invalidates the cached user -> should succeed
+@pytest.mark.usefixtures("user")
+def test_admin_flag_change_invalidates_cached_user(client: TestClient, session: Session, user: User):
+    token = get_auth_token(client=client, username=TEST_USER_USERNAME, password=TEST_USER_PASSWORD)
+    headers = {"Authorization": f"Bearer {token}"}
+    assert client.get("/caches", headers=headers).status_code == 401
+
+    user.is_admin = True
+    session.add(user)
+    session.commit()
+    assert get_cached_user(token) is None
+    response = client.get("/caches", headers=headers)
+    assert response.status_code == 200
+    assert response.json()["authenticated_users"]["size"] == 1
+
+
+# Test that a deleted user can't use their token anymore -> should fail
+def test_deleted_user_is_not_served_from_cache(client: TestClient, session: Session):
+    user = User(username=TEST_USER_USERNAME, password_hash=get_password_hash(TEST_USER_PASSWORD))
+    session.add(user)
+    session.commit()
+    token = get_auth_token(client=client, username=TEST_USER_USERNAME, password=TEST_USER_PASSWORD)
+    headers = {"Authorization": f"Bearer {token}"}
+    assert client.get("/environments", headers=headers).status_code == 200
+
+    session.delete(user)
+    session.commit()
+    assert client.get("/environments", headers=headers).status_code == 401
+
+
+def test_cached_user_expires_with_token():
+    current_user = CurrentUser(user_id=TEST_USER_ID, username=TEST_USER_USERNAME, is_admin=False)
+    cache_user("expired_token", {"sub": TEST_USER_USERNAME, "exp": time.time() - 1}, current_user)
+    cache_user("valid_token", {"sub": TEST_USER_USERNAME, "exp": time.time() + 60}, current_user)
+    assert get_cached_user("expired_token") is None
+    assert "expired_token" not in authenticated_user_cache
+    assert get_cached_user("valid_token") == current_user
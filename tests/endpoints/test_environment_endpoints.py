@@ -92,3 +92,46 @@ def test_update_environment_non_admin(client):
         headers={"Authorization": f"Bearer {token}"},
     )
     assert response.status_code == 401
+
+
+# Test evaluate candidate bandits on the logged history of an environment -> should succeed
+@pytest.mark.usefixtures("user", "environment", "userenvironmentlink", "arm", "avgrewardsperarm")
+def test_evaluate_candidate_policies(client):
+    token = get_auth_token(
+        client=client, username=TEST_USER_USERNAME, password=TEST_USER_PASSWORD
+    )
+    headers = {"Authorization": f"Bearer {token}"}
+    action = client.post(f"/environments/{TEST_ENVIRONMENT_ID}/actions", headers=headers).json()
+    response = client.post(
+        f"/environments/{TEST_ENVIRONMENT_ID}/observations/",
+        params={"action_id": action["action_id"], "arm_id": action["arm_id"], "reward": 1.0},
+        headers=headers,
+    )
+    assert response.status_code == 200
+
+    response = client.post(
+        f"/environments/{TEST_ENVIRONMENT_ID}/evaluations",
+        json=[{"bandit_type": "ucb1"}, {"bandit_type": "softmax", "hyperparameters": {"tau": 0.2}}],
+        headers=headers,
+    )
+    assert response.status_code == 200
+    evaluations = response.json()
+    assert [evaluation["bandit_type"] for evaluation in evaluations] == ["ucb1", "softmax"]
+    assert evaluations[1]["hyperparameters"] == {"tau": 0.2}
+    for evaluation in evaluations:
+        assert evaluation["n_events"] == evaluation["n_replay_matches"] == evaluation["n_ips_events"] == 1
+        assert evaluation["replay_reward"] == evaluation["ips_reward"] == evaluation["snips_reward"] == 1.0
+
+
+# Test evaluate a candidate with an unknown hyperparameter -> should fail
+@pytest.mark.usefixtures("user", "environment", "userenvironmentlink")
+def test_evaluate_candidate_policies_unknown_hyperparameter(client):
+    token = get_auth_token(
+        client=client, username=TEST_USER_USERNAME, password=TEST_USER_PASSWORD
+    )
+    response = client.post(
+        f"/environments/{TEST_ENVIRONMENT_ID}/evaluations",
+        json=[{"bandit_type": "ucb1", "hyperparameters": {"tau": 0.2}}],
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    assert response.status_code == 422
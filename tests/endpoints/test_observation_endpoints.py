@@ -1,8 +1,12 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
+import datetime
+import json
 import pytest
 from fastapi.testclient import TestClient
-from maybee_backend.models.core_models import Observation, ObservationCreate
+from sqlmodel import Session, select
+from maybee_backend.api.export import observation_columns, read_csv_columns
+from maybee_backend.models.core_models import AvgRewardsPerArm, Observation, ObservationCreate
 
 from tests.statics import TEST_ENVIRONMENT_ID, TEST_USER_USERNAME, TEST_USER_PASSWORD, TEST_ARM_ID, TEST_ACTION_ID
 from tests.endpoints.test_core_api_functionality import get_auth_token
@@ -10,7 +14,7 @@ from tests.validate_dataclass_object import validate_dataclass_object, Plurality
 
 
 # Test create observation with auth -> should succeed
-@pytest.mark.usefixtures("user", "environment", "arm", "action")
+@pytest.mark.usefixtures("user", "environment", "userenvironmentlink", "arm", "avgrewardsperarm", "action")
 def test_create_observation(client: TestClient):
     token = get_auth_token(
         client=client, username=TEST_USER_USERNAME, password=TEST_USER_PASSWORD
@@ -32,7 +36,7 @@ def test_create_observation(client: TestClient):
 
 
 # Test create observations in batch with auth -> should succeed
-@pytest.mark.usefixtures("user", "environment", "arm", "action")
+@pytest.mark.usefixtures("user", "environment", "userenvironmentlink", "arm", "avgrewardsperarm", "action")
 def test_create_observations(client: TestClient):
     token = get_auth_token(
         client=client, username=TEST_USER_USERNAME, password=TEST_USER_PASSWORD
@@ -56,4 +60,113 @@ def test_create_observations(client: TestClient):
     print(response.content)
     assert response.status_code == 200
     is_valid, result = validate_dataclass_object(response.json(), Observation, plurality=Plurality.PLURAL)
-    assert is_valid, f"Invalid observation data: {result}"
\ No newline at end of file
+    assert is_valid, f"Invalid observation data: {result}"
+
+# Test that batch observations update the avg rewards per arm -> should succeed
+@pytest.mark.usefixtures("user", "environment", "userenvironmentlink", "arm", "action", "avgrewardsperarm")
+def test_create_observations_updates_avg_rewards_per_arm(client: TestClient, session: Session):
+    token = get_auth_token(
+        client=client, username=TEST_USER_USERNAME, password=TEST_USER_PASSWORD
+    )
+    response = client.post(
+        url=f"/environments/{TEST_ENVIRONMENT_ID}/observations/batch", 
+        headers={"Authorization": f"Bearer {token}"},
+        json=[{"action_id": TEST_ACTION_ID, "arm_id": TEST_ARM_ID, "reward": reward} for reward in [0.0, 0.0, 1.0]]
+    )
+    assert response.status_code == 200
+    sql = select(AvgRewardsPerArm).where(AvgRewardsPerArm.arm_id == TEST_ARM_ID)
+    avg_rewards_per_arm = session.exec(sql, execution_options={"populate_existing": True}).one()
+    # starting point: 1 observation, avg reward 1.0
+    assert avg_rewards_per_arm.n_observations == 4
+    assert avg_rewards_per_arm.avg_reward == 0.5
+    assert avg_rewards_per_arm.sum_squared_reward == 1.0
+
+
+# Test create observations in batch with a compact response -> should succeed
+@pytest.mark.parametrize("response_mode, expected_response", [
+    ("count", {"n_observations": 3, "observation_id_ranges": None}),
+    ("id_ranges", {"n_observations": 3, "observation_id_ranges": [[1, 3]]}),
+])
+@pytest.mark.usefixtures("user", "environment", "userenvironmentlink", "arm", "avgrewardsperarm", "action")
+def test_create_observations_compact_response(client: TestClient, response_mode, expected_response):
+    token = get_auth_token(
+        client=client, username=TEST_USER_USERNAME, password=TEST_USER_PASSWORD
+    )
+    response = client.post(
+        url=f"/environments/{TEST_ENVIRONMENT_ID}/observations/batch",
+        headers={"Authorization": f"Bearer {token}"},
+        params={"response_mode": response_mode},
+        json=[{"action_id": TEST_ACTION_ID, "arm_id": TEST_ARM_ID, "reward": 1.0} for _ in range(3)]
+    )
+    assert response.status_code == 200
+    assert response.json() == expected_response
+
+
+# Test create observations without a link to the environment -> should fail without writing them
+@pytest.mark.parametrize("buffered", [False, True])
+@pytest.mark.usefixtures("user", "environment", "arm", "action")
+def test_create_observations_without_access(client: TestClient, session: Session, buffered: bool):
+    token = get_auth_token(
+        client=client, username=TEST_USER_USERNAME, password=TEST_USER_PASSWORD
+    )
+    headers = {"Authorization": f"Bearer {token}"}
+    params = {"buffered": buffered}
+    response = client.post(
+        f"/environments/{TEST_ENVIRONMENT_ID}/observations/",
+        headers=headers,
+        params={**params, "action_id": TEST_ACTION_ID, "arm_id": TEST_ARM_ID, "reward": 1.0},
+    )
+    assert response.status_code == 401
+    response = client.post(
+        url=f"/environments/{TEST_ENVIRONMENT_ID}/observations/batch",
+        headers=headers,
+        params=params,
+        json=[{"action_id": TEST_ACTION_ID, "arm_id": TEST_ARM_ID, "reward": 1.0}],
+    )
+    assert response.status_code == 401
+    assert session.exec(select(Observation)).all() == []
+
+
+# Test paging, streaming and exporting the observations of an environment -> should return every observation once
+@pytest.mark.usefixtures("user", "environment", "userenvironmentlink", "arm")
+def test_get_observations_in_pages(client: TestClient, session: Session):
+    start_datetime = datetime.datetime(2024, 1, 1)
+    observations = [
+        Observation(
+            environment_id=TEST_ENVIRONMENT_ID,
+            arm_id=TEST_ARM_ID,
+            reward=1.0,
+            event_datetime=start_datetime + datetime.timedelta(seconds=i // 3),
+        )
+        for i in range(7)
+    ]
+    session.add_all(observations)
+    session.commit()
+    expected_observation_ids = [
+        observation.observation_id
+        for observation in sorted(observations, key=lambda observation: (observation.event_datetime, observation.observation_id))
+    ]
+    token = get_auth_token(
+        client=client, username=TEST_USER_USERNAME, password=TEST_USER_PASSWORD
+    )
+    url = f"/environments/{TEST_ENVIRONMENT_ID}/observations"
+    headers = {"Authorization": f"Bearer {token}"}
+
+    observation_ids = []
+    params = {"limit": 3}
+    while True:
+        response = client.get(url, params=params, headers=headers)
+        assert response.status_code == 200
+        observation_ids.extend(observation["observation_id"] for observation in response.json())
+        if "X-Next-Cursor" not in response.headers:
+            break
+        params["cursor"] = response.headers["X-Next-Cursor"]
+    assert observation_ids == expected_observation_ids
+
+    response = client.get(url, params={"format": "ndjson", "sorting_mode": "latest"}, headers=headers)
+    assert [json.loads(line)["observation_id"] for line in response.text.splitlines()] == expected_observation_ids[::-1]
+
+    response = client.get(f"{url}/export", headers=headers)
+    assert response.status_code == 200
+    columns = read_csv_columns(response.text, observation_columns)
+    assert columns["observation_id"].tolist() == expected_observation_ids
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+from maybee_backend.caching import LRUCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_lru_cache_counts_hits_and_misses():
+    cache = LRUCache(maxsize=2, ttl_seconds=10)
+    assert cache.get("a") is None
+    cache.set("a", 1)
+    assert cache.get("a") == 1
+    assert cache.stats() == {"size": 1, "maxsize": 2, "hits": 1, "misses": 1, "hit_rate": 0.5}
+
+
+def test_lru_cache_evicts_least_recently_used_entry():
+    cache = LRUCache(maxsize=2, ttl_seconds=10)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert "a" in cache
+    assert "b" not in cache
+    assert "c" in cache
+    assert len(cache) == 2
+
+
+def test_lru_cache_expires_entries_after_ttl():
+    clock = FakeClock()
+    cache = LRUCache(maxsize=2, ttl_seconds=5, clock=clock)
+    cache.set("a", 1)
+    clock.now = 5.0
+    assert cache.get("a") == 1
+    clock.now = 5.1
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+def test_lru_cache_replace_keeps_age_of_entry():
+    clock = FakeClock()
+    cache = LRUCache(maxsize=2, ttl_seconds=5, clock=clock)
+    cache.set("a", 1)
+    clock.now = 4.0
+    cache.replace("a", lambda value: value + 1)
+    assert cache.get("a") == 2
+    clock.now = 5.1
+    assert cache.get("a") is None
+
+
+def test_lru_cache_replace_ignores_missing_keys_and_drops_on_none():
+    cache = LRUCache(maxsize=2, ttl_seconds=5)
+    cache.replace("a", lambda value: value + 1)
+    assert "a" not in cache
+    cache.set("b", 1)
+    cache.replace("b", lambda value: None)
+    assert "b" not in cache
@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import asyncio
+import threading
+import httpx
+import pytest
+import requests
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+from fastapi.testclient import TestClient
+
+from maybee_backend.client.async_client import AsyncMaybeeClient
+from maybee_backend.client.client import MaybeeClient, retry_statuses
+from maybee_backend.client.local_policy import NoArmsAvailableError
+from maybee_backend.client.reporter import FullBufferPolicy
+from maybee_backend.main import app
+from maybee_backend.models.core_models import ObservationCreate
+from tests.statics import TEST_ENVIRONMENT_ID, TEST_ARM_ID, TEST_USER_USERNAME, TEST_USER_PASSWORD, INVALID_TOKEN
+
+test_host = "http://testserver"
+
+
+class AppAdapter(BaseAdapter):
+    """
+    Sends the requests of a MaybeeClient to the app through the test client.
+    """
+
+    def __init__(self, client: TestClient):
+        super().__init__()
+        self.client = client
+
+    def send(self, request, **kwargs):
+        r = self.client.request(request.method, request.url, content=request.body, headers=dict(request.headers))
+        response = requests.Response()
+        response.status_code = r.status_code
+        response.headers = CaseInsensitiveDict(r.headers)
+        response._content = r.content
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+
+@pytest.fixture(name="maybee_client")
+def maybee_client_fixture(client: TestClient):
+    maybee_client = MaybeeClient(username=TEST_USER_USERNAME, password=TEST_USER_PASSWORD, host=test_host)
+    maybee_client.session.mount(test_host, AppAdapter(client))
+    with maybee_client:
+        yield maybee_client
+
+
+def get_async_client(transport: httpx.AsyncBaseTransport) -> AsyncMaybeeClient:
+    return AsyncMaybeeClient(username=TEST_USER_USERNAME, password=TEST_USER_PASSWORD, host=test_host,
+                             transport=transport, backoff_factor=0)
+
+
+def test_client_requires_credentials():
+    with pytest.raises(ValueError):
+        MaybeeClient(host=test_host)
+
+
+def test_client_pools_and_retries_connections():
+    maybee_client = MaybeeClient(api_key="mb_key", host=test_host, retries=5, pool_size=20)
+    adapter = maybee_client.session.get_adapter(test_host)
+    assert adapter._pool_maxsize == 20
+    assert adapter.max_retries.total == 5
+    assert set(adapter.max_retries.status_forcelist) == set(retry_statuses)
+    # posts may have been handled, so they aren't retried on a response
+    assert "POST" not in adapter.max_retries.allowed_methods
+    maybee_client.close()
+
+
+@pytest.mark.usefixtures("user", "environment", "userenvironmentlink", "arm", "avgrewardsperarm")
+def test_client_acts_and_observes(maybee_client: MaybeeClient):
+    action = maybee_client.create_action(TEST_ENVIRONMENT_ID)
+    assert action.environment_id == TEST_ENVIRONMENT_ID
+    observation = maybee_client.create_observation(TEST_ENVIRONMENT_ID, action.action_id, action.arm_id, 1.0)
+    assert observation.action_id == action.action_id
+
+    actions = maybee_client.create_actions(TEST_ENVIRONMENT_ID, n=3)
+    response = maybee_client.create_observations(TEST_ENVIRONMENT_ID, [
+        ObservationCreate(action_id=action_id, arm_id=arm_id, reward=0.0)
+        for action_id, arm_id in zip(actions.action_ids, actions.arm_ids)
+    ])
+    assert response.n_observations == 3
+
+    assert len(maybee_client.get_actions(TEST_ENVIRONMENT_ID)) == 4
+    assert len(maybee_client.get_observations(TEST_ENVIRONMENT_ID)) == 4
+    avg_rewards_per_arm, = maybee_client.get_avg_rewards_per_arm(TEST_ENVIRONMENT_ID)
+    assert avg_rewards_per_arm.n_observations == 5
+
+
+@pytest.mark.usefixtures("user", "environment", "userenvironmentlink")
+def test_client_renews_a_rejected_access_token(maybee_client: MaybeeClient):
+    maybee_client._access_token = INVALID_TOKEN
+    assert [environment.environment_id for environment in maybee_client.get_environments()] == [TEST_ENVIRONMENT_ID]
+    assert maybee_client.access_token != INVALID_TOKEN
+
+
+# Test that a 401 refusing the user, rather than the access token, is returned without logging in again
+@pytest.mark.usefixtures("user", "environment")
+def test_client_keeps_the_access_token_when_access_is_refused(maybee_client: MaybeeClient, monkeypatch):
+    get_fresh_access_token = maybee_client._get_fresh_access_token
+    logins = []
+    monkeypatch.setattr(maybee_client, "_get_fresh_access_token", lambda: logins.append(1) or get_fresh_access_token())
+    with pytest.raises(requests.HTTPError) as exc_info:
+        maybee_client.create_action(TEST_ENVIRONMENT_ID)
+    assert exc_info.value.response.status_code == 401
+    assert len(logins) == 1
+
+    async def run():
+        async with get_async_client(httpx.ASGITransport(app=app)) as async_client:
+            get_fresh_access_token = async_client._get_fresh_access_token
+
+            async def count_login():
+                logins.append(1)
+                return await get_fresh_access_token()
+
+            async_client._get_fresh_access_token = count_login
+            with pytest.raises(httpx.HTTPStatusError) as exc_info:
+                await async_client.create_action(TEST_ENVIRONMENT_ID)
+            assert exc_info.value.response.status_code == 401
+
+    asyncio.run(run())
+    assert len(logins) == 2
+
+
+@pytest.mark.usefixtures("user", "environment", "userenvironmentlink", "arm", "avgrewardsperarm")
+def test_async_client_acts_concurrently():
+    async def act_and_observe(async_client: AsyncMaybeeClient):
+        action = await async_client.create_action(TEST_ENVIRONMENT_ID)
+        return await async_client.create_observation(TEST_ENVIRONMENT_ID, action.action_id, action.arm_id, 1.0)
+
+    async def run():
+        async with get_async_client(httpx.ASGITransport(app=app)) as async_client:
+            observations = await asyncio.gather(*(act_and_observe(async_client) for _ in range(5)))
+            assert len({observation.action_id for observation in observations}) == 5
+            assert len(await async_client.get_observations(TEST_ENVIRONMENT_ID)) == 5
+            assert [arm.arm_id for arm in await async_client.get_arms(TEST_ENVIRONMENT_ID)] == [TEST_ARM_ID]
+
+            async_client._access_token = INVALID_TOKEN
+            assert len(await async_client.get_actions(TEST_ENVIRONMENT_ID)) == 5
+            assert async_client._access_token != INVALID_TOKEN
+
+    asyncio.run(run())
+
+
+@pytest.mark.parametrize("method, expected_attempts", [("GET", 3), ("POST", 1)])
+def test_async_client_retries_unavailable_server(method, expected_attempts):
+    attempts = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        attempts.append(request)
+        if len(attempts) < 3:
+            return httpx.Response(503, headers={"Retry-After": "0"})
+        return httpx.Response(200, json=[])
+
+    async def run():
+        async with AsyncMaybeeClient(api_key="mb_key", host=test_host, transport=httpx.MockTransport(handler),
+                                     backoff_factor=0) as async_client:
+            return await async_client._request(method, "/environments")
+
+    response = asyncio.run(run())
+    assert len(attempts) == expected_attempts
+    assert response.status_code == (200 if method == "GET" else 503)
+
+
+def test_async_client_retries_failed_connections():
+    attempts = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        attempts.append(request)
+        if len(attempts) == 1:
+            raise httpx.ConnectError("Connection refused", request=request)
+        return httpx.Response(200, json={"action_id": 1, "arm_id": TEST_ARM_ID, "environment_id": TEST_ENVIRONMENT_ID,
+                                         "bandit_state": "explore"})
+
+    async def run():
+        async with AsyncMaybeeClient(api_key="mb_key", host=test_host, transport=httpx.MockTransport(handler),
+                                     backoff_factor=0) as async_client:
+            return await async_client.create_action(TEST_ENVIRONMENT_ID)
+
+    # a post that failed to connect wasn't handled, so it's retried
+    assert asyncio.run(run()).action_id == 1
+    assert len(attempts) == 2
+
+
+class UnavailableAdapter(AppAdapter):
+    """
+    Answers 503 to the first n_failures requests, and sends the rest to the app.
+    """
+
+    def __init__(self, client: TestClient, n_failures: int):
+        super().__init__(client)
+        self.n_failures = n_failures
+
+    def send(self, request, **kwargs):
+        if self.n_failures > 0:
+            self.n_failures -= 1
+            response = requests.Response()
+            response.status_code = 503
+            response.url = request.url
+            response.request = request
+            return response
+        return super().send(request, **kwargs)
+
+
+@pytest.mark.usefixtures("user", "environment", "userenvironmentlink", "arm", "avgrewardsperarm")
+def test_observation_reporter_batches_observations(client: TestClient, maybee_client: MaybeeClient):
+    actions = maybee_client.create_actions(TEST_ENVIRONMENT_ID, n=5)
+    # the first batch meets an unavailable server, and is retried
+    maybee_client.session.mount(test_host, UnavailableAdapter(client, n_failures=1))
+    with maybee_client.create_observation_reporter(max_batch_size=2, flush_interval_seconds=60,
+                                                   backoff_factor=0) as reporter:
+        for action_id, arm_id in zip(actions.action_ids, actions.arm_ids):
+            assert reporter.report(TEST_ENVIRONMENT_ID, action_id, arm_id, 1.0)
+        assert reporter.flush(timeout=10)
+        stats = reporter.stats()
+    assert stats["reported"] == stats["sent"] == 5
+    assert stats["retries"] == 1
+    assert stats["failed"] == 0
+    assert len(maybee_client.get_observations(TEST_ENVIRONMENT_ID)) == 5
+
+
+@pytest.mark.usefixtures("user", "environment", "userenvironmentlink", "arm", "avgrewardsperarm")
+def test_observation_reporter_flushes_on_close(maybee_client: MaybeeClient):
+    action = maybee_client.create_action(TEST_ENVIRONMENT_ID)
+    reporter = maybee_client.create_observation_reporter(flush_interval_seconds=60)
+    reporter.report(TEST_ENVIRONMENT_ID, action.action_id, action.arm_id, 1.0)
+    reporter.close()
+    assert reporter.stats()["sent"] == 1
+    assert len(maybee_client.get_observations(TEST_ENVIRONMENT_ID)) == 1
+    with pytest.raises(RuntimeError):
+        reporter.report(TEST_ENVIRONMENT_ID, action.action_id, action.arm_id, 1.0)
+
+
+@pytest.mark.usefixtures("user", "environment", "userenvironmentlink", "arm", "avgrewardsperarm")
+@pytest.mark.parametrize("full_buffer_policy", [FullBufferPolicy.DROP, FullBufferPolicy.BLOCK])
+def test_observation_reporter_bounds_its_buffer(maybee_client: MaybeeClient, full_buffer_policy):
+    action = maybee_client.create_action(TEST_ENVIRONMENT_ID)
+    with maybee_client.create_observation_reporter(max_batch_size=2, max_buffered=2, flush_interval_seconds=60,
+                                                   full_buffer_policy=full_buffer_policy,
+                                                   block_timeout_seconds=0.01) as reporter:
+        # the first batch is held up, so no room is made
+        released = threading.Event()
+        post = reporter._post
+        reporter._post = lambda observations: released.wait() and post(observations)
+        results = [reporter.report(TEST_ENVIRONMENT_ID, action.action_id, action.arm_id, 1.0) for _ in range(3)]
+        released.set()
+    assert results == [True, True, False]
+    assert reporter.stats()["dropped"] == 1
+    assert reporter.stats()["sent"] == 2
+
+
+def test_observation_reporter_gives_up_on_rejected_batches(client: TestClient, maybee_client: MaybeeClient):
+    # the environment doesn't exist, retrying won't help
+    with maybee_client.create_observation_reporter(backoff_factor=0) as reporter:
+        reporter.report(TEST_ENVIRONMENT_ID, 1, TEST_ARM_ID, 1.0)
+        reporter.flush(timeout=10)
+    assert reporter.stats()["failed"] == 1
+    assert reporter.stats()["retries"] == 0
+
+
+@pytest.mark.usefixtures("user", "environment", "userenvironmentlink", "arm", "avgrewardsperarm")
+def test_local_policy_chooses_and_reports_actions(maybee_client: MaybeeClient):
+    with maybee_client.create_local_policy(TEST_ENVIRONMENT_ID, refresh_interval_seconds=60,
+                                           flush_interval_seconds=60) as policy:
+        version = policy.snapshot.version
+        actions = policy.choose_arms(3)
+        assert [action.arm_id for action in actions] == [TEST_ARM_ID] * 3
+        assert all(action.propensity == 1.0 and action.policy_version == version for action in actions)
+        assert policy.report(actions[0], reward=1.0)
+        assert policy.report(actions[1])
+        assert policy.reporter.flush(timeout=10)
+        # the reward changed the arm stats, so the snapshot is downloaded again
+        assert policy.refresh()
+        assert policy.snapshot.version != version
+        assert not policy.refresh()
+    assert [action.policy_version for action in maybee_client.get_actions(TEST_ENVIRONMENT_ID)] == [version] * 2
+    assert len(maybee_client.get_observations(TEST_ENVIRONMENT_ID)) == 1
+
+
+@pytest.mark.usefixtures("user", "environment", "userenvironmentlink")
+def test_local_policy_without_arms(maybee_client: MaybeeClient):
+    with maybee_client.create_local_policy(TEST_ENVIRONMENT_ID, refresh_interval_seconds=60) as policy:
+        with pytest.raises(NoArmsAvailableError):
+            policy.choose_arm()
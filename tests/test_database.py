@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import asyncio
+import pytest
+from sqlalchemy import text
+from maybee_backend import database
+from maybee_backend.database import (
+    init_engine,
+    init_async_engine,
+    dispose_engines,
+    get_session,
+    get_async_db_uri,
+)
+from tests.conftest import TestingConfig
+
+
+@pytest.fixture(name="process_engine")
+def process_engine_fixture(monkeypatch):
+    monkeypatch.setattr("maybee_backend.database._engine", None)
+    monkeypatch.setattr("maybee_backend.database._async_engine", None)
+    engine = init_engine(config=TestingConfig())
+    yield engine
+    asyncio.run(dispose_engines())
+
+
+def test_init_engine_reuses_the_process_wide_engine(process_engine):
+    assert init_engine(config=TestingConfig()) is process_engine
+    assert database._engine is process_engine
+
+
+def test_init_async_engine_reuses_the_process_wide_engine(process_engine):
+    async_engine = init_async_engine(config=TestingConfig())
+    assert init_async_engine(config=TestingConfig()) is async_engine
+    assert async_engine.url.drivername == "sqlite+aiosqlite"
+
+
+def test_dispose_engines_forgets_the_process_wide_engines(process_engine):
+    init_async_engine(config=TestingConfig())
+    asyncio.run(dispose_engines())
+    assert database._engine is None
+    assert database._async_engine is None
+
+
+def test_get_session_closes_session_after_use(process_engine):
+    session_generator = get_session(engine=process_engine)
+    session = next(session_generator)
+    assert session.exec(text("SELECT 1")).one() == (1,)
+    session_generator.close()
+    assert session.get_bind() is process_engine
+    assert not session.in_transaction()
+
+
+@pytest.mark.parametrize(
+    "sync_db_uri, expected_async_db_uri",
+    [
+        ("postgresql://maybee:maybee@db:5432", "postgresql+asyncpg://maybee:maybee@db:5432"),
+        ("postgresql+psycopg2://maybee:maybee@db:5432/maybee", "postgresql+asyncpg://maybee:maybee@db:5432/maybee"),
+        ("sqlite:///maybee.db", "sqlite+aiosqlite:///maybee.db"),
+    ],
+)
+def test_get_async_db_uri(sync_db_uri, expected_async_db_uri):
+    assert get_async_db_uri(sync_db_uri) == expected_async_db_uri
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import datetime
+import io
+import numpy as np
+import pytest
+from sqlmodel import Session
+
+from maybee_backend.api.export import (
+    action_columns,
+    observation_columns,
+    get_action_export_sql,
+    get_observation_export_sql,
+    read_csv_columns,
+    stream_chunks,
+    write_export,
+)
+from maybee_backend.api.export_format import ExportFormat
+from maybee_backend.models.core_models import Action, Observation
+from tests.statics import TEST_ENVIRONMENT_ID, TEST_ARM_ID
+
+
+@pytest.fixture(name="events")
+def events_fixture(session: Session):
+    start_datetime = datetime.datetime(2024, 1, 1)
+    actions = [
+        Action(
+            environment_id=TEST_ENVIRONMENT_ID,
+            arm_id=TEST_ARM_ID,
+            bandit_state="explore",
+            event_datetime=start_datetime + datetime.timedelta(seconds=i),
+            propensity=None if i == 0 else 0.5,
+        )
+        for i in range(5)
+    ]
+    session.add_all(actions)
+    session.commit()
+    observations = [
+        Observation(
+            environment_id=TEST_ENVIRONMENT_ID,
+            arm_id=TEST_ARM_ID,
+            action_id=None if i == 0 else actions[i].action_id,
+            event_datetime=actions[i].event_datetime,
+            reward=float(i % 2),
+        )
+        for i in range(5)
+    ]
+    session.add_all(observations)
+    session.commit()
+    return actions, observations
+
+
+@pytest.mark.usefixtures("environment", "arm")
+def test_stream_chunks(session: Session, events):
+    chunks = list(stream_chunks(Session(session.get_bind()), get_action_export_sql(TEST_ENVIRONMENT_ID), chunk_size=2))
+    assert [len(rows) for rows in chunks] == [2, 2, 1]
+    assert [row.action_id for rows in chunks for row in rows] == [action.action_id for action in events[0]]
+
+
+@pytest.mark.usefixtures("environment", "arm")
+def test_export_csv_round_trip(session: Session, events):
+    _, observations = events
+    chunks = stream_chunks(Session(session.get_bind()), get_observation_export_sql(TEST_ENVIRONMENT_ID), chunk_size=2)
+    text = b"".join(write_export(chunks, observation_columns, ExportFormat.CSV)).decode()
+    assert text.splitlines()[0] == ",".join(name for name, _ in observation_columns)
+
+    columns = read_csv_columns(text, observation_columns)
+    assert columns["observation_id"].dtype == np.int64
+    assert columns["observation_id"].tolist() == [observation.observation_id for observation in observations]
+    # the first observation has no action_id, so the column is a float column with nan
+    assert np.isnan(columns["action_id"][0])
+    assert columns["action_id"][1:].tolist() == [observation.action_id for observation in observations[1:]]
+    assert columns["event_datetime"].dtype == np.dtype("datetime64[us]")
+    assert columns["event_datetime"].tolist() == [observation.event_datetime for observation in observations]
+    assert columns["reward"].tolist() == [observation.reward for observation in observations]
+
+
+def test_read_csv_columns_without_rows():
+    columns = read_csv_columns(",".join(name for name, _ in action_columns) + "\n", action_columns)
+    assert list(columns) == [name for name, _ in action_columns]
+    assert all(len(column) == 0 for column in columns.values())
+
+
+@pytest.mark.usefixtures("environment", "arm")
+@pytest.mark.parametrize("file_format", [ExportFormat.ARROW, ExportFormat.PARQUET])
+def test_export_arrow_and_parquet(session: Session, events, file_format):
+    pyarrow_ipc = pytest.importorskip("pyarrow.ipc")
+    pyarrow_parquet = pytest.importorskip("pyarrow.parquet")
+
+    actions, _ = events
+    chunks = stream_chunks(Session(session.get_bind()), get_action_export_sql(TEST_ENVIRONMENT_ID), chunk_size=2)
+    data = b"".join(write_export(chunks, action_columns, file_format))
+    if file_format == ExportFormat.PARQUET:
+        parquet_file = pyarrow_parquet.ParquetFile(io.BytesIO(data))
+        # one row group per chunk
+        assert parquet_file.num_row_groups == 3
+        table = parquet_file.read()
+    else:
+        table = pyarrow_ipc.open_stream(data).read_all()
+    assert table.column_names == [name for name, _ in action_columns]
+    assert table.column("action_id").to_pylist() == [action.action_id for action in actions]
+    assert table.column("event_datetime").to_pylist() == [action.event_datetime for action in actions]
+    assert table.column("propensity").to_pylist() == [action.propensity for action in actions]
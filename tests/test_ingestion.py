@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import asyncio
+import pytest
+from fastapi.testclient import TestClient
+from sqlmodel import Session, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from maybee_backend import ingestion
+from maybee_backend.ingestion import ObservationBuffer
+from maybee_backend.models.core_models import Arm, AvgRewardsPerArm, Observation, ObservationCreate
+from tests.endpoints.test_core_api_functionality import get_auth_token
+from tests.statics import TEST_USER_USERNAME, TEST_USER_PASSWORD, TEST_ENVIRONMENT_ID, TEST_ARM_ID
+
+
+@pytest.fixture(name="observation_buffer")
+def observation_buffer_fixture(monkeypatch, async_engine):
+    observation_buffer = ObservationBuffer(max_rows=10, flush_rows=5, flush_interval_seconds=0.05)
+    monkeypatch.setattr("maybee_backend.api.routes.observation_buffer", observation_buffer)
+    return observation_buffer
+
+
+def get_session_factory(async_engine):
+    return lambda: AsyncSession(async_engine, expire_on_commit=False)
+
+
+def get_observations(n: int, reward: float = 1.0):
+    return [
+        ObservationCreate(environment_id=TEST_ENVIRONMENT_ID, arm_id=TEST_ARM_ID, reward=reward)
+        for _ in range(n)
+    ]
+
+
+def get_avg_rewards_per_arm(session: Session) -> AvgRewardsPerArm:
+    session.expire_all()
+    return session.exec(select(AvgRewardsPerArm).where(AvgRewardsPerArm.arm_id == TEST_ARM_ID)).one()
+
+
+@pytest.mark.usefixtures("user", "environment", "userenvironmentlink", "arm", "avgrewardsperarm")
+def test_buffered_observations_are_acknowledged_and_flushed(
+    client: TestClient, session: Session, async_engine, observation_buffer: ObservationBuffer
+):
+    observation_buffer.open(get_session_factory(async_engine))
+    token = get_auth_token(client=client, username=TEST_USER_USERNAME, password=TEST_USER_PASSWORD)
+    headers = {"Authorization": f"Bearer {token}"}
+    response = client.post(
+        f"/environments/{TEST_ENVIRONMENT_ID}/observations/batch/",
+        params={"buffered": True},
+        json=[{"arm_id": TEST_ARM_ID, "reward": 0.0}] * 3,
+        headers=headers,
+    )
+    assert response.status_code == 202
+    assert response.json()["n_observations"] == 3
+    response = client.post(
+        f"/environments/{TEST_ENVIRONMENT_ID}/observations/",
+        params={"action_id": 1, "arm_id": TEST_ARM_ID, "reward": 1.0, "buffered": True},
+        headers=headers,
+    )
+    assert response.status_code == 202
+    assert len(observation_buffer) == 4
+    assert session.exec(select(Observation)).all() == []
+
+    assert asyncio.run(observation_buffer.flush()) == 4
+    assert len(session.exec(select(Observation)).all()) == 4
+    # the avgrewardsperarm fixture holds one observation with a reward of 1.0
+    avg_rewards_per_arm = get_avg_rewards_per_arm(session)
+    assert avg_rewards_per_arm.n_observations == 5
+    assert avg_rewards_per_arm.avg_reward == pytest.approx(0.4)
+    assert observation_buffer.stats()["flushed_rows"] == 4
+
+
+@pytest.mark.usefixtures("user", "environment", "userenvironmentlink", "arm", "avgrewardsperarm")
+def test_full_buffer_rejects_observations(client: TestClient, async_engine, observation_buffer: ObservationBuffer):
+    token = get_auth_token(client=client, username=TEST_USER_USERNAME, password=TEST_USER_PASSWORD)
+    url = f"/environments/{TEST_ENVIRONMENT_ID}/observations/batch/"
+    body = [{"arm_id": TEST_ARM_ID, "reward": 1.0}] * 6
+    headers = {"Authorization": f"Bearer {token}"}
+    # not enabled
+    assert client.post(url, params={"buffered": True}, json=body, headers=headers).status_code == 503
+
+    observation_buffer.open(get_session_factory(async_engine))
+    assert client.post(url, params={"buffered": True}, json=body, headers=headers).status_code == 202
+    response = client.post(url, params={"buffered": True}, json=body, headers=headers)
+    assert response.status_code == 429
+    assert "Retry-After" in response.headers
+    assert observation_buffer.stats()["depth"] == 6
+    assert observation_buffer.stats()["rejected_rows"] == 6
+
+
+@pytest.mark.usefixtures("environment", "arm", "avgrewardsperarm")
+def test_background_task_flushes_and_stop_drains_the_buffer(session: Session, async_engine):
+    observation_buffer = ObservationBuffer(max_rows=100, flush_rows=5, flush_interval_seconds=60)
+
+    async def run():
+        observation_buffer.start(get_session_factory(async_engine))
+        # reaching flush_rows wakes the background task before the interval is up
+        assert observation_buffer.submit(get_observations(5))
+        for _ in range(100):
+            await asyncio.sleep(0.01)
+            if observation_buffer.n_flushes:
+                break
+        assert observation_buffer.stats()["flushed_rows"] == 5
+        assert observation_buffer.submit(get_observations(2))
+        await observation_buffer.stop()
+
+    asyncio.run(run())
+    assert not observation_buffer.is_open
+    assert not observation_buffer.submit(get_observations(1))
+    assert len(session.exec(select(Observation)).all()) == 7
+    stats = observation_buffer.stats()
+    assert stats["flushed_rows"] == 7
+    assert stats["depth"] == 0
+    assert stats["max_flush_seconds"] >= stats["last_flush_seconds"] > 0
+
+
+@pytest.mark.usefixtures("environment", "arm", "avgrewardsperarm")
+def test_flush_drops_observations_of_unknown_environments(session: Session, async_engine):
+    observation_buffer = ObservationBuffer(max_rows=100, flush_rows=50, flush_interval_seconds=60)
+    observation_buffer.open(get_session_factory(async_engine))
+    unknown_observations = [
+        ObservationCreate(environment_id=TEST_ENVIRONMENT_ID + 1, arm_id=TEST_ARM_ID, reward=1.0)
+    ]
+    assert observation_buffer.submit(get_observations(2) + unknown_observations)
+    assert asyncio.run(observation_buffer.flush()) == 2
+    assert observation_buffer.stats()["dropped_rows"] == 1
+    assert len(session.exec(select(Observation)).all()) == 2
+
+
+@pytest.mark.parametrize("buffered", [False, True])
+@pytest.mark.usefixtures("user", "environment", "userenvironmentlink", "arm", "avgrewardsperarm")
+def test_observations_of_arms_of_other_environments_are_rejected(
+    client: TestClient, session: Session, async_engine, observation_buffer: ObservationBuffer, buffered: bool
+):
+    observation_buffer.open(get_session_factory(async_engine))
+    token = get_auth_token(client=client, username=TEST_USER_USERNAME, password=TEST_USER_PASSWORD)
+    headers = {"Authorization": f"Bearer {token}"}
+    response = client.post(
+        f"/environments/{TEST_ENVIRONMENT_ID}/observations/batch/",
+        params={"buffered": buffered},
+        json=[{"arm_id": TEST_ARM_ID, "reward": 1.0}, {"arm_id": TEST_ARM_ID + 1, "reward": 1.0}],
+        headers=headers,
+    )
+    assert response.status_code == 422
+    response = client.post(
+        f"/environments/{TEST_ENVIRONMENT_ID}/observations/",
+        params={"action_id": 1, "arm_id": TEST_ARM_ID + 1, "reward": 1.0, "buffered": buffered},
+        headers=headers,
+    )
+    assert response.status_code == 422
+    assert len(observation_buffer) == 0
+    assert session.exec(select(Observation)).all() == []
+
+
+@pytest.mark.usefixtures("user", "environment", "userenvironmentlink", "arm", "avgrewardsperarm")
+def test_observations_of_arms_missing_from_the_cached_arm_stats_are_accepted(client: TestClient, session: Session):
+    token = get_auth_token(client=client, username=TEST_USER_USERNAME, password=TEST_USER_PASSWORD)
+    headers = {"Authorization": f"Bearer {token}"}
+    url = f"/environments/{TEST_ENVIRONMENT_ID}/observations/batch/"
+    assert client.post(url, json=[{"arm_id": TEST_ARM_ID, "reward": 1.0}], headers=headers).status_code == 200
+    # an arm created through another worker, that doesn't invalidate the arm stats cached by this one
+    new_arm_id = TEST_ARM_ID + 1
+    session.add(Arm(arm_id=new_arm_id, environment_id=TEST_ENVIRONMENT_ID))
+    session.add(AvgRewardsPerArm(arm_id=new_arm_id, environment_id=TEST_ENVIRONMENT_ID, n_observations=0))
+    session.commit()
+    response = client.post(url, json=[{"arm_id": new_arm_id, "reward": 1.0}, {"reward": 0.0}], headers=headers)
+    assert response.status_code == 200
+    assert len(session.exec(select(Observation)).all()) == 3
+
+
+@pytest.mark.usefixtures("environment", "arm", "avgrewardsperarm")
+def test_flush_drops_only_the_observations_that_fail(session: Session, async_engine, monkeypatch):
+    write_observations = ingestion.write_observations
+
+    async def write_observations_or_fail(session, environment, observations, return_ids=True):
+        if any(observation.reward < 0 for observation in observations):
+            raise ValueError("Invalid reward")
+        return await write_observations(session, environment, observations, return_ids=return_ids)
+
+    monkeypatch.setattr(ingestion, "write_observations", write_observations_or_fail)
+    observation_buffer = ObservationBuffer(max_rows=100, flush_rows=50, flush_interval_seconds=60)
+    observation_buffer.open(get_session_factory(async_engine))
+    assert observation_buffer.submit(get_observations(3) + get_observations(1, reward=-1.0) + get_observations(4))
+    assert asyncio.run(observation_buffer.flush()) == 7
+    assert observation_buffer.stats()["dropped_rows"] == 1
+    assert len(session.exec(select(Observation)).all()) == 7
+    # the avgrewardsperarm fixture holds one observation
+    assert get_avg_rewards_per_arm(session).n_observations == 8
+
+
+@pytest.mark.usefixtures("environment", "arm", "avgrewardsperarm")
+def test_background_task_survives_a_failed_flush(session: Session, async_engine, monkeypatch):
+    observation_buffer = ObservationBuffer(max_rows=100, flush_rows=1, flush_interval_seconds=60)
+    flush = observation_buffer.flush
+    n_calls = 0
+
+    async def flush_or_fail():
+        nonlocal n_calls
+        n_calls += 1
+        if n_calls == 1:
+            raise RuntimeError("Failed to flush")
+        return await flush()
+
+    monkeypatch.setattr(observation_buffer, "flush", flush_or_fail)
+
+    async def run():
+        observation_buffer.start(get_session_factory(async_engine))
+        assert observation_buffer.submit(get_observations(1))
+        for _ in range(100):
+            await asyncio.sleep(0.01)
+            if n_calls:
+                break
+        assert observation_buffer.submit(get_observations(1))
+        for _ in range(100):
+            await asyncio.sleep(0.01)
+            if observation_buffer.n_flushes:
+                break
+        assert not observation_buffer._task.done()
+        await observation_buffer.stop()
+
+    asyncio.run(run())
+    assert len(session.exec(select(Observation)).all()) == 2
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import pytest
+from fastapi.testclient import TestClient
+from sqlmodel import create_engine, text
+
+from maybee_backend import metrics
+from maybee_backend.database import get_pool_kwargs
+from maybee_backend.metrics import Histogram, MetricsRegistry
+from tests.conftest import TestingConfig
+from tests.statics import TEST_USER_USERNAME, TEST_USER_PASSWORD, TEST_ENVIRONMENT_ID
+from tests.endpoints.test_core_api_functionality import get_auth_token
+
+
+def get_samples(body: str) -> dict:
+    """
+    The samples of a Prometheus text exposition, by name with labels.
+    """
+    return {
+        line.rsplit(" ", 1)[0]: float(line.rsplit(" ", 1)[1])
+        for line in body.splitlines()
+        if line and not line.startswith("#")
+    }
+
+
+def test_histogram_renders_cumulative_buckets():
+    registry = MetricsRegistry()
+    histogram = registry.histogram("duration_seconds", "Durations.", ("route",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 5.0):
+        histogram.observe(value, "/a")
+    body = registry.render()
+    assert "# TYPE duration_seconds histogram" in body
+    assert get_samples(body) == {
+        'duration_seconds_bucket{route="/a",le="0.1"}': 1,
+        'duration_seconds_bucket{route="/a",le="1.0"}': 3,
+        'duration_seconds_bucket{route="/a",le="+Inf"}': 4,
+        'duration_seconds_sum{route="/a"}': 6.05,
+        'duration_seconds_count{route="/a"}': 4,
+    }
+
+
+def test_registry_rejects_duplicate_metrics():
+    registry = MetricsRegistry()
+    registry.counter("requests_total", "Requests.")
+    with pytest.raises(ValueError):
+        registry.register(Histogram("requests_total", "Requests."))
+
+
+def test_pool_checkouts_are_timed(tmp_path):
+    db_uri = f"sqlite:///{tmp_path}/pool.db"
+    engine = create_engine(db_uri, **get_pool_kwargs(TestingConfig(), db_uri))
+    n_checkouts = metrics.db_pool_checkout_duration.get_count("QueuePool")
+    with engine.connect() as connection:
+        connection.execute(text("select 1"))
+    engine.dispose()
+    assert metrics.db_pool_checkout_duration.get_count("QueuePool") == n_checkouts + 1
+
+
+@pytest.mark.usefixtures("user", "environment", "userenvironmentlink", "arm", "avgrewardsperarm")
+def test_metrics_endpoint(client: TestClient):
+    metrics.registry.clear()
+    token = get_auth_token(
+        client=client, username=TEST_USER_USERNAME, password=TEST_USER_PASSWORD
+    )
+    for _ in range(2):
+        response = client.post(
+            f"/environments/{TEST_ENVIRONMENT_ID}/actions", headers={"Authorization": f"Bearer {token}"}
+        )
+        assert response.status_code == 200
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["Content-Type"] == metrics.content_type
+    samples = get_samples(response.text)
+    route = 'route="/environments/{environment_id}/actions"'
+    # latency per route template, not per environment
+    assert samples[f'maybee_request_duration_seconds_count{{method="POST",{route}}}'] == 2
+    assert samples[f'maybee_requests_total{{method="POST",{route},status="200"}}'] == 2
+    # the /metrics request itself is in flight
+    assert samples["maybee_requests_in_flight"] == 1
+    # the queries of the async session and of the bandit's sync session in run_sync are both counted
+    assert samples[f"maybee_request_db_queries_count{{{route}}}"] == 2
+    assert samples[f"maybee_request_db_queries_sum{{{route}}}"] >= 2 * 3
+    assert samples[f"maybee_request_db_duration_seconds_sum{{{route}}}"] > 0
+    assert samples['maybee_choose_arm_duration_seconds_count{bandit_type="epsilon_greedy"}'] == 2
+    assert samples['maybee_cache_hits_total{cache="arm_stats"}'] >= 1
+    assert 'maybee_cache_misses_total{cache="environment_access"}' in samples
+
+
+def test_metrics_endpoint_can_be_disabled(client: TestClient, monkeypatch):
+    monkeypatch.setattr(TestingConfig, "metrics_enabled", False)
+    assert client.get("/metrics").status_code == 404
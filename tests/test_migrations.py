@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+from sqlalchemy import inspect, text
+from sqlmodel import Session, select
+
+from maybee_backend.models.core_models import AvgRewardsPerArm, Observation
+from maybee_backend.setup.migrations import run_migrations
+from tests.statics import TEST_ENVIRONMENT_ID, TEST_ARM_ID
+
+
+def test_run_migrations_adds_indexes_to_existing_tables(session: Session):
+    engine = session.get_bind()
+    # simulate a deployment that predates the indexes, with a duplicate stats row
+    for index in AvgRewardsPerArm.__table__.indexes:
+        index.drop(bind=engine)
+    for n_observations, avg_reward in [(1, 1.0), (3, 0.0)]:
+        session.add(
+            AvgRewardsPerArm(
+                environment_id=TEST_ENVIRONMENT_ID,
+                arm_id=TEST_ARM_ID,
+                n_observations=n_observations,
+                avg_reward=avg_reward,
+            )
+        )
+    session.commit()
+
+    run_migrations(engine)
+
+    index_names = {index["name"] for index in inspect(engine).get_indexes("avgrewardsperarm")}
+    assert "ix_avgrewardsperarm_environment_id_arm_id" in index_names
+    avg_rewards_per_arm = session.exec(select(AvgRewardsPerArm)).one()
+    assert avg_rewards_per_arm.n_observations == 4
+    assert avg_rewards_per_arm.avg_reward == 0.25
+
+
+def test_run_migrations_adds_and_backfills_sum_squared_reward(session: Session):
+    engine = session.get_bind()
+    # simulate a deployment that predates the sum_squared_reward column
+    with engine.begin() as connection:
+        connection.execute(text("ALTER TABLE avgrewardsperarm DROP COLUMN sum_squared_reward"))
+        connection.execute(text(
+            "INSERT INTO avgrewardsperarm (environment_id, arm_id, n_observations, avg_reward) "
+            f"VALUES ({TEST_ENVIRONMENT_ID}, {TEST_ARM_ID}, 2, 1.5)"
+        ))
+    session.add_all([
+        Observation(environment_id=TEST_ENVIRONMENT_ID, arm_id=TEST_ARM_ID, reward=reward)
+        for reward in [1.0, 2.0]
+    ])
+    session.commit()
+
+    run_migrations(engine)
+
+    column_names = {column["name"] for column in inspect(engine).get_columns("avgrewardsperarm")}
+    assert "sum_squared_reward" in column_names
+    avg_rewards_per_arm = session.exec(select(AvgRewardsPerArm)).one()
+    assert avg_rewards_per_arm.sum_squared_reward == 5.0
+
+
+def test_run_migrations_replaces_event_datetime_indexes(session: Session):
+    engine = session.get_bind()
+    # simulate a deployment with the indexes that predate keyset pagination
+    with engine.begin() as connection:
+        connection.execute(text("DROP INDEX ix_action_environment_id_event_datetime_action_id"))
+        connection.execute(text("CREATE INDEX ix_action_environment_id_event_datetime ON action (environment_id, event_datetime)"))
+
+    run_migrations(engine)
+
+    index_names = {index["name"] for index in inspect(engine).get_indexes("action")}
+    assert "ix_action_environment_id_event_datetime_action_id" in index_names
+    assert "ix_action_environment_id_event_datetime" not in index_names
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import datetime
+import numpy as np
+import pytest
+from sqlmodel import Session, select
+
+from maybee_backend.evaluation.offline_evaluation import evaluate_policies, stream_logged_events
+from maybee_backend.models.core_models import (
+    Action,
+    Arm,
+    Environment,
+    EnvironmentBanditConfig,
+    PolicyCandidate,
+)
+from maybee_backend.simulations.simulation_environment import (
+    create_offline_bandit,
+    save_simulated_pulls,
+    simulate_pulls,
+)
+
+population_p_success = [0.2, 0.5, 0.8]
+n_logged_actions = 3000
+
+
+@pytest.fixture(name="logged_environment")
+def logged_environment_fixture(session: Session):
+    """
+    An environment with a history of arms chosen uniformly at random.
+    """
+    np.random.seed(1)
+    environment = Environment(bandit_type=EnvironmentBanditConfig.EPSILON_GREEDY, is_simulation_environment=True)
+    session.add(environment)
+    session.commit()
+    arms = [Arm(environment_id=environment.environment_id, population_p_success=p) for p in population_p_success]
+    session.add_all(arms)
+    session.commit()
+    now = datetime.datetime.now()
+    pulls = simulate_pulls(
+        bandit=create_offline_bandit(EnvironmentBanditConfig.EPSILON_GREEDY, {"epsilon": 1.0}),
+        arm_ids=[arm.arm_id for arm in arms],
+        population_p_success=population_p_success,
+        n_pulls=n_logged_actions,
+        now=now,
+    )
+    save_simulated_pulls(session=session, environment_id=environment.environment_id, pulls=pulls, now=now)
+    return environment
+
+
+def test_simulated_pulls_log_propensities(session: Session, logged_environment: Environment):
+    actions = session.exec(select(Action).where(Action.environment_id == logged_environment.environment_id)).all()
+    assert len(actions) == n_logged_actions
+    assert all(action.propensity == pytest.approx(1 / 3) for action in actions)
+
+
+@pytest.mark.parametrize("chunk_size", [10_000, 333])
+def test_stream_logged_events_in_chunks(session: Session, logged_environment: Environment, chunk_size):
+    arm_ids = [arm.arm_id for arm in logged_environment.arms]
+    chunks = list(stream_logged_events(session, logged_environment.environment_id, arm_ids, chunk_size=chunk_size))
+    assert all(len(chunk) <= chunk_size for chunk in chunks)
+    rewards = np.concatenate([chunk.rewards for chunk in chunks])
+    assert len(rewards) == n_logged_actions
+    arm_indexes = np.concatenate([chunk.arm_indexes for chunk in chunks])
+    assert set(arm_indexes.tolist()) == {0, 1, 2}
+
+
+def test_evaluate_policies(session: Session, logged_environment: Environment):
+    np.random.seed(2)
+    candidates = [
+        PolicyCandidate(bandit_type=EnvironmentBanditConfig.EPSILON_GREEDY, hyperparameters={"epsilon": 1.0}),
+        PolicyCandidate(bandit_type=EnvironmentBanditConfig.THOMPSON_SAMPLING),
+        PolicyCandidate(bandit_type=EnvironmentBanditConfig.UCB1),
+    ]
+    uniform, thompson_sampling, ucb1 = evaluate_policies(
+        session=session, environment_id=logged_environment.environment_id, candidates=candidates, chunk_size=1000
+    )
+
+    for evaluation in [uniform, thompson_sampling, ucb1]:
+        assert evaluation.n_events == evaluation.n_ips_events == n_logged_actions
+    # the logging policy itself matches on a third of the actions, and is estimated exactly by ips
+    assert uniform.n_replay_matches == pytest.approx(n_logged_actions / 3, rel=0.1)
+    assert uniform.ips_reward == pytest.approx(np.mean(population_p_success), abs=0.03)
+    assert uniform.snips_reward == pytest.approx(uniform.ips_reward, abs=0.03)
+    # learning policies find the best arm
+    for evaluation in [thompson_sampling, ucb1]:
+        assert evaluation.replay_reward > 0.7
+        assert evaluation.snips_reward > 0.7
+
+
+@pytest.mark.usefixtures("environment", "arm", "action")
+def test_evaluate_policies_skips_actions_without_observations(session: Session, action: Action):
+    candidates = [PolicyCandidate(bandit_type=EnvironmentBanditConfig.UCB1)]
+    (evaluation,) = evaluate_policies(session=session, environment_id=action.environment_id, candidates=candidates)
+    assert evaluation.n_events == 0
+    assert evaluation.replay_reward is None
+
+    (evaluation,) = evaluate_policies(
+        session=session, environment_id=action.environment_id, candidates=candidates, missing_reward=0.0
+    )
+    assert evaluation.n_events == evaluation.n_replay_matches == 1
+    assert evaluation.replay_reward == 0.0
+    # the action was logged without a propensity
+    assert evaluation.n_ips_events == 0
+    assert evaluation.ips_reward is None
+
+
+def test_evaluate_policies_rejects_unknown_hyperparameters(session: Session):
+    candidates = [PolicyCandidate(bandit_type=EnvironmentBanditConfig.SOFTMAX, hyperparameters={"temperature": 1.0})]
+    with pytest.raises(ValueError):
+        evaluate_policies(session=session, environment_id=1, candidates=candidates)
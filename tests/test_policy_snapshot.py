@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+from sqlmodel import Session
+
+from maybee_backend.models.core_models import EnvironmentBanditConfig, PolicySnapshot
+from maybee_backend.models.get_average_rewards_per_arm import get_arm_stats
+from maybee_backend.models.policy_snapshot import (get_policy_snapshot, get_policy_version, get_snapshot_arm_stats,
+                                                   get_snapshot_bandit)
+from maybee_backend.simulations.simulation_environment import add_simulation_environment
+
+
+@pytest.mark.parametrize("bandit_type", list(EnvironmentBanditConfig))
+def test_policy_snapshot_round_trip(session: Session, bandit_type):
+    environment = add_simulation_environment(session=session, n_arms=3, n_observations=200, bandit_type=bandit_type)
+    arm_stats = get_arm_stats(session=session, environment_id=environment.environment_id)
+    snapshot = get_policy_snapshot(environment.environment_id, bandit_type, arm_stats)
+    assert sum(snapshot.probabilities) == pytest.approx(1.0)
+
+    # the client gets the snapshot as json, and chooses from the same arm stats
+    client_snapshot = PolicySnapshot.model_validate_json(snapshot.model_dump_json())
+    client_arm_stats = get_snapshot_arm_stats(client_snapshot)
+    for name in ("arm_ids", "n_observations", "avg_rewards", "sum_squared_rewards", "decay_epochs",
+                 "discounted_n_observations", "discounted_rewards", "window_bucket_numbers",
+                 "window_n_observations", "window_rewards"):
+        np.testing.assert_array_equal(getattr(client_arm_stats, name), getattr(arm_stats, name))
+    assert get_policy_version(client_snapshot.bandit_type, client_arm_stats) == snapshot.version
+    _, arm_indexes = get_snapshot_bandit(client_snapshot).choose_arm_indexes(client_arm_stats, 10)
+    assert all(0 <= arm_index < 3 for arm_index in arm_indexes)
+
+
+def test_policy_version_changes_with_arm_stats(session: Session):
+    environment = add_simulation_environment(session=session, n_arms=3, n_observations=10)
+    arm_stats = get_arm_stats(session=session, environment_id=environment.environment_id)
+    version = get_policy_version(environment.bandit_type, arm_stats)
+    assert get_policy_version(environment.bandit_type, arm_stats) == version
+    assert get_policy_version(EnvironmentBanditConfig.UCB1, arm_stats) != version
+
+    arm_stats.n_observations[0] += 1
+    assert get_policy_version(environment.bandit_type, arm_stats) != version
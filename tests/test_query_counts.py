@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Regression tests bounding the number of sql statements of the hot endpoints, on cold caches.
+Raise a bound only for a reason, the failure lists the statements that ran.
+"""
+import pytest
+from fastapi.testclient import TestClient
+
+from tests.statics import TEST_USER_USERNAME, TEST_USER_PASSWORD, TEST_ENVIRONMENT_ID, TEST_ARM_ID
+from tests.endpoints.test_core_api_functionality import get_auth_token
+
+observations = [
+    {"environment_id": TEST_ENVIRONMENT_ID, "action_id": 1, "arm_id": TEST_ARM_ID, "reward": 1.0,
+     "event_datetime": "2024-01-01T00:00:00"}
+] * 10
+action_reports = [{"arm_id": TEST_ARM_ID, "bandit_state": "exploit", "policy_version": "v1", "reward": 1.0}] * 10
+
+endpoints = [
+    # the user, the environment access and the arm stats are loaded into the caches, then the action inserted
+    pytest.param("POST", "/actions", {}, None, 5, id="act"),
+    pytest.param("POST", "/actions/batch", {"n": 100}, None, 5, id="act_in_batch"),
+    # the arms of observations are checked against the arm stats, loaded into the cache too
+    pytest.param("POST", "/observations/", {"action_id": 1, "arm_id": TEST_ARM_ID, "reward": 1.0}, None, 6,
+                 id="create_observation"),
+    pytest.param("POST", "/observations/batch/", {}, observations, 6, id="create_observations"),
+    pytest.param("POST", "/observations/batch/", {"response_mode": "full"}, observations, 6,
+                 id="create_observations_full"),
+    pytest.param("POST", "/actions/reports", {}, action_reports, 6, id="report_actions"),
+    pytest.param("GET", "/policy", {}, None, 4, id="get_policy_snapshot"),
+    pytest.param("GET", "/actions", {}, None, 3, id="get_actions"),
+    pytest.param("GET", "/observations", {}, None, 3, id="get_observations"),
+    pytest.param("GET", "/arms/average_rewards/", {}, None, 3, id="get_average_rewards_per_arm"),
+]
+
+
+@pytest.mark.usefixtures("user", "environment", "userenvironmentlink", "arm", "avgrewardsperarm")
+@pytest.mark.parametrize("method, path, params, body, n_queries", endpoints)
+def test_endpoint_query_count(client: TestClient, max_queries, method, path, params, body, n_queries):
+    token = get_auth_token(
+        client=client, username=TEST_USER_USERNAME, password=TEST_USER_PASSWORD
+    )
+    with max_queries(n_queries):
+        response = client.request(
+            method,
+            f"/environments/{TEST_ENVIRONMENT_ID}{path}",
+            params=params,
+            json=body,
+            headers={"Authorization": f"Bearer {token}"},
+        )
+    assert response.status_code == 200, response.text
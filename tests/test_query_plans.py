@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Regression tests asserting that the hot lookups are served by an index.
+The postgres variants run when TEST_POSTGRES_DB_URI points at a scratch database.
+"""
+import datetime
+import os
+import pytest
+from sqlalchemy import text
+from sqlmodel import SQLModel, Session, create_engine, select
+
+from maybee_backend.api.export import get_action_export_sql, get_observation_export_sql
+from maybee_backend.api.pagination import encode_cursor, get_keyset_sql
+from maybee_backend.api.routes import get_environment_access_sql
+from maybee_backend.api.sorting_mode import SortingMode
+from maybee_backend.models.core_models import Action, AvgRewardsPerArm, Observation
+from maybee_backend.models.user_models import UserEnvironmentLink
+from tests.statics import TEST_ENVIRONMENT_ID, TEST_ARM_ID, TEST_USER_ID
+
+postgres_db_uri = os.getenv("TEST_POSTGRES_DB_URI", None)
+
+hot_queries = [
+    pytest.param(
+        select(AvgRewardsPerArm).where(AvgRewardsPerArm.environment_id == TEST_ENVIRONMENT_ID),
+        "ix_avgrewardsperarm_environment_id_arm_id",
+        id="choose_arm",
+    ),
+    pytest.param(
+        select(AvgRewardsPerArm)
+        .where(AvgRewardsPerArm.environment_id == TEST_ENVIRONMENT_ID)
+        .where(AvgRewardsPerArm.arm_id == TEST_ARM_ID),
+        "ix_avgrewardsperarm_environment_id_arm_id",
+        id="update_average_rewards_per_arm",
+    ),
+    pytest.param(
+        select(Observation)
+        .where(Observation.environment_id == TEST_ENVIRONMENT_ID)
+        .order_by(Observation.event_datetime.desc())
+        .limit(100),
+        "ix_observation_environment_id_event_datetime_observation_id",
+        id="get_observations",
+    ),
+    pytest.param(
+        get_keyset_sql(
+            select(Observation).where(Observation.environment_id == TEST_ENVIRONMENT_ID),
+            Observation.event_datetime,
+            Observation.observation_id,
+            SortingMode.EARLIEST,
+            encode_cursor(datetime.datetime(2024, 1, 1), 100),
+        ).limit(100),
+        "ix_observation_environment_id_event_datetime_observation_id",
+        id="get_observations_page",
+    ),
+    pytest.param(
+        get_observation_export_sql(TEST_ENVIRONMENT_ID),
+        "ix_observation_environment_id_event_datetime_observation_id",
+        id="export_observations",
+    ),
+    pytest.param(
+        select(Observation)
+        .where(Observation.environment_id == TEST_ENVIRONMENT_ID)
+        .where(Observation.arm_id == TEST_ARM_ID),
+        "ix_observation_environment_id_arm_id",
+        id="get_observations_per_arm",
+    ),
+    pytest.param(
+        select(Observation).where(Observation.action_id == 1),
+        "ix_observation_action_id",
+        id="offline_evaluation",
+    ),
+    pytest.param(
+        select(Action)
+        .where(Action.environment_id == TEST_ENVIRONMENT_ID)
+        .order_by(Action.event_datetime.asc())
+        .limit(100),
+        "ix_action_environment_id_event_datetime_action_id",
+        id="get_actions",
+    ),
+    pytest.param(
+        get_keyset_sql(
+            select(Action).where(Action.environment_id == TEST_ENVIRONMENT_ID),
+            Action.event_datetime,
+            Action.action_id,
+            SortingMode.LATEST,
+            encode_cursor(datetime.datetime(2024, 1, 1), 100),
+        ).limit(100),
+        "ix_action_environment_id_event_datetime_action_id",
+        id="get_actions_page",
+    ),
+    pytest.param(
+        get_action_export_sql(TEST_ENVIRONMENT_ID),
+        "ix_action_environment_id_event_datetime_action_id",
+        id="export_actions",
+    ),
+    pytest.param(
+        select(Action)
+        .where(Action.environment_id == TEST_ENVIRONMENT_ID)
+        .where(Action.arm_id == TEST_ARM_ID),
+        "ix_action_environment_id_arm_id",
+        id="get_actions_per_arm",
+    ),
+    pytest.param(
+        select(UserEnvironmentLink)
+        .where(UserEnvironmentLink.user_id == TEST_USER_ID)
+        .where(UserEnvironmentLink.environment_id == TEST_ENVIRONMENT_ID),
+        "ix_userenvironmentlink_user_id_environment_id",
+        id="user_environment_link",
+    ),
+    pytest.param(
+        get_environment_access_sql(user_id=TEST_USER_ID, environment_id=TEST_ENVIRONMENT_ID),
+        "ix_userenvironmentlink_user_id_environment_id",
+        id="environment_access",
+    ),
+]
+
+
+def get_query_plan(session: Session, sql, explain: str) -> str:
+    compiled_sql = sql.compile(
+        dialect=session.get_bind().dialect, compile_kwargs={"literal_binds": True}
+    )
+    rows = session.exec(text(f"{explain} {compiled_sql}")).all()
+    return "\n".join(str(row[-1]) for row in rows)
+
+
+@pytest.mark.parametrize("sql, index_name", hot_queries)
+def test_sqlite_query_uses_index(session: Session, sql, index_name):
+    query_plan = get_query_plan(session, sql, explain="EXPLAIN QUERY PLAN")
+    assert index_name in query_plan, query_plan
+
+
+@pytest.mark.skipif(postgres_db_uri is None, reason="TEST_POSTGRES_DB_URI is not set")
+@pytest.mark.parametrize("sql, index_name", hot_queries)
+def test_postgres_query_uses_index(sql, index_name):
+    engine = create_engine(postgres_db_uri)
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        # the test tables are empty, so the planner has to be steered away from
+        # the plans that only win on tiny tables (sequential scans and explicit sorts)
+        for setting in ["enable_seqscan", "enable_bitmapscan", "enable_sort"]:
+            session.exec(text(f"SET LOCAL {setting} = off"))
+        query_plan = get_query_plan(session, sql, explain="EXPLAIN")
+    engine.dispose()
+    assert index_name in query_plan, query_plan
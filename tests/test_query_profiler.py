@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import pytest
+from fastapi.testclient import TestClient
+from sqlmodel import Session, select
+
+from maybee_backend import metrics
+from maybee_backend.main import app
+from maybee_backend.models.core_models import Arm
+from maybee_backend.query_profiler import QueryProfilerMiddleware, get_statement_shape, profile_queries
+from tests.statics import TEST_USER_USERNAME, TEST_USER_PASSWORD, TEST_ENVIRONMENT_ID, TEST_ARM_ID
+from tests.endpoints.test_core_api_functionality import get_auth_token
+
+
+@pytest.mark.parametrize("statement, shape", [
+    ("SELECT a\n  FROM t WHERE id IN (?, ?, ?) LIMIT 10", "SELECT a FROM t WHERE id IN (...) LIMIT ?"),
+    ("INSERT INTO t (a, b) VALUES ($1, $2), ($3, $4) RETURNING id", "INSERT INTO t (a, b) VALUES (...) RETURNING id"),
+    ("SELECT a FROM t WHERE b = 'x' AND c IN (%(c_1_1)s, %(c_1_2)s)", "SELECT a FROM t WHERE b = ? AND c IN (...)"),
+])
+def test_statement_shape(statement, shape):
+    assert get_statement_shape(statement) == shape
+
+
+@pytest.mark.usefixtures("environment", "arm")
+def test_profile_flags_repeated_statements(session: Session):
+    with profile_queries() as profile:
+        for arm_id in (TEST_ARM_ID, TEST_ARM_ID + 1, TEST_ARM_ID + 2):
+            session.exec(select(Arm).where(Arm.arm_id == arm_id)).first()
+        session.exec(select(Arm).where(Arm.environment_id == TEST_ENVIRONMENT_ID)).all()
+    assert profile.n_queries == 4
+    assert all(query.duration > 0 for query in profile.queries)
+    [(shape, count)] = profile.get_repeated_shapes()
+    assert count == 3
+    assert "WHERE arm.arm_id = ?" in shape
+    assert "possible N+1, ran 3 times" in profile.summary()
+
+
+@pytest.mark.usefixtures("environment", "arm")
+def test_profile_and_metrics_count_the_same_queries(session: Session):
+    n_queries = metrics.db_queries_total.get()
+    with profile_queries() as profile:
+        session.exec(select(Arm).where(Arm.environment_id == TEST_ENVIRONMENT_ID)).all()
+    assert profile.n_queries == metrics.db_queries_total.get() - n_queries == 1
+
+
+@pytest.mark.usefixtures("user", "environment", "userenvironmentlink", "arm", "avgrewardsperarm")
+@pytest.mark.parametrize("profile_all", [False, True])
+def test_query_profiler_middleware(client: TestClient, profile_all):
+    profiled_client = TestClient(QueryProfilerMiddleware(app, profile_all=profile_all))
+    token = get_auth_token(
+        client=client, username=TEST_USER_USERNAME, password=TEST_USER_PASSWORD
+    )
+    headers = {"Authorization": f"Bearer {token}"}
+    response = profiled_client.post(f"/environments/{TEST_ENVIRONMENT_ID}/actions", headers=headers)
+    assert response.status_code == 200
+    assert ("X-Query-Count" in response.headers) == profile_all
+
+    response = profiled_client.post(
+        f"/environments/{TEST_ENVIRONMENT_ID}/actions", headers={**headers, "X-Query-Profile": "1"}
+    )
+    assert response.status_code == 200
+    # the environment is checked, and the action inserted, the rest is cached
+    assert response.headers["X-Query-Count"] == "2"
+    assert response.headers["X-Query-Repeated-Shapes"] == "0"
+    assert float(response.headers["X-Query-Duration-Ms"]) > 0
+    assert response.headers["Server-Timing"].startswith("db;dur=")
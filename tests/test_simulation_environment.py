@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import pytest
+from sqlalchemy import func
+from sqlmodel import Session, select
+
+from maybee_backend.bandits.get_bandit import get_bandit
+from maybee_backend.bandits.ucb1 import UCB1Bandit
+from maybee_backend.models.core_models import (
+    Action,
+    AvgRewardsPerArm,
+    EnvironmentBanditConfig,
+    Observation,
+    WindowedRewardsPerArm,
+    bandit_types_with_reward_windows,
+)
+from maybee_backend.models.get_average_rewards_per_arm import get_arm_stats
+from maybee_backend.simulations.simulation_environment import add_simulation_environment, simulate_pulls
+
+n_observations = 500
+
+
+@pytest.mark.parametrize("bandit_type", list(EnvironmentBanditConfig))
+def test_add_simulation_environment(session: Session, bandit_type):
+    environment = add_simulation_environment(
+        session=session, n_arms=3, n_observations=n_observations, bandit_type=bandit_type, batch_size=50
+    )
+    environment_id = environment.environment_id
+
+    n_actions = session.exec(select(func.count()).where(Action.environment_id == environment_id)).one()
+    assert n_actions == n_observations
+    sql = (
+        select(Observation.arm_id, func.count(), func.avg(Observation.reward))
+        .join(Action, Action.action_id == Observation.action_id)
+        .where(Observation.environment_id == environment_id)
+        .where(Action.arm_id == Observation.arm_id)
+        .group_by(Observation.arm_id)
+    )
+    observations_per_arm = {arm_id: (count, avg_reward) for arm_id, count, avg_reward in session.exec(sql)}
+    assert sum(count for count, _ in observations_per_arm.values()) == n_observations
+
+    avg_rewards_per_arms = session.exec(
+        select(AvgRewardsPerArm).where(AvgRewardsPerArm.environment_id == environment_id)
+    ).all()
+    # every arm has its stats row, also the ones that were never pulled
+    assert len(avg_rewards_per_arms) == 3
+    for avg_rewards_per_arm in avg_rewards_per_arms:
+        count, avg_reward = observations_per_arm.get(avg_rewards_per_arm.arm_id, (0, None))
+        assert avg_rewards_per_arm.n_observations == count
+        assert avg_rewards_per_arm.avg_reward == pytest.approx(avg_reward)
+
+    n_windowed_observations = session.exec(
+        select(func.coalesce(func.sum(WindowedRewardsPerArm.n_observations), 0))
+        .where(WindowedRewardsPerArm.environment_id == environment_id)
+    ).one()
+    expected_n_windowed_observations = n_observations if bandit_type in bandit_types_with_reward_windows else 0
+    assert n_windowed_observations == expected_n_windowed_observations
+
+    # the environment carries on from the simulated pulls
+    arm_stats = get_arm_stats(session=session, environment_id=environment_id)
+    assert arm_stats.n_observations.sum() == n_observations
+    _, arm_id = get_bandit(environment_id=environment_id, session=session).choose_arm()
+    assert arm_id in arm_stats.positions
+
+
+def test_add_simulation_environment_accepts_bandit_type_value(session: Session):
+    environment = add_simulation_environment(session=session, n_observations=10, bandit_type="softmax")
+    assert environment.bandit_type == EnvironmentBanditConfig.SOFTMAX
+
+
+@pytest.mark.parametrize("batch_size", [1, 100])
+def test_simulate_pulls_prefers_best_arm(session: Session, batch_size):
+    bandit = UCB1Bandit(session=session, environment_id=1)
+    pulls = simulate_pulls(
+        bandit=bandit,
+        arm_ids=[10, 20, 30],
+        population_p_success=[0.1, 0.9, 0.5],
+        n_pulls=2000,
+        batch_size=batch_size,
+    )
+    assert len(pulls) == len(pulls.bandit_states) == len(pulls.rewards) == 2000
+    assert pulls.arm_stats.n_observations.tolist() == [
+        int((pulls.arm_indexes == i).sum()) for i in range(3)
+    ]
+    assert pulls.arm_stats.n_observations.argmax() == 1
+    assert pulls.rewards.sum() == pytest.approx((pulls.arm_stats.avg_rewards * pulls.arm_stats.n_observations).sum())
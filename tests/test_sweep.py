@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import csv
+import pytest
+
+from maybee_backend.models.core_models import EnvironmentBanditConfig
+from maybee_backend.simulations.sweep import (
+    get_hyperparameter_grid,
+    get_sweep_runs,
+    main,
+    run_sweep,
+    sweep_columns,
+    write_sweep_results,
+)
+
+
+def test_get_hyperparameter_grid():
+    hyperparameter_values = {"tau": [0.05, 0.1], "epsilon": [0.1]}
+    assert get_hyperparameter_grid(EnvironmentBanditConfig.SOFTMAX, hyperparameter_values) == [
+        {"tau": 0.05}, {"tau": 0.1}
+    ]
+    assert get_hyperparameter_grid(EnvironmentBanditConfig.UCB1, hyperparameter_values) == [{}]
+    assert get_hyperparameter_grid(EnvironmentBanditConfig.EPSILON_GREEDY, {}) == [{}]
+
+
+def test_run_sweep_in_worker_processes():
+    runs = get_sweep_runs(
+        bandit_types=["epsilon_greedy", "thompson_sampling"],
+        hyperparameter_values={"epsilon": [0.05, 0.5]},
+        arm_configurations=[[0.2, 0.8]],
+        seeds=[0, 1],
+        n_pulls=1000,
+        batch_size=10,
+        n_points=5,
+    )
+    assert len(runs) == 6
+    rows = list(run_sweep(runs, max_workers=2))
+
+    def without_timings(rows):
+        return [{k: v for k, v in row.items() if k not in ("elapsed_seconds", "pulls_per_second")} for row in rows]
+
+    # seeded runs give the same curves in the pool as in process
+    assert without_timings(rows) == without_timings(run_sweep(runs, max_workers=1))
+    assert len(rows) == 6 * 5
+
+    curves = {}
+    for row in rows:
+        curves.setdefault((row["bandit_type"], row["epsilon"], row["seed"]), []).append(row)
+    for curve in curves.values():
+        assert [row["n_pulls"] for row in curve] == sorted(row["n_pulls"] for row in curve)
+        assert curve[-1]["n_pulls"] == 1000
+        regrets = [row["cumulative_regret"] for row in curve]
+        assert regrets == sorted(regrets)
+    # exploring half of the time costs 0.6 / 2 / 2 regret per pull
+    assert curves[("epsilon_greedy", 0.5, 0)][-1]["cumulative_regret"] == pytest.approx(150, rel=0.2)
+    assert curves[("epsilon_greedy", 0.05, 0)][-1]["cumulative_regret"] < 100
+
+
+def test_sweep_writes_csv(tmp_path):
+    output = str(tmp_path / "sweep.csv")
+    main([
+        "--bandit-types", "softmax", "ucb1",
+        "--tau", "0.1", "0.2",
+        "--arm-configurations", "[[0.1, 0.9]]",
+        "--seeds", "1",
+        "--n-pulls", "200",
+        "--batch-size", "10",
+        "--n-points", "4",
+        "--workers", "1",
+        "--output", output,
+    ])
+    with open(output) as f:
+        rows = list(csv.DictReader(f))
+    assert list(rows[0]) == sweep_columns
+    assert len(rows) == 3 * 4
+    assert {(row["bandit_type"], row["tau"]) for row in rows} == {("softmax", "0.1"), ("softmax", "0.2"), ("ucb1", "")}
+
+
+def test_sweep_writes_parquet(tmp_path):
+    pyarrow_parquet = pytest.importorskip("pyarrow.parquet")
+    runs = get_sweep_runs(["ucb1"], {}, [[0.1, 0.9]], seeds=[0], n_pulls=100, batch_size=10, n_points=2)
+    output = str(tmp_path / "sweep.parquet")
+    write_sweep_results(list(run_sweep(runs, max_workers=1)), output)
+    assert pyarrow_parquet.read_table(output).num_rows == 2